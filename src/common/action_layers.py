@@ -2,22 +2,32 @@ from common.user_interface import ActionLayer
 from common.asset_handler import AssetHandler
 from common.graphics import *
 from common.player import Player
-from common.containers import Matrix
+from common.containers import LRUCache, COLS
 
 ###################################################################################
 #                                PlayerLayer                                      #
 ###################################################################################
 
 class PlayerLayer(ActionLayer):
+  LAYOUTCACHE = 32
+
   def __init__(self, windowSize : tuple, player1 : Player, player2 : Player):
     super().__init__()
+    self._layouts = LRUCache(self.LAYOUTCACHE) # assets keyed by window size and player state
     self._build_assets(windowSize, player1, player2)
     self._build_events()
 
   def _build_assets(self, windowSize : tuple, player1 : Player, player2 : Player) -> None:
     """Build all environment assets"""
-    self._build_healthbars(windowSize, player1.get_health(), player2.get_health())
-    self._build_players(windowSize, player1, player2)
+    key = (windowSize, player1.get_asset_position(), player1.get_health(),
+           player2.get_asset_position(), player2.get_health())
+    assets = self._layouts.get(key)
+    if assets is None:
+      self._build_healthbars(windowSize, player1.get_health(), player2.get_health())
+      self._build_players(windowSize, player1, player2)
+      self._layouts.put(key, self._assets)
+    else:
+      self._assets = assets
     # remember players in case of resize
     self._player1 = player1
     self._player2 = player2
@@ -29,12 +39,14 @@ class PlayerLayer(ActionLayer):
 
   def update(self, windowSize : tuple, player1 : Player, player2 : Player) -> None:
     """Rebuild all environment assets"""
-    self._assets.clear()
+    self.invalidate()
+    self._assets = []
     self._build_assets(windowSize, player1, player2)
   
   def resize(self, windowSize : tuple) -> None:
     """Resize all assets to fit window"""
-    self._assets.clear()
+    self.invalidate()
+    self._assets = []
     self._build_assets(windowSize, self._player1, self._player2)
 
   ###################################################################
@@ -122,8 +134,8 @@ class PlayerLayer(ActionLayer):
     # Flip player2
     AssetHandler.x_flip(p2Asset)
 
-    p1Asset.shapes.pop(0)
-    p2Asset.shapes.pop(0)
+    p1Asset.remove_shape(0)
+    p2Asset.remove_shape(0)
     self._assets.append(p1Asset)
     self._assets.append(p2Asset)
     
@@ -135,8 +147,9 @@ class PlayerLayer(ActionLayer):
 class StageLayer(ActionLayer):
   def __init__(self, windowSize : tuple):
     super().__init__()
-    self._highlights = Matrix([[False]*6]*3)
-    self._hits = Matrix([[False]*6]*3)
+    self._highlightMask = 0 # stage mask of highlighted panels
+    self._hitMask = 0 # stage mask of hit panels
+    self._builtState = None # (windowSize, highlightMask, hitMask) the panels were last built for
     self._build_assets(windowSize)
     self._build_events()
 
@@ -154,23 +167,32 @@ class StageLayer(ActionLayer):
     """Return panel matrix"""
     return self._panelMatrix
 
+  def animated(self) -> bool:
+    """Return true since combat advances every frame the stage is shown"""
+    return True
+
   def frame_update(self, windowSize : tuple) -> None:
     """Update frame dependent assets"""
+    state = (windowSize, self._highlightMask, self._hitMask)
+    if state == self._builtState:
+      return
+    self._builtState = state
+    self.invalidate()
     self._assets.clear()
     self._build_assets(windowSize)
 
-  def highlight(self, matrix : Matrix) -> None:
-    """Highlight panels in matrix"""
-    self._highlights = matrix
+  def highlight(self, mask : int) -> None:
+    """Highlight panels in a stage mask"""
+    self._highlightMask = mask
   
-  def hit(self, matrix : Matrix) -> None:
-    """Hit panels in matrix"""
-    self._hits = matrix
+  def hit(self, mask : int) -> None:
+    """Hit panels in a stage mask"""
+    self._hitMask = mask
   
   def clear_highlight(self) -> None:
     """Clear all active highlights"""
-    self._highlights.clear()
-    self._hits.clear()
+    self._highlightMask = 0
+    self._hitMask = 0
 
   ###################################################################
   #                        Stage Builders                           #
@@ -196,9 +218,10 @@ class StageLayer(ActionLayer):
         panel = AssetHandler.get_asset("panel")
 
         # Highlight panel
-        if self._highlights[row-3][col]:
+        bit = 1 << ((row-3)*COLS + col)
+        if self._highlightMask & bit:
           AssetHandler.color(panel, Colors.YELLOW, "base")
-        elif self._hits[row-3][col]:
+        elif self._hitMask & bit:
           AssetHandler.color(panel, Colors.PURPLE, "base")
         
         # Scale asset
@@ -1,6 +1,6 @@
 from common.user_interface import Environment, ActionMenu, Button
 from common.asset_handler import AssetHandler
-from common.chips import Chip, Folder
+from common.chips import Chip, ChipInstance, Folder
 from common.graphics import *
 from common.containers import Matrix
 from common.chip_library import ChipLibrary
@@ -14,6 +14,7 @@ class ChipMenu(ActionMenu):
   def __init__(self, windowSize : tuple, folder : Folder, confirmFunction):
     super().__init__()
     self._chipAssets = []
+    self._chipAssetCache = {} # Built chip assets keyed by chip, slot, and color
     self._confirm = confirmFunction
     self._folder = folder # Deck of chips to choose from
     self._selectChips = [] # The chips that the player can select from
@@ -35,6 +36,7 @@ class ChipMenu(ActionMenu):
 
   def _build_assets(self, windowSize : tuple) -> None:
     """Build all non-button assets"""
+    self._chipAssetCache.clear()
     self._build_frame(windowSize)
     self._build_screen()
   
@@ -77,6 +79,10 @@ class ChipMenu(ActionMenu):
     else:
       self._counter += 1
 
+  def animated(self) -> bool:
+    """Return true while the chosen chip order is being highlighted"""
+    return len(self._chipOrder) > 0 or super().animated()
+
   def get_assets(self) -> list:
      """Return environment assets"""
      assets = self._assets + self._chipAssets
@@ -88,6 +94,7 @@ class ChipMenu(ActionMenu):
 
   def _highlight(self, areaMatrix : Matrix, color : tuple = Colors.YELLOW) -> None:
     """Highlight panels designated in areaMatrix with a given color"""
+    self.invalidate()
     for row in range(len(areaMatrix)):
       for col in range(len(areaMatrix[row])):
         if areaMatrix[row][col]:
@@ -172,6 +179,7 @@ class ChipMenu(ActionMenu):
 
   def _build_chip_buttons(self) -> None:
     """Place buttons and their assets in each chip slot in the frame"""
+    self.invalidate()
     self._chipOrder.clear()
 
     slotIndices = self._frame.get_component("slot")
@@ -185,7 +193,8 @@ class ChipMenu(ActionMenu):
   
   def _refresh_chip_assets(self) -> None:
     """Refresh chip assets without changing chipOrder"""
-    self._chipAssets.clear()
+    previousAssets = self._chipAssets
+    self._chipAssets = []
     slotIndices = self._frame.get_component("slot")
     self._update_chip_selection(slotIndices)
     for i, slotIndex in enumerate(slotIndices):
@@ -193,6 +202,9 @@ class ChipMenu(ActionMenu):
         slotShape = self._frame.shapes[slotIndex]
         chip = self._selectChips[i]
         self._build_chip_asset(slotShape, chip)
+    # Cached chip assets are reused, so identical objects mean nothing changed
+    if list(map(id, previousAssets)) != list(map(id, self._chipAssets)):
+      self.invalidate()
 
   def _update_chip_selection(self, slotIndices : list) -> None:
     """Draw chips until there are enough select chips to fill chip slots"""
@@ -202,21 +214,25 @@ class ChipMenu(ActionMenu):
         chip = self._folder.draw()
       self._selectChips.append(chip)
 
-  def _build_chip_asset(self, slotShape : Shape, chip : Chip) -> None:
+  def _build_chip_asset(self, slotShape : Shape, chip : ChipInstance) -> None:
     """Fill a given slot with a given chips asset"""
     # Slot position and size
     x, y = AssetHandler.shape_position(slotShape)
     width, height = AssetHandler.get_size(slotShape)
 
-    # Load asset
-    chipAsset = chip.get_asset()
+    # Reuse asset if already built for this slot
+    key = (chip.id, x, y, width, height, self._chipColor)
+    if key not in self._chipAssetCache:
+      # Load asset
+      chipAsset = AssetHandler.copy(chip.get_asset())
 
-    # Position and scale asset
-    AssetHandler.position(chipAsset, x, y)
-    xScale, yScale = self._scale(chipAsset, width, height)
-    AssetHandler.scale(chipAsset, xScale, yScale)
-    AssetHandler.color(chipAsset, self._chipColor, "base")
-    self._chipAssets.append(chipAsset)
+      # Position and scale asset
+      AssetHandler.position(chipAsset, x, y)
+      xScale, yScale = self._scale(chipAsset, width, height)
+      AssetHandler.scale(chipAsset, xScale, yScale)
+      AssetHandler.color(chipAsset, self._chipColor, "base")
+      self._chipAssetCache[key] = chipAsset
+    self._chipAssets.append(self._chipAssetCache[key])
 
   def _build_chip_button(self, slotShape : Shape) -> Button:
     """Place a button on a given chip slot"""
@@ -328,6 +344,7 @@ class ChipMenu(ActionMenu):
     xScale, yScale = self._scale(squareAsset, width, height)
     squareAsset = AssetHandler.scale(squareAsset, xScale, yScale)
     self._assets.append(squareAsset)
+    self.invalidate()
 
 
 class FolderSelectMenu(ActionMenu):
@@ -337,6 +354,8 @@ class FolderSelectMenu(ActionMenu):
     self._close_function = close_function
     self._allChipsIndex = 0
     self._folder = folder
+    self._chipAssetCache = {} # Built chip assets keyed by chip and slot
+    self._builtState = None # menu state the current assets were built for
     self._saveLabel = Text(0, 0)
     self._build_events()
     self._build_assets(windowSize)
@@ -349,9 +368,17 @@ class FolderSelectMenu(ActionMenu):
     self._folder = folder
 
   def resize(self, windowSize : tuple) -> None:
+    self._chipAssetCache.clear()
+    self._builtState = None
     self.frame_update(windowSize)
 
   def frame_update(self, windowSize : tuple) -> None:
+    # Only rebuild when something shown in the menu has changed
+    state = (windowSize, tuple(self._folder), self._allChipsIndex, self._saveLabel)
+    if state == self._builtState:
+      return
+    self._builtState = state
+    self.invalidate()
     self._buttons = {}
     self._assets.clear()
     self._build_assets(windowSize)
@@ -420,9 +447,9 @@ class FolderSelectMenu(ActionMenu):
   def _build_select_buttons(self) -> None:
     for i in range(len(self._selectComponent)):
       chipIndex = self._allChipsIndex + i
-      if chipIndex >= len(ChipLibrary.allChips):
+      if chipIndex >= ChipLibrary.count():
         continue
-      chip = ChipLibrary.get_chip(chipIndex)
+      chip = ChipLibrary.get_definition(chipIndex)
       slot = self._frame.shapes[self._selectComponent[i]]
       self._build_chip_asset(chip, slot)
       button = self._build_button(slot)
@@ -430,7 +457,7 @@ class FolderSelectMenu(ActionMenu):
 
   def _build_folder_buttons(self) -> None:
     for i in range(len(self._folder)):
-      chip = ChipLibrary.get_chip(self._folder[i])
+      chip = ChipLibrary.get_definition(self._folder[i])
       slot = self._frame.shapes[self._folderComponent[i]]
       self._build_chip_asset(chip, slot)
       button = self._build_button(slot)
@@ -465,12 +492,16 @@ class FolderSelectMenu(ActionMenu):
     x, y = AssetHandler.shape_position(slot)
     width, height = AssetHandler.get_size(slot)
     
-    # load, position, scale
-    chipAsset = chip.get_asset()
-    xScale, yScale = self._scale(chipAsset, width-2, height-2)
-    AssetHandler.position(chipAsset, x+1, y+1)
-    AssetHandler.scale(chipAsset, xScale, yScale)
-    self._assets.append(chipAsset)
+    # reuse asset if already built for this slot
+    key = (chip.id, x, y, width, height)
+    if key not in self._chipAssetCache:
+      # load, position, scale
+      chipAsset = AssetHandler.copy(chip.get_asset())
+      xScale, yScale = self._scale(chipAsset, width-2, height-2)
+      AssetHandler.position(chipAsset, x+1, y+1)
+      AssetHandler.scale(chipAsset, xScale, yScale)
+      self._chipAssetCache[key] = chipAsset
+    self._assets.append(self._chipAssetCache[key])
 
   def _build_text(self, text : str, shape : Shape):
     xCenter, yCenter = AssetHandler.shape_center(shape)
@@ -503,7 +534,7 @@ class FolderSelectMenu(ActionMenu):
     self._allChipsIndex -= len(self._selectComponent)
   
   def _next(self):
-    if (self._allChipsIndex + len(self._selectComponent)) >= len(ChipLibrary.allChips):
+    if (self._allChipsIndex + len(self._selectComponent)) >= ChipLibrary.count():
       return
     self._allChipsIndex += len(self._selectComponent)
 
@@ -0,0 +1,306 @@
+import json, sys
+from time import perf_counter
+from common.file_handler import FileHandler
+from common.bundle import Bundle, bundle_name
+from common.json_data import child_keys
+from common.lod import add_lods, LODSCALES
+
+# Estimated pygame.draw.polygon cost in microseconds on a software surface
+POLYGONCOST = 0.5
+VERTEXCOST = 0.04
+ROWCOST = 0.035 # per pixel row filled
+ROWVERTEXCOST = 0.0027 # per pixel row filled per vertex
+
+TYPENAMES = {0 : "shape", 1 : "collage", 2 : "animation", 3 : "chip"}
+
+###################################################################
+#                       General Helpers                           #
+###################################################################
+
+def shape_bounds(vertices : list) -> list:
+  """Return x, y, width, and height of the box around vertices"""
+  xs = [point[0] for point in vertices]
+  ys = [point[1] for point in vertices]
+  return [min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)]
+
+def shape_cost(shape : dict) -> float:
+  """Estimate the time to draw a compiled shape in microseconds"""
+  vertexCount = len(shape["vertices"])
+  height = shape["bounds"][3]
+  rowCost = ROWCOST + ROWVERTEXCOST * vertexCount
+  return POLYGONCOST + VERTEXCOST * vertexCount + height * rowCost
+
+def drawn_shapes(compiled : dict) -> list:
+  """Return the shapes drawn in one frame of a compiled object"""
+  if compiled["type"] == 0:
+    return [compiled]
+  elif compiled["type"] == 1:
+    return [compiled[key] for key in child_keys(compiled)]
+  elif compiled["type"] == 2:
+    frames = [drawn_shapes(compiled[key]) for key in child_keys(compiled)]
+    return max(frames, key=lambda shapes: sum(shape_cost(shape) for shape in shapes), default=[])
+  elif compiled["type"] == 3 and "0" in compiled:
+    return drawn_shapes(compiled["0"])
+  return []
+
+def lod_polygons(compiled : dict) -> list:
+  """Return the polygons drawn in one frame of a compiled object at each LOD scale"""
+  if compiled["type"] == 3:
+    return lod_polygons(compiled["0"]) if "0" in compiled else []
+  if compiled["type"] != 1:
+    return []
+  counts = []
+  polygons = len(child_keys(compiled))
+  lods = dict((scale, lod) for scale, lod in compiled.get("lods", []))
+  for scale in LODSCALES:
+    if scale in lods:
+      polygons = len(child_keys(lods[scale]))
+    counts.append(polygons)
+  return counts
+
+def all_shapes(compiled : dict) -> list:
+  """Return every shape stored in a compiled object"""
+  if compiled["type"] == 0:
+    return [compiled]
+  elif compiled["type"] == 3:
+    return all_shapes(compiled["0"]) if "0" in compiled else []
+  shapes = []
+  for key in child_keys(compiled):
+    shapes += all_shapes(compiled[key])
+  return shapes
+
+###################################################################
+#                        AssetCompiler                            #
+###################################################################
+
+class AssetCompiler:
+  def __init__(self, lods : bool = True):
+    self._lods = lods
+    self.errors = []
+    self.warnings = []
+    self.stats = [] # (fileName, id, type, polygons, vertices, drawn polygons, estimated cost, LOD polygons)
+
+  def compile_file(self, fileName : str) -> dict:
+    """Validate and normalise a packaged json file, return compiled objects by key"""
+    filePath = FileHandler.get_packaged_files_path(fileName)
+    with open(filePath, "r") as file:
+      data = json.load(file)
+    compiled = {}
+    for index, key in enumerate(data.keys()):
+      path = fileName + ":" + key
+      objDict = data[key]
+      if not self._check_object(objDict, path):
+        continue
+      if objDict["type"] == 3:
+        if key != str(index) or objDict["id"] != index:
+          self._error(path, "chips must be keyed and numbered 0, 1, 2, ... in order")
+      elif key != objDict["id"]:
+        self._error(path, "key does not match id " + repr(objDict["id"]))
+      compiled[key] = self._compile_object(objDict, path)
+      if self._lods:
+        add_lods(compiled[key])
+      self._record(fileName, key, compiled[key])
+    return compiled
+
+  def write(self, fileName : str, compiled : dict) -> str:
+    """Write compiled objects as the bundle loaded in place of a json file"""
+    bundleName = bundle_name(fileName)
+    Bundle.write(bundleName, compiled)
+    return bundleName
+
+  def report(self) -> str:
+    """Return a table of polygon counts and estimated draw cost per asset"""
+    lodHeader = "lods " + "/".join(str(scale) for scale in LODSCALES)
+    report = "{:<14}{:<12}{:<10}{:>9}{:>10}{:>9}{:>11}  {}\n".format("file", "id", "type", "polygons", "vertices", "drawn", "cost (us)", lodHeader)
+    totalCost = 0
+    for fileName, id, typeName, polygons, vertices, drawn, cost, lods in self.stats:
+      lodCounts = "/".join(str(count) for count in lods) or "-"
+      report += "{:<14}{:<12}{:<10}{:>9}{:>10}{:>9}{:>11.1f}  {}\n".format(fileName, id, typeName, polygons, vertices, drawn, cost, lodCounts)
+      totalCost += cost
+    report += "{} objects, {} errors, {} warnings, {:.1f} us if all drawn once\n".format(len(self.stats), len(self.errors), len(self.warnings), totalCost)
+    for message in self.errors:
+      report += "error: " + message + "\n"
+    for message in self.warnings:
+      report += "warning: " + message + "\n"
+    return report
+
+  def measure(self, compiledFiles : dict, repeats : int = 200) -> str:
+    """Time drawing each object with pygame at its authored size"""
+    import pygame
+    report = "{:<14}{:<12}{:>11}{:>15}\n".format("file", "id", "cost (us)", "measured (us)")
+    for fileName, id, typeName, polygons, vertices, drawn, cost, lods in self.stats:
+      shapes = drawn_shapes(compiledFiles[fileName][id])
+      xMax = max([shape["bounds"][0] + shape["bounds"][2] for shape in shapes], default=0)
+      yMax = max([shape["bounds"][1] + shape["bounds"][3] for shape in shapes], default=0)
+      surface = pygame.Surface((xMax + 1, yMax + 1))
+      start = perf_counter()
+      for i in range(repeats):
+        for shape in shapes:
+          if len(shape["vertices"]) < 3:
+            continue
+          pygame.draw.polygon(surface, shape["color"], shape["vertices"], shape["width"])
+      measured = (perf_counter() - start) / repeats * 1000000
+      report += "{:<14}{:<12}{:>11.1f}{:>15.1f}\n".format(fileName, id, cost, measured)
+    return report
+
+  ###################################################################
+  #                          Compilers                              #
+  ###################################################################
+
+  def _compile_object(self, objDict : dict, path : str) -> dict:
+    """Compile an object of any type"""
+    if objDict["type"] == 0:
+      return self._compile_shape(objDict, path)
+    elif objDict["type"] == 1:
+      return self._compile_collage(objDict, path)
+    elif objDict["type"] == 2:
+      return self._compile_animation(objDict, path)
+    return self._compile_chip(objDict, path)
+
+  def _compile_shape(self, objDict : dict, path : str) -> dict:
+    """Round vertices to integers and add the shape bounds"""
+    vertices = []
+    for point in objDict.get("vertices", []):
+      if len(point) != 2 or not all(isinstance(value, (int, float)) for value in point):
+        self._error(path, "vertex " + repr(point) + " is not an x, y pair")
+        continue
+      rounded = [int(round(point[0])), int(round(point[1]))]
+      if rounded != point:
+        self._warning(path, "vertex " + repr(point) + " rounded to " + repr(rounded))
+      vertices.append(rounded)
+    if len(vertices) == 0:
+      self._error(path, "shape has no vertices")
+      vertices = [[0, 0]]
+    elif len(vertices) < 3:
+      self._warning(path, "shape has fewer than 3 vertices and will fail to draw")
+
+    color = objDict.get("color")
+    if not isinstance(color, list) or len(color) not in (3, 4) or not all(isinstance(value, int) and 0 <= value <= 255 for value in color):
+      self._error(path, "color " + repr(color) + " is not an RGB list of 0-255 integers")
+      color = [0, 0, 0]
+
+    width = objDict.get("width")
+    if not isinstance(width, int) or width < 0:
+      self._error(path, "width " + repr(width) + " is not a positive integer")
+      width = 0
+
+    shape = {
+      "type" : 0,
+      "id" : objDict.get("id"),
+      "vertices" : vertices,
+      "color" : color,
+      "width" : width,
+      "bounds" : shape_bounds(vertices)
+    }
+    return shape
+
+  def _compile_collage(self, objDict : dict, path : str) -> dict:
+    """Compile collage shapes and add an index of component shapes"""
+    collage = {"type" : 1, "id" : objDict["id"]}
+    components = {}
+    index = 0
+    for key in child_keys(objDict):
+      shapePath = path + "/" + key
+      if not self._check_object(objDict[key], shapePath):
+        continue
+      if objDict[key]["type"] != 0:
+        self._error(shapePath, "collages can only hold shapes")
+        continue
+      shape = self._compile_shape(objDict[key], shapePath)
+      collage[str(index)] = shape
+      components.setdefault(shape["id"], []).append(index)
+      index += 1
+    if index == 0:
+      self._error(path, "collage has no shapes")
+    if "base" not in components:
+      self._warning(path, "collage has no base component, so it cannot be sized or flipped")
+    collage["components"] = components
+    return collage
+
+  def _compile_animation(self, objDict : dict, path : str) -> dict:
+    """Compile animation frames"""
+    animation = {"type" : 2, "id" : objDict["id"]}
+    index = 0
+    for key in child_keys(objDict):
+      framePath = path + "/" + key
+      if not self._check_object(objDict[key], framePath):
+        continue
+      if objDict[key]["type"] not in (0, 1):
+        # json_to_animation prints "invalid frame detected" and drops every later frame
+        self._error(framePath, "animation frames must be shapes or collages")
+        continue
+      animation[str(index)] = self._compile_object(objDict[key], framePath)
+      index += 1
+    if index == 0:
+      self._error(path, "animation has no frames")
+    return animation
+
+  def _compile_chip(self, objDict : dict, path : str) -> dict:
+    """Compile chip asset and check its area matrix"""
+    chip = {"type" : 3, "id" : objDict["id"]}
+    assetDict = objDict.get("0")
+    if self._check_object(assetDict, path + "/0"):
+      if assetDict["type"] == 3:
+        self._error(path + "/0", "chip asset cannot be a chip")
+      else:
+        chip["0"] = self._compile_object(assetDict, path + "/0")
+    matrixDict = objDict.get("1")
+    expected = [str(row) + ", " + str(col) for row in range(3) for col in range(3)]
+    if not isinstance(matrixDict, dict) or list(matrixDict.keys()) != expected:
+      self._error(path + "/1", "area matrix must have keys " + ", ".join(repr(key) for key in expected) + " in order")
+    elif not all(isinstance(value, bool) for value in matrixDict.values()):
+      self._error(path + "/1", "area matrix values must be true or false")
+    else:
+      chip["1"] = matrixDict
+      if not any(matrixDict.values()):
+        self._warning(path + "/1", "chip hits no panels")
+    return chip
+
+  ###################################################################
+  #                           Helpers                               #
+  ###################################################################
+
+  def _check_object(self, objDict, path : str) -> bool:
+    """Return true if an object has a known type and an id"""
+    if not isinstance(objDict, dict):
+      self._error(path, "expected an object")
+      return False
+    if objDict.get("type") not in TYPENAMES:
+      self._error(path, "unknown type " + repr(objDict.get("type")))
+      return False
+    if "id" not in objDict:
+      self._error(path, "missing id")
+      return False
+    return True
+
+  def _record(self, fileName : str, key : str, compiled : dict) -> None:
+    """Record statistics of a compiled top level object"""
+    shapes = all_shapes(compiled)
+    drawn = drawn_shapes(compiled)
+    vertices = sum(len(shape["vertices"]) for shape in shapes)
+    cost = sum(shape_cost(shape) for shape in drawn)
+    self.stats.append((fileName, key, TYPENAMES[compiled["type"]], len(shapes), vertices, len(drawn), cost, lod_polygons(compiled)))
+
+  def _error(self, path : str, message : str) -> None:
+    self.errors.append(path + ": " + message)
+
+  def _warning(self, path : str, message : str) -> None:
+    self.warnings.append(path + ": " + message)
+
+
+if __name__ == "__main__":
+  # python -m common.asset_compiler [--check] [--measure] [--no-lods] [assets.json chips.json ...]
+  options = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+  fileNames = [arg for arg in sys.argv[1:] if not arg.startswith("--")] or ["assets.json", "chips.json"]
+  compiler = AssetCompiler("--no-lods" not in options)
+  compiledFiles = {}
+  for fileName in fileNames:
+    compiledFiles[fileName] = compiler.compile_file(fileName)
+  print(compiler.report(), end="")
+  if "--measure" in options:
+    print(compiler.measure(compiledFiles), end="")
+  if len(compiler.errors) > 0:
+    sys.exit(1)
+  if "--check" not in options:
+    for fileName in fileNames:
+      print(fileName, "->", compiler.write(fileName, compiledFiles[fileName]))
@@ -1,18 +1,16 @@
-from copy import deepcopy as deep_copy
+from threading import Lock
 from common.json_handler import JsonHandler
 from common.graphics import *
 
+DATALOCK = Lock() # assets may be loaded from the loading thread
+
 ###################################################################
 #                      General Helpers                            #
 ###################################################################
 
-def load_all_assets() -> dict:
-  """Convert json file to objects in dict"""
-  assets = JsonHandler.convert_data("assets.json")
-  assetDict = {}
-  for asset in assets:
-    assetDict[asset.id] = asset
-  return assetDict
+def load_asset(id : str):
+  """Convert a single asset in json file to its object"""
+  return JsonHandler.convert_object(AssetHandler.load_data()[id])
 
 def ref_point(frame : Asset) -> tuple:
   """Find the reference point of an asset"""
@@ -27,17 +25,7 @@ def ref_point(frame : Asset) -> tuple:
 
 def shape_size(asset : Shape) -> tuple:
   """Find the size of an asset"""
-  xMin, yMin = [1000000] * 2
-  xMax, yMax = [-1] * 2
-  for point in asset.vertices:
-    if point[0] < xMin:
-      xMin = point[0]
-    if point[0] > xMax:
-      xMax = point[0]
-    if point[1] < yMin:
-      yMin = point[1]
-    if point[1] > yMax:
-      yMax = point[1]
+  xMin, yMin, xMax, yMax = asset.get_bounds()
   return (xMax - xMin), (yMax - yMin)
 
 def animation_size(asset : Animation) -> tuple:
@@ -51,6 +39,27 @@ def animation_size(asset : Animation) -> tuple:
       heightMax = height
   return widthMax, heightMax
 
+###################################################################
+#                         Copy Helpers                            #
+###################################################################
+
+def copy_collage(asset : Collage) -> Collage:
+  """Copy a Collage, sharing its shapes and component index"""
+  collage = Collage(list(asset.shapes), asset.id, asset.components())
+  collage.drawnScale = asset.drawnScale
+  for scale, lod in asset.lods:
+    collage.lods.append((scale, copy_collage(lod)))
+  return collage
+
+def copy_animation(asset : Animation) -> Animation:
+  """Copy an Animation and each of its frames"""
+  frames = []
+  for frame in asset.frames:
+    frames.append(AssetHandler.copy(frame))
+  animation = Animation(frames, asset.id)
+  animation.activeFrame = asset.activeFrame
+  return animation
+
 ###################################################################
 #                        Color Helpers                            #
 ###################################################################
@@ -62,6 +71,8 @@ def color_collage(asset : Collage, color : tuple, id : str) -> None:
     shape = asset.shapes[shapeIndex]
     newShape = AssetHandler.color(shape, color, id)
     asset.update_shape(newShape, shapeIndex)
+  for scale, lod in asset.lods:
+    color_collage(lod, color, id)
 
 def color_animation(asset : Animation, color : tuple, id : str) -> None:
   """Color a given component of an Animation a given color"""
@@ -84,7 +95,13 @@ def position_shape(asset : Shape, x : int, y : int) -> Shape:
     yShift = point[1] - originPoint[1]
     newPoint = (x+xShift, y+yShift)
     vertices.append(newPoint)
-  asset = Shape(vertices, asset.color, asset.width, asset.id)
+  # Move bounds the same way as the vertices on them
+  bounds = None
+  if asset.bounds is not None:
+    xMin, yMin, xMax, yMax = asset.bounds
+    xOrigin, yOrigin = originPoint
+    bounds = (x+(xMin-xOrigin), y+(yMin-yOrigin), x+(xMax-xOrigin), y+(yMax-yOrigin))
+  asset = Shape(vertices, asset.color, asset.width, asset.id, bounds)
   return asset
 
 def position_collage(asset : Collage, x : int, y : int) -> None:
@@ -97,6 +114,8 @@ def position_collage(asset : Collage, x : int, y : int) -> None:
     newShape = AssetHandler.position(shape, x+xShift, y+yShift)
     asset.update_shape(newShape, index)
     index += 1
+  for scale, lod in asset.lods:
+    position_collage(lod, x, y)
 
 def position_animation(asset : Animation, x : int, y : int) -> None:
   """Position an Animation at x, y"""
@@ -123,7 +142,14 @@ def scale_shape(asset : Shape, xScale : float, yScale : float) -> Shape:
     yDist = point[1] - yOrigin
     newPoint = (xDist*xScale+xOrigin, yDist*yScale+yOrigin)
     vertices.append(newPoint)
-  asset = Shape(vertices, asset.color, asset.width, asset.id)
+  # Scale bounds the same way as the vertices on them, negative scales swap sides
+  bounds = None
+  if asset.bounds is not None:
+    xMin, yMin, xMax, yMax = asset.bounds
+    xs = sorted(((xMin-xOrigin)*xScale+xOrigin, (xMax-xOrigin)*xScale+xOrigin))
+    ys = sorted(((yMin-yOrigin)*yScale+yOrigin, (yMax-yOrigin)*yScale+yOrigin))
+    bounds = (xs[0], ys[0], xs[1], ys[1])
+  asset = Shape(vertices, asset.color, asset.width, asset.id, bounds)
   return asset
 
 def scale_collage(asset : Collage, xScale : float, yScale : float) -> None:
@@ -138,6 +164,11 @@ def scale_collage(asset : Collage, xScale : float, yScale : float) -> None:
     newShape = AssetHandler.scale(newShape, xScale, yScale)
     asset.update_shape(newShape, index)
     index += 1
+  asset.drawnScale *= max(abs(xScale), abs(yScale))
+  # Only the variant drawn at this scale is kept, the full collage is correct at any scale
+  asset.lods = [variant for variant in asset.lods if variant[0] >= asset.detail_scale()][-1:]
+  for scale, lod in asset.lods:
+    scale_collage(lod, xScale, yScale)
 
 def scale_animation(asset : Animation, xScale : float, yScale : float) -> None:
   """Scale an Animation by given factors"""
@@ -164,7 +195,11 @@ def x_flip_shape(asset : Shape, center : tuple) -> Shape:
     x = 2*xCenter - point[0]
     y = point[1]
     vertices.append((x, y))
-  shape = Shape(vertices, asset.color, asset.width, asset.id)
+  bounds = None
+  if asset.bounds is not None:
+    xMin, yMin, xMax, yMax = asset.bounds
+    bounds = (2*xCenter - xMax, yMin, 2*xCenter - xMin, yMax)
+  shape = Shape(vertices, asset.color, asset.width, asset.id, bounds)
   return shape
 
 def x_flip_collage(asset : Collage) -> None:
@@ -177,6 +212,8 @@ def x_flip_collage(asset : Collage) -> None:
     flipped_shape = x_flip_shape(shape, center)
     asset.update_shape(flipped_shape, index)
     index += 1
+  for scale, lod in asset.lods:
+    x_flip_collage(lod)
 
 def x_flip_animation(asset : Animation) -> None:
   """Reflect an Animation across the y-axis"""
@@ -191,16 +228,42 @@ def x_flip_animation(asset : Animation) -> None:
 ###################################################################
 
 class AssetHandler:
-  assets = load_all_assets()
+  assetData = None # parsed json or bundle, opened on first use
+  assets = {} # converted assets, filled on first use of each asset
   
   @staticmethod
   def get_asset(id : str):
     """Return a copy of a given asset"""
     try:
-      return deep_copy(AssetHandler.assets[id])
+      return AssetHandler.copy(AssetHandler.load(id))
     except(KeyError):
       print("Asset", id, "not found")
-      return deep_copy(AssetHandler.assets["unknown"])
+      return AssetHandler.copy(AssetHandler.load("unknown"))
+
+  @staticmethod
+  def load_data() -> dict:
+    """Return asset dictionaries by id, opening the assets file on first use"""
+    with DATALOCK:
+      if AssetHandler.assetData is None:
+        AssetHandler.assetData = JsonHandler.load_indexed("assets.json")
+    return AssetHandler.assetData
+
+  @staticmethod
+  def load(id : str):
+    """Return the shared asset with a given id, converting it on first use"""
+    if id not in AssetHandler.assets:
+      AssetHandler.assets[id] = load_asset(id)
+    return AssetHandler.assets[id]
+
+  @staticmethod
+  def copy(asset : Asset) -> Asset:
+    """Return a copy of an asset that is safe to transform"""
+    # Transforms replace shapes rather than modify them, so shapes can be shared
+    if isinstance(asset, Collage):
+      return copy_collage(asset)
+    elif isinstance(asset, Animation):
+      return copy_animation(asset)
+    return asset
 
   @staticmethod
   def scale(asset : Asset, xScale : float, yScale : float) -> Shape:
@@ -240,7 +303,7 @@ class AssetHandler:
   def color(asset : Asset, color : tuple, id : str) -> Shape:
     """Color an asset component a given color"""
     if isinstance(asset, Shape):
-      asset = Shape(asset.vertices, color, asset.width, asset.id)
+      asset = Shape(asset.vertices, color, asset.width, asset.id, asset.bounds)
     elif isinstance(asset, Collage):
       color_collage(asset, color, id)
     elif isinstance(asset, Animation):
@@ -261,12 +324,7 @@ class AssetHandler:
   @staticmethod
   def shape_position(shape : Shape) -> tuple:
     """Return the position of a given Shape"""
-    xMin, yMin = [1000000] * 2
-    for point in shape.vertices:
-      if point[0] < xMin:
-        xMin = point[0]
-      if point[1] < yMin:
-        yMin = point[1]
+    xMin, yMin, xMax, yMax = shape.get_bounds()
     return xMin, yMin
   
   @staticmethod
@@ -0,0 +1,215 @@
+import sys
+import json
+import time
+import hashlib
+import logging
+import numpy as np
+from multiprocessing import Pool, cpu_count
+from common.json_data import load_data
+from common.file_handler import FileHandler
+from common.containers import SIDECOLS
+from common.batch import BatchMatch, NumpyRandom, SPEEDS, SIDEPANELS
+
+logger = logging.getLogger(__name__)
+
+# Chip balance measured on batches of single rounds against the Bot. P1 plays one chip,
+# or one chip followed by another, at the Bot standing on a panel of its side, and the
+# hits landed are averaged over many rounds of the Bot's random mistakes. The Bot plays
+# no chips and stands still until chips hit, so its start position is where it dodges
+# from.
+#
+# Results are cached with a hash of each chip's area. Chips whose area changed, and
+# pairs holding one, are measured again; the rest are read from the cache.
+
+VARIANTS = ("fast", "standard", "slow") # names of the highlight frames in SPEEDS
+TRIALS = 200 # rounds per chip, variant and start position
+PAIRTRIALS = 180 # rounds per pair of chips, spread over the start positions
+STILL = 1 << 30 # idle cooldown keeping the Bot on its start panel while chips are highlighted
+HEALTH = 1000 # Bot health, more than any round can take
+CACHE = "chips.balance.json"
+
+def chip_hashes(chips : dict) -> dict:
+  """Return a hash of the area of each chip in chips.json by id"""
+  return {id : hashlib.sha1(json.dumps(chip["1"], sort_keys=True).encode()).hexdigest()[:16] for id, chip in chips.items()}
+
+def file_hash(fileName : str) -> str:
+  """Return the sha1 of a packaged file"""
+  with open(FileHandler.get_packaged_files_path(fileName), "rb") as file:
+    return hashlib.sha1(file.read()).hexdigest()
+
+###################################################################################
+#                                    Rounds                                       #
+###################################################################################
+
+def play_rounds(ids : np.ndarray, frames : np.ndarray, positions : np.ndarray, seed : tuple) -> np.ndarray:
+  """Play a round of each P1 chip order at the Bot standing on a side panel, return the hits landed in each"""
+  rows = np.arange(len(ids))
+  batch = BatchMatch(np.zeros((len(ids), 1), dtype=np.int32), NumpyRandom(seed), resetOnGameOver=False,
+                     movementCooldown=STILL)
+  batch.p2Row[:], batch.p2Col[:] = np.divmod(positions, SIDECOLS)
+  batch.p2Col[:] += SIDECOLS
+  batch.p2Health[:] = HEALTH
+  batch.confirm(rows, ids, frames)
+  batch.confirm_bot(rows, np.zeros((len(ids), 1), dtype=np.int32), np.zeros((len(ids), 1), dtype=np.int32))
+  ended = np.zeros(len(ids), dtype=bool)
+  while not ended.all():
+    batch.tick()
+    ended |= batch.roundOver
+  return HEALTH - batch.p2Health
+
+def measure_chip(task : tuple) -> tuple:
+  """Return a chip id and its mean hits by variant and start position"""
+  id, trials, seed = task
+  variants, positions = np.divmod(np.arange(len(VARIANTS) * SIDEPANELS * trials) // trials, SIDEPANELS)
+  ids = np.full((len(variants), 1), id, dtype=np.int32)
+  hits = play_rounds(ids, SPEEDS[variants][:, None], positions, (seed, 0, id))
+  return id, hits.reshape(len(VARIANTS), SIDEPANELS, trials).mean(axis=2)
+
+def measure_pairs(task : tuple) -> tuple:
+  """Return a chip id, a list of chips and the mean hits of standard orders of the first chip followed by each"""
+  first, followers, trials, seed = task
+  seconds = np.repeat(np.array(followers, dtype=np.int32), trials)
+  ids = np.stack((np.full(len(seconds), first, dtype=np.int32), seconds), axis=1)
+  frames = np.full(ids.shape, SPEEDS[VARIANTS.index("standard")], dtype=np.int32)
+  positions = np.arange(len(seconds)) % SIDEPANELS
+  hits = play_rounds(ids, frames, positions, (seed, 1, first))
+  return first, followers, hits.reshape(len(followers), trials).mean(axis=1)
+
+###################################################################################
+#                                   Analysis                                      #
+###################################################################################
+
+class BalanceCache:
+  """Mean hits of every chip and pair of chips, kept in a json file with the hashes they were measured for"""
+  def __init__(self, path : str, trials : int, pairTrials : int, seed : int):
+    self.path = path
+    self.settings = {"trials" : trials, "pairTrials" : pairTrials, "seed" : seed}
+    self.fileHash = None # chips.json measured
+    self.hashes = {} # area hash of each chip measured
+    self.single = {} # mean hits of each chip by variant and start position
+    self.pairs = {} # mean hits of each chip followed by each other chip
+    try:
+      with open(path) as file:
+        data = json.load(file)
+    except (OSError, ValueError):
+      return
+    if data.get("settings") != self.settings:
+      logger.info("%s was measured with other settings and is ignored", path)
+      return
+    self.fileHash = data["fileHash"]
+    self.hashes = data["hashes"]
+    self.single = {id : np.array(hits) for id, hits in data["single"].items()}
+    self.pairs = data["pairs"]
+
+  def write(self) -> None:
+    data = {"settings" : self.settings, "fileHash" : self.fileHash, "hashes" : self.hashes,
+            "single" : {id : hits.round(4).tolist() for id, hits in self.single.items()}, "pairs" : self.pairs}
+    with open(self.path, "w") as file:
+      json.dump(data, file)
+
+
+def analyze(path : str = None, trials : int = TRIALS, pairTrials : int = PAIRTRIALS, seed : int = 0,
+            workers : int = 1) -> BalanceCache:
+  """Measure every chip and pair of chips not already in a cache for the current chips.json, return the cache"""
+  if path is None:
+    path = FileHandler.get_user_cache_path(CACHE)
+  cache = BalanceCache(path, trials, pairTrials, seed)
+  fileHash = file_hash("chips.json")
+  if cache.fileHash == fileHash:
+    return cache
+  hashes = chip_hashes(load_data("chips.json"))
+  changed = set(id for id in hashes if cache.hashes.get(id) != hashes[id] or id not in cache.single)
+  ids = sorted(hashes, key=int)
+  singleTasks = [(int(id), trials, seed) for id in ids if id in changed]
+  pairTasks = []
+  for first in ids:
+    followers = [id for id in ids if first in changed or id in changed]
+    if len(followers) > 0:
+      pairTasks.append((int(first), [int(id) for id in followers], pairTrials, seed))
+  logger.info("%d of %d chips changed, measuring %d chips and %d pairs on %d processes", len(changed), len(ids),
+              len(singleTasks), sum(len(task[1]) for task in pairTasks), workers)
+  start = time.perf_counter()
+  with Pool(workers) as pool:
+    for id, hits in pool.imap_unordered(measure_chip, singleTasks):
+      cache.single[str(id)] = hits
+    for first, followers, hits in pool.imap_unordered(measure_pairs, pairTasks):
+      row = cache.pairs.setdefault(str(first), {})
+      for second, mean in zip(followers, hits):
+        row[str(second)] = round(float(mean), 4)
+  logger.info("measured in %.1f s", time.perf_counter() - start)
+  # Chips no longer in chips.json are dropped
+  cache.single = {id : cache.single[id] for id in ids}
+  cache.pairs = {first : {second : cache.pairs[first][second] for second in ids} for first in ids}
+  cache.hashes = hashes
+  cache.fileHash = fileHash
+  cache.write()
+  return cache
+
+###################################################################################
+#                                    Report                                       #
+###################################################################################
+
+def position_name(position : int) -> str:
+  """Return the stage row and column of a panel of the Bot's side"""
+  row, col = divmod(position, SIDECOLS)
+  return "(%d, %d)" % (row, col + SIDECOLS)
+
+def synergies(cache : BalanceCache) -> dict:
+  """Return the hits of each pair of chips beyond those of its chips played alone, by (first, second)"""
+  standard = {id : hits[VARIANTS.index("standard")].mean() for id, hits in cache.single.items()}
+  return {(first, second) : mean - standard[first] - standard[second]
+          for first, row in cache.pairs.items() for second, mean in row.items()}
+
+def report(cache : BalanceCache, lines : int = 10) -> str:
+  """Return mean hits of every chip by variant with its best and worst start panel, and the pairs most and least worth chaining"""
+  text = ["chip    fast standard    slow   standard from best and worst start"]
+  for id, hits in sorted(cache.single.items(), key=lambda item: -item[1][VARIANTS.index("standard")].mean()):
+    standard = hits[VARIANTS.index("standard")]
+    text.append("%4s %7.3f %8.3f %7.3f   %.3f %s  %.3f %s" % (id, *hits.mean(axis=1), standard.max(),
+                position_name(standard.argmax()), standard.min(), position_name(standard.argmin())))
+  pairs = sorted(synergies(cache).items(), key=lambda item: item[1])
+  for title, shown in (("chains adding the most hits", pairs[:-lines-1:-1]), ("chains losing the most hits", pairs[:lines])):
+    text.append("")
+    text.append("%s, beyond each chip alone" % title)
+    for (first, second), extra in shown:
+      text.append("%4s then %4s  %+.3f (%.3f)" % (first, second, extra, cache.pairs[first][second]))
+  return "\n".join(text)
+
+def chip_report(cache : BalanceCache, id : str, lines : int = 10) -> str:
+  """Return a chip's mean hits from each start panel by variant and the chips it chains with best and worst"""
+  text = []
+  for variant, hits in zip(VARIANTS, cache.single[id]):
+    text.append("%s: %.3f hits" % (variant, hits.mean()))
+    for row in hits.reshape(-1, SIDECOLS):
+      text.append("  " + " ".join("%6.3f" % hit for hit in row))
+  pairs = synergies(cache)
+  for title, key in (("followed by", lambda other: (id, other)), ("following", lambda other: (other, id))):
+    shown = sorted(cache.single, key=lambda other: pairs[key(other)])
+    text.append("")
+    text.append("%s, hits beyond each chip alone: best %s" % (title, ", ".join(
+                "%s %+.3f" % (other, pairs[key(other)]) for other in shown[:-lines-1:-1])))
+    text.append("  worst %s" % ", ".join("%s %+.3f" % (other, pairs[key(other)]) for other in shown[:lines]))
+  return "\n".join(text)
+
+
+if __name__ == "__main__":
+  # python -m common.balance [--chip ID] [--cache PATH] [--trials N] [--pair-trials N] [--seed N] [--workers N] [--lines N]
+  from argparse import ArgumentParser
+  parser = ArgumentParser(description="Measure the hits every chip lands against the Bot, alone and chained")
+  parser.add_argument("--chip", help="id of a chip to report in detail")
+  parser.add_argument("--cache", default=None, help="json file measurements are kept in, %s in the user cache by default" % CACHE)
+  parser.add_argument("--trials", type=int, default=TRIALS, help="rounds per chip, variant and start panel")
+  parser.add_argument("--pair-trials", type=int, default=PAIRTRIALS, help="rounds per pair of chips")
+  parser.add_argument("--seed", type=int, default=0, help="seed of the Bot's mistakes")
+  parser.add_argument("--workers", type=int, default=cpu_count(), help="processes chips are measured on")
+  parser.add_argument("--lines", type=int, default=10, help="pairs of chips listed")
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+  cache = analyze(args.cache, args.trials, args.pair_trials, args.seed, args.workers)
+  if args.chip is None:
+    print(report(cache, args.lines))
+  elif args.chip not in cache.single:
+    parser.error("no chip %s" % args.chip)
+  else:
+    print(chip_report(cache, args.chip, args.lines))
+  sys.exit(0)
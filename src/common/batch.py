@@ -0,0 +1,593 @@
+import sys
+import time
+import random
+import numpy as np
+from common.combat import HITCOOLDOWN, SWITCH, P1COLUMNS, P2COLUMNS, P2START
+from common.containers import SPREAD, SIDECOLS, ROWS
+from common.player import Player
+
+# Many matches of P1 against the Bot stepped together, each field of every match
+# one entry of a NumPy array. A tick runs the same steps as Match.tick on the rows
+# each step applies to, so a batch of one plays exactly like a Match given the same
+# inputs and random numbers.
+#
+# The Bot plans its whole route when chips start hitting, but the next planned
+# position only depends on the last one and the masks hit at that tick and the
+# next, so routes are kept as the planned position and followed from a table.
+
+SPREADS = np.array(SPREAD, dtype=np.int32) # stage masks of the left side by side mask
+VECTORS = np.array([(1, 0), (-1, 0), (0, 1), (0, -1)], dtype=np.int16) # Bot idle and mistake moves
+SPEEDS = np.array([5, 10, 30], dtype=np.int32) # highlight frames of fast, standard and slow chips
+ERRORRATE = 5 # percent of Bot dodges that move at random
+MOVEMENTCOOLDOWN = 2 # ticks the Bot stands still between idle moves
+SIDEPANELS = ROWS * SIDECOLS
+NOWHERE = SIDEPANELS # planned position (0, 0), where the Bot plans to go when no step is safe
+
+def chip_masks() -> np.ndarray:
+  """Return the side mask of every chip by id"""
+  from common.headless import HeadlessChips
+  return np.array([chip.get_area_mask() for chip in HeadlessChips.load()], dtype=np.int32)
+
+def _plan_table() -> np.ndarray:
+  """Return the Bot's next planned position by planned position, mask hit now and mask hit next"""
+  # Same steps as Bot._plan_run: the first safe step nearest a panel safe next tick
+  masks = np.arange(1 << SIDEPANELS)
+  rows, cols = np.divmod(np.arange(SIDEPANELS), SIDECOLS)
+  distances = np.abs(rows[:, None] - rows[None, :]) + np.abs(cols[:, None] - cols[None, :])
+  safe = (masks[:, None] >> np.arange(SIDEPANELS)[None, :] & 1) == 0
+  # Distance from each panel to the nearest panel safe under each mask, 10 when none is
+  nearest = np.where(safe[:, None, :], distances[None, :, :], 10).min(axis=2)
+  table = np.full((SIDEPANELS + 1, 1 << SIDEPANELS, 1 << SIDEPANELS), NOWHERE, dtype=np.int8)
+  for position in range(SIDEPANELS):
+    row, col = divmod(position, SIDECOLS)
+    best = np.full((1 << SIDEPANELS, 1 << SIDEPANELS), NOWHERE, dtype=np.int8)
+    bestDistance = np.full((1 << SIDEPANELS, 1 << SIDEPANELS), 10)
+    for stepRow, stepCol in ((0, 0), (-1, 0), (0, -1), (1, 0), (0, 1)):
+      row2, col2 = row + stepRow, col + stepCol
+      if not (0 <= row2 < ROWS and 0 <= col2 < SIDECOLS):
+        continue
+      step = row2*SIDECOLS + col2
+      distance = nearest[:, step][None, :]
+      better = safe[:, step][:, None] & (distance < bestDistance)
+      best[better] = step
+      bestDistance = np.where(better, distance, bestDistance)
+    table[position] = best
+  return table
+
+PLANROWS = np.array([position // SIDECOLS for position in range(SIDEPANELS)] + [0], dtype=np.int16)
+PLANCOLS = np.array([position % SIDECOLS + SIDECOLS for position in range(SIDEPANELS)] + [0], dtype=np.int16)
+
+###################################################################################
+#                                 Random Numbers                                  #
+###################################################################################
+
+class NumpyRandom:
+  """Random numbers for many matches drawn at once, fast but unlike any Bot's"""
+  def __init__(self, seed : int = None):
+    self._generator = np.random.default_rng(seed)
+
+  def randint(self, low : int, high : int, rows : np.ndarray) -> np.ndarray:
+    """Return an int in [low, high] for each row"""
+    return self._generator.integers(low, high + 1, size=len(rows))
+
+
+class ScalarRandom:
+  """Random numbers drawn from one random.Random per match, the numbers a Bot with it would draw"""
+  def __init__(self, rngs : list):
+    self.rngs = rngs
+
+  def randint(self, low : int, high : int, rows : np.ndarray) -> np.ndarray:
+    """Return an int in [low, high] for each row"""
+    return np.array([self.rngs[row].randint(low, high) for row in rows], dtype=np.int64)
+
+###################################################################################
+#                                  Batch Match                                    #
+###################################################################################
+
+class BatchMatch:
+  """Matches of P1 against a Bot held as arrays and advanced a tick at a time together"""
+  _planTable = None # shared by every batch, built on first use
+  _chipMasks = None
+
+  def __init__(self, p2Folders : np.ndarray, rng, resetOnGameOver : bool = True, errorRate : int = ERRORRATE,
+               movementCooldown : int = MOVEMENTCOOLDOWN):
+    if BatchMatch._planTable is None:
+      BatchMatch._planTable = _plan_table()
+      BatchMatch._chipMasks = chip_masks()
+    self.size = len(p2Folders)
+    self._random = rng # NumpyRandom or ScalarRandom
+    self.resetOnGameOver = resetOnGameOver # start a new match in a row once one ends
+    self.errorRate = errorRate # percent of Bot dodges that move at random
+    self.movementCooldown = movementCooldown # ticks the Bot stands still between idle moves
+    self._p2Folders = np.array(p2Folders, dtype=np.int32) # Bot folders in the order matches start with
+    self.games = 0 # matches ended
+    self.p1Wins = 0
+    self.rounds = 0 # rounds of combat started
+    self.gameTicks = 0 # ticks played by ended matches
+    self._width = 0 # ticks held per row by chip order and timeline arrays
+    self._reset(np.arange(self.size))
+    self._fit(1)
+
+  def _reset(self, rows : np.ndarray) -> None:
+    """Put rows back to the start of a match"""
+    if not hasattr(self, "p1Row"):
+      size = self.size
+      for name in ("p1Row", "p1Col", "p2Row", "p2Col", "p1Health", "p2Health"):
+        setattr(self, name, np.zeros(size, dtype=np.int16))
+      for name in ("switchCounter", "chainIndex", "p1HitCounter", "p2HitCounter", "highlightMask", "hitMask",
+                   "p1Length", "p2Length", "timelineLength", "dodgeCounter", "frameCounter", "randomUses",
+                   "routeIndex", "planned", "ticks"):
+        setattr(self, name, np.zeros(size, dtype=np.int32))
+      for name in ("active", "p1Ready", "p2Ready", "highlight", "hit", "p1Hit", "p2Hit", "p1Vulnerable",
+                   "p2Vulnerable", "p1Zero", "p2Zero", "p1OnStage", "p2OnStage", "roundPlayed",
+                   "moved", "damaged", "roundOver", "gameOver", "ended"):
+        setattr(self, name, np.zeros(size, dtype=bool))
+      self.folders = self._p2Folders.copy()
+    self.p1Row[rows], self.p1Col[rows] = 1, 1
+    self.p2Row[rows], self.p2Col[rows] = P2START
+    self.p1Health[rows] = Player.MAXHEALTH
+    self.p2Health[rows] = Player.MAXHEALTH
+    for name in ("switchCounter", "chainIndex", "highlightMask", "hitMask", "p1Length", "p2Length",
+                 "timelineLength", "dodgeCounter", "frameCounter", "randomUses", "routeIndex", "planned", "ticks"):
+      getattr(self, name)[rows] = 0
+    self.p1HitCounter[rows] = HITCOOLDOWN
+    self.p2HitCounter[rows] = HITCOOLDOWN
+    for name in ("active", "p1Ready", "p2Ready", "hit", "p1Hit", "p2Hit", "p1Zero", "p2Zero",
+                 "p1OnStage", "p2OnStage", "roundPlayed", "gameOver"):
+      getattr(self, name)[rows] = False
+    for name in ("highlight", "p1Vulnerable", "p2Vulnerable"):
+      getattr(self, name)[rows] = True
+    self.folders[rows] = self._p2Folders[rows]
+    if self._width > 0:
+      for array in (self.p1Order, self.p2Order, self.p1Timeline, self.p2Timeline):
+        array[rows] = 0
+
+  def _fit(self, width : int) -> None:
+    """Widen chip order and timeline arrays to hold a number of ticks"""
+    if width <= self._width:
+      return
+    if self._width == 0:
+      for name in ("p1Order", "p2Order", "p1Timeline", "p2Timeline"):
+        setattr(self, name, np.zeros((self.size, width), dtype=np.int32))
+    else:
+      for name in ("p1Order", "p2Order", "p1Timeline", "p2Timeline"):
+        setattr(self, name, np.pad(getattr(self, name), ((0, 0), (0, width - self._width))))
+    self._width = width
+
+  ###################################################################
+  #                            Inputs                               #
+  ###################################################################
+
+  def confirm(self, rows : np.ndarray, ids : np.ndarray, frames : np.ndarray) -> None:
+    """Load P1 chip orders for the next round, chip ids and highlight frames by row with 0 frames for no chip"""
+    orders, lengths = self._compile(np.asarray(ids), np.asarray(frames))
+    self.p1Order[rows] = orders
+    self.p1Length[rows] = lengths
+    self.p1Ready[rows] = True
+    self.p1OnStage[rows] = True
+
+  def confirm_bot(self, rows : np.ndarray, ids : np.ndarray, frames : np.ndarray) -> None:
+    """Load Bot chip orders for the next round in place of the ones it would choose, laid out as in confirm"""
+    orders, lengths = self._compile(np.asarray(ids), np.asarray(frames))
+    self.p2Order[rows] = orders
+    self.p2Length[rows] = lengths
+    self.p2Ready[rows] = True
+    self.p2OnStage[rows] = True
+
+  def move(self, movements : np.ndarray) -> np.ndarray:
+    """Move P1 in every row by (row, col) movement vectors, return the rows that could move"""
+    movable = self.p1OnStage & ~self.gameOver
+    rows = np.flatnonzero(movable)
+    self.p1Row[rows], self.p1Col[rows] = self._step(self.p1Row[rows], self.p1Col[rows], movements[rows], P1COLUMNS)
+    return movable
+
+  def on_stage(self) -> np.ndarray:
+    """Return which rows have P1 on the stage, the others choose chips"""
+    return self.p1OnStage
+
+  ###################################################################
+  #                             Tick                                #
+  ###################################################################
+
+  def tick(self) -> None:
+    """Advance every match one tick, starting matches that ended over when resetting, marked in ended"""
+    self.moved[:] = False
+    self.damaged[:] = False
+    self.roundOver[:] = False
+    self.ended[:] = False
+    live = ~self.gameOver
+    self.ticks[live] += 1
+    choosing = np.flatnonzero(live & self.p1Ready & ~self.p2Ready)
+    if len(choosing) > 0:
+      self._select_chips(choosing)
+    fighting = live & self.p1Ready & self.p2Ready
+    rows = np.flatnonzero(fighting)
+    if len(rows) > 0:
+      self.moved[rows] = True
+      movements = self._bot_movement(rows)
+      self.p2Row[rows], self.p2Col[rows] = self._step(self.p2Row[rows], self.p2Col[rows], movements, P2COLUMNS)
+      self._initialize_combat(rows)
+      self._combat(rows)
+      self.roundPlayed[rows] = True
+      self._damage(rows)
+    rows = np.flatnonzero(live & ~fighting & self.roundPlayed)
+    self.roundPlayed[rows] = False
+    self.p1OnStage[rows] = False
+    self.p2OnStage[rows] = False
+    self.roundOver[rows] = True
+    if self.resetOnGameOver:
+      ended = np.flatnonzero(self.gameOver)
+      if len(ended) > 0:
+        self.games += len(ended)
+        self.p1Wins += int(np.count_nonzero(~self.p1Zero[ended]))
+        self.gameTicks += int(self.ticks[ended].sum())
+        self._reset(ended)
+        self.ended[ended] = True
+
+  def _step(self, rows : np.ndarray, cols : np.ndarray, movements : np.ndarray, colRange : tuple) -> tuple:
+    """Return positions moved by movement vectors, each coordinate kept if it would leave the player's side"""
+    newRows = rows + movements[:, 0]
+    newCols = cols + movements[:, 1]
+    colMin, colMax = colRange
+    newRows = np.where((newRows < 0) | (newRows > 2), rows, newRows)
+    newCols = np.where((newCols < colMin) | (newCols > colMax), cols, newCols)
+    return newRows, newCols
+
+  def _damage(self, rows : np.ndarray) -> None:
+    """Take health from players hit this tick and end matches a player lost"""
+    for hitFlag, health, zero in ((self.p1Hit, self.p1Health, self.p1Zero), (self.p2Hit, self.p2Health, self.p2Zero)):
+      hit = rows[hitFlag[rows]]
+      health[hit] -= 1
+      zero[hit[health[hit] <= 0]] = True
+      self.damaged[hit] = True
+      hitFlag[hit] = False
+    self.gameOver[rows] |= self.p1Zero[rows] | self.p2Zero[rows]
+
+  ###################################################################
+  #                            Combat                               #
+  ###################################################################
+
+  def _initialize_combat(self, rows : np.ndarray) -> None:
+    """Compile the timeline of rows starting a round, as CombatManager.initialize_combat"""
+    rows = rows[~self.active[rows]]
+    if len(rows) == 0:
+      return
+    self.rounds += len(rows)
+    # Each player's chips land on the other player's side
+    self.p1Timeline[rows] = self.p2Order[rows]
+    self.p2Timeline[rows] = self.p1Order[rows]
+    self.timelineLength[rows] = np.maximum(self.p1Length[rows], self.p2Length[rows])
+    self.chainIndex[rows] = 0
+    self.highlight[rows] = True
+    self.hit[rows] = False
+    self.p1Hit[rows] = False
+    self.p2Hit[rows] = False
+    self.p1Vulnerable[rows] = True
+    self.p2Vulnerable[rows] = True
+    self.active[rows] = True
+
+  def _combat(self, rows : np.ndarray) -> None:
+    """Highlight or hit the next tick of each row's timeline, as CombatManager.combat"""
+    highlighting = rows[self.highlight[rows]]
+    if len(highlighting) > 0:
+      self._highlight(highlighting)
+      self.chainIndex[highlighting] += 1
+    hitting = rows[self.hit[rows] & (self.switchCounter[rows] >= SWITCH)]
+    if len(hitting) > 0:
+      self._hit(hitting)
+      self.chainIndex[hitting] += 1
+    self.switchCounter[rows] += 1
+
+  def _stage_mask(self, rows : np.ndarray) -> np.ndarray:
+    """Return the stage masks of the timeline at each row's chain index"""
+    index = self.chainIndex[rows]
+    return SPREADS[self.p1Timeline[rows, index]] | SPREADS[self.p2Timeline[rows, index]] << SIDECOLS
+
+  def _highlight(self, rows : np.ndarray) -> None:
+    inRange = self.chainIndex[rows] < self.timelineLength[rows]
+    shown = rows[inRange]
+    self.highlightMask[shown] = self._stage_mask(shown)
+    done = rows[~inRange]
+    self.chainIndex[done] = 0
+    self.switchCounter[done] = 0
+    self.highlight[done] = False
+    self.hit[done] = True
+    self.highlightMask[done] = 0
+    self.hitMask[done] = 0
+    # The Bot plans its route from where it stands
+    self.planned[done] = self.p2Row[done] * SIDECOLS + self.p2Col[done] - SIDECOLS
+    self.routeIndex[done] = 0
+
+  def _hit(self, rows : np.ndarray) -> None:
+    inRange = self.chainIndex[rows] < self.timelineLength[rows]
+    hit = rows[inRange]
+    self.hitMask[hit] = self._stage_mask(hit)
+    self.p1Vulnerable[hit[self.p1HitCounter[hit] >= HITCOOLDOWN]] = True
+    self.p2Vulnerable[hit[self.p2HitCounter[hit] >= HITCOOLDOWN]] = True
+    index = self.chainIndex[hit]
+    p1Panel = self.p1Row[hit] * SIDECOLS + self.p1Col[hit]
+    p1Struck = hit[(self.p1Timeline[hit, index] >> p1Panel & 1 == 1) & self.p1Vulnerable[hit]]
+    self.p1Hit[p1Struck] = True
+    self.p1Vulnerable[p1Struck] = False
+    self.p1HitCounter[p1Struck] = -1
+    p2Panel = self.p2Row[hit] * SIDECOLS + self.p2Col[hit] - SIDECOLS
+    p2Struck = hit[(self.p2Timeline[hit, index] >> p2Panel & 1 == 1) & self.p2Vulnerable[hit]]
+    self.p2Hit[p2Struck] = True
+    self.p2Vulnerable[p2Struck] = False
+    self.p2HitCounter[p2Struck] = -1
+    self.p1HitCounter[hit] += 1
+    self.p2HitCounter[hit] += 1
+    done = rows[~inRange]
+    self.chainIndex[done] = 0
+    self.highlight[done] = True
+    self.hit[done] = False
+    self.p1Ready[done] = False
+    self.p2Ready[done] = False
+    self.active[done] = False
+    self.highlightMask[done] = 0
+    self.hitMask[done] = 0
+
+  ###################################################################
+  #                              Bot                                #
+  ###################################################################
+
+  def _bot_movement(self, rows : np.ndarray) -> np.ndarray:
+    """Return the Bot's movement in each row, idling while chips are highlighted and dodging once they hit"""
+    movements = np.zeros((len(rows), 2), dtype=np.int16)
+    highlighting = self.highlight[rows]
+    self.dodgeCounter[rows[highlighting]] = 0
+    movements[highlighting] = self._idle(rows[highlighting])
+    dodging = ~highlighting & (self.dodgeCounter[rows] > SWITCH - 3)
+    movements[dodging] = self._dodge(rows[dodging])
+    self.dodgeCounter[rows[~highlighting & ~dodging]] += 1
+    return movements
+
+  def _idle(self, rows : np.ndarray) -> np.ndarray:
+    movements = np.zeros((len(rows), 2), dtype=np.int16)
+    waiting = self.frameCounter[rows] < self.movementCooldown
+    self.frameCounter[rows[waiting]] += 1
+    moving = rows[~waiting]
+    self.frameCounter[moving] = 0
+    self.randomUses[moving] += 1
+    movements[~waiting] = VECTORS[self._random.randint(0, 3, moving)]
+    return movements
+
+  def _dodge(self, rows : np.ndarray) -> np.ndarray:
+    movements = np.zeros((len(rows), 2), dtype=np.int16)
+    self.frameCounter[rows] = 0
+    routed = self.routeIndex[rows] < self.timelineLength[rows]
+    movements[~routed] = self._idle(rows[~routed])
+    following = rows[routed]
+    self.randomUses[following] += 1
+    mistaken = self._random.randint(1, 100, following) <= self.errorRate
+    movements[np.flatnonzero(routed)[mistaken]] = VECTORS[self._random.randint(0, 3, following[mistaken])]
+    following = following[~mistaken]
+    movements[np.flatnonzero(routed)[~mistaken]] = self._follow_route(following)
+    return movements
+
+  def _follow_route(self, rows : np.ndarray) -> np.ndarray:
+    """Return the next movement on each row's route and move on to the one after"""
+    index = self.routeIndex[rows]
+    current = self.p2Timeline[rows, index]
+    upcoming = np.where(index + 1 < self.timelineLength[rows], self.p2Timeline[rows, np.minimum(index + 1, self._width - 1)], 0)
+    planned = self.planned[rows]
+    nextPlanned = BatchMatch._planTable[planned, current, upcoming]
+    self.planned[rows] = nextPlanned
+    self.routeIndex[rows] += 1
+    return np.stack((PLANROWS[nextPlanned] - PLANROWS[planned], PLANCOLS[nextPlanned] - PLANCOLS[planned]), axis=1)
+
+  def _select_chips(self, rows : np.ndarray) -> None:
+    """Shuffle each row's Bot folder and load the first five chips at random speeds, as Bot.select_chips"""
+    self.randomUses[rows] += 1
+    folders = self.folders[rows]
+    maxIndex = folders.shape[1] - 1
+    picked = np.arange(len(rows))
+    for swap in range(2 * folders.shape[1]):
+      index1 = self._random.randint(0, maxIndex, rows)
+      index2 = self._random.randint(0, maxIndex, rows)
+      same = np.flatnonzero(index1 == index2)
+      while len(same) > 0:
+        index2[same] = self._random.randint(0, maxIndex, rows[same])
+        same = same[index1[same] == index2[same]]
+      chip1 = folders[picked, index1]
+      folders[picked, index1] = folders[picked, index2]
+      folders[picked, index2] = chip1
+    ids = folders[:, :5]
+    frames = np.stack([SPEEDS[self._random.randint(0, 2, rows)] for chip in range(5)], axis=1)
+    self.folders[rows] = np.roll(folders, -5, axis=1)
+    orders, lengths = self._compile(ids, frames)
+    self.p2Order[rows] = orders
+    self.p2Length[rows] = lengths
+    self.p2Ready[rows] = True
+    self.p2OnStage[rows] = True
+
+  def _compile(self, ids : np.ndarray, frames : np.ndarray) -> tuple:
+    """Return side masks by tick of chip orders, padded to the array width, and their lengths"""
+    ends = np.cumsum(frames, axis=1)
+    lengths = ends[:, -1]
+    self._fit(int(lengths.max()) + 1)
+    ticks = np.arange(self._width)
+    slots = (ticks[None, None, :] >= ends[:, :, None]).sum(axis=1)
+    masks = BatchMatch._chipMasks[ids]
+    orders = np.take_along_axis(masks, np.minimum(slots, ids.shape[1] - 1), axis=1)
+    orders[ticks[None, :] >= lengths[:, None]] = 0
+    return orders, lengths
+
+  ###################################################################
+  #                             State                               #
+  ###################################################################
+
+  def state(self, row : int) -> tuple:
+    """Return the state of a row in the layout of scalar_state"""
+    length = self.timelineLength[row]
+    route = ()
+    if self.hit[row]:
+      route = self._route(row)
+    return ((int(self.p1Row[row]), int(self.p1Col[row])), (int(self.p2Row[row]), int(self.p2Col[row])),
+            int(self.p1Health[row]), int(self.p2Health[row]), bool(self.p1Zero[row]), bool(self.p2Zero[row]),
+            int(self.switchCounter[row]), int(self.chainIndex[row]), int(self.p1HitCounter[row]),
+            int(self.p2HitCounter[row]), int(self.highlightMask[row]), int(self.hitMask[row]),
+            tuple(int(mask) for mask in self.p1Order[row, :self.p1Length[row]]),
+            tuple(int(mask) for mask in self.p2Order[row, :self.p2Length[row]]),
+            tuple(int(mask) for mask in self.p1Timeline[row, :length]),
+            tuple(int(mask) for mask in self.p2Timeline[row, :length]),
+            tuple(bool(getattr(self, name)[row]) for name in ("active", "p1Ready", "p2Ready", "highlight", "hit",
+                                                             "p1Hit", "p2Hit", "p1Vulnerable", "p2Vulnerable")),
+            bool(self.p1OnStage[row]), bool(self.p2OnStage[row]), bool(self.roundPlayed[row]), int(self.dodgeCounter[row]),
+            tuple(bool(getattr(self, name)[row]) for name in ("moved", "damaged", "roundOver", "gameOver")),
+            int(self.frameCounter[row]), int(self.randomUses[row]), route, tuple(int(id) for id in self.folders[row]))
+
+  def _route(self, row : int) -> tuple:
+    """Return the movements left on a row's route"""
+    route = []
+    planned = int(self.planned[row])
+    length = int(self.timelineLength[row])
+    for index in range(int(self.routeIndex[row]), length):
+      upcoming = self.p2Timeline[row, index + 1] if index + 1 < length else 0
+      nextPlanned = int(BatchMatch._planTable[planned, self.p2Timeline[row, index], upcoming])
+      route.append((int(PLANROWS[nextPlanned] - PLANROWS[planned]), int(PLANCOLS[nextPlanned] - PLANCOLS[planned])))
+      planned = nextPlanned
+    return tuple(route)
+
+
+def scalar_state(match) -> tuple:
+  """Return the state of a Match against a Bot in the layout of BatchMatch.state"""
+  p1State, p2State, combatState, p1OnStage, p2OnStage, roundPlayed, dodgeCounter, events = match.snapshot()
+  (p1Position, p1Health), p1Zero = p1State
+  ((p2Position, p2Health), route, frameCounter, hitOrder, folder, randomState, randomUses), p2Zero = p2State
+  (switchCounter, chainIndex, p1HitCounter, p2HitCounter, highlightMask, hitMask,
+   p1Order, p2Order, timeline, combatEvents) = combatState
+  length = len(timeline)
+  if not combatEvents[4]:
+    # The Bot only follows its route while chips hit
+    route = ()
+  return (p1Position, p2Position, p1Health, p2Health, p1Zero, p2Zero, switchCounter, chainIndex,
+          p1HitCounter, p2HitCounter, highlightMask, hitMask, tuple(p1Order), tuple(p2Order),
+          tuple(timeline.p1_mask(tick) for tick in range(length)), tuple(timeline.p2_mask(tick) for tick in range(length)),
+          combatEvents, p1OnStage, p2OnStage, roundPlayed, dodgeCounter, events,
+          frameCounter, randomUses, tuple(route), tuple(chip.id for chip in folder))
+
+###################################################################################
+#                                  Command line                                   #
+###################################################################################
+
+def check(matches : int, ticks : int, seed : int) -> bool:
+  """Play matches as Matches and as one batch with the same inputs and random numbers, return true if every tick agrees"""
+  from common.headless import new_match, HeadlessChips
+  from common.combat import random_folder
+  from common.netplay import chip_instance
+  inputRng = random.Random(seed)
+  p1Folders = [random_folder(inputRng) for match in range(matches)]
+  p2Folders = [random_folder(inputRng) for match in range(matches)]
+  # Each side has its own generators, seeded alike
+  botRngs = [random.Random(seed * 1000 + match) for match in range(matches)]
+  scalars = [new_match(p1Folders[match], p2Folders[match], botRngs[match]) for match in range(matches)]
+  batch = BatchMatch(np.array(p2Folders), ScalarRandom([random.Random(seed * 1000 + match) for match in range(matches)]))
+  games = 0
+  for tick in range(ticks):
+    # Same random P1 inputs for both
+    confirmRows, ids, frames = [], [], []
+    movements = np.zeros((matches, 2), dtype=np.int16)
+    for match, scalar in enumerate(scalars):
+      if not scalar.on_stage("P1"):
+        count = inputRng.randint(1, 5)
+        chipIds = inputRng.sample(p1Folders[match], count)
+        chipFrames = [inputRng.choice((5, 10, 30)) for id in chipIds]
+        scalar.confirm("P1", [chip_instance(HeadlessChips.get_chip, id, frame) for id, frame in zip(chipIds, chipFrames)])
+        confirmRows.append(match)
+        ids.append(chipIds + [0] * (5 - count))
+        frames.append(chipFrames + [0] * (5 - count))
+      if inputRng.random() < .15:
+        movements[match] = inputRng.choice(((1, 0), (-1, 0), (0, 1), (0, -1)))
+        scalar.move("P1", tuple(int(x) for x in movements[match]))
+    if len(confirmRows) > 0:
+      batch.confirm(np.array(confirmRows), np.array(ids), np.array(frames))
+    batch.move(movements)
+    for scalar in scalars:
+      scalar.tick()
+    batch.tick()
+    for match, scalar in enumerate(scalars):
+      ended = scalar.events["GAMEOVER"]
+      if ended:
+        # The batch starts the next match in the row at once, with the Bot's random numbers going on,
+        # keeping the events of the tick the last one ended on
+        games += 1
+        events = tuple(scalar.events.values())[:3] + (False,)
+        scalars[match] = scalar = new_match(p1Folders[match], p2Folders[match], botRngs[match])
+        expected = scalar_state(scalar)
+        expected = expected[:21] + (events,) + expected[22:]
+      else:
+        expected = scalar_state(scalar)
+      actual = batch.state(match)
+      if actual != expected or batch.ended[match] != ended:
+        print("match %d differs at tick %d%s" % (match, tick, "" if batch.ended[match] == ended else ", ended"))
+        names = ("p1 position", "p2 position", "p1 health", "p2 health", "p1 zero", "p2 zero", "switch counter",
+                 "chain index", "p1 hit counter", "p2 hit counter", "highlight mask", "hit mask", "p1 order",
+                 "p2 order", "p1 timeline", "p2 timeline", "combat events", "p1 on stage", "p2 on stage",
+                 "round played", "dodge counter", "events", "frame counter", "random uses", "route", "folder")
+        for name, a, b in zip(names, expected, actual):
+          if a != b:
+            print("  %s: match %s, batch %s" % (name, a, b))
+        return False
+  print("%d matches agree on all %d ticks, %d games ended, %d rounds" % (matches, ticks, games, batch.rounds))
+  return games == batch.games
+
+def benchmark(matches : int, ticks : int, seed : int) -> None:
+  """Print how fast a batch plays against random P1 input compared with Matches"""
+  from common.headless import new_match
+  from common.combat import random_folder, FOLDERSIZE
+  from common.chip_library import ChipLibrary
+  generator = np.random.default_rng(seed)
+  chipCount = ChipLibrary.count()
+  p1Folders = np.argsort(generator.random((matches, chipCount)), axis=1)[:, :FOLDERSIZE]
+  p2Folders = np.argsort(generator.random((matches, chipCount)), axis=1)[:, :FOLDERSIZE]
+  batch = BatchMatch(p2Folders, NumpyRandom(seed))
+  steps = np.array([(0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)], dtype=np.int16)
+  start = time.perf_counter()
+  for tick in range(ticks):
+    rows = np.flatnonzero(~batch.on_stage())
+    if len(rows) > 0:
+      counts = generator.integers(1, 6, len(rows))
+      picks = np.argsort(generator.random((len(rows), FOLDERSIZE)), axis=1)[:, :5]
+      ids = np.take_along_axis(p1Folders[rows], picks, axis=1)
+      frames = np.where(np.arange(5)[None, :] < counts[:, None], SPEEDS[generator.integers(0, 3, (len(rows), 5))], 0)
+      batch.confirm(rows, ids, frames)
+    moving = generator.random(matches) < .15
+    batch.move(np.where(moving[:, None], steps[generator.integers(1, 5, matches)], 0))
+    batch.tick()
+  elapsed = time.perf_counter() - start
+  print("%d matches x %d ticks in %.2f s: %.0f match ticks/s, %d rounds, %d games (P1 won %d)" % (
+    matches, ticks, elapsed, matches * ticks / elapsed, batch.rounds, batch.games, batch.p1Wins))
+  # The same number of ticks played one Match at a time
+  rng = random.Random(seed)
+  match = new_match(random_folder(rng), rng=rng)
+  folder = random_folder(rng)
+  scalarTicks = 20000
+  from common.headless import HeadlessChips
+  start = time.perf_counter()
+  for tick in range(scalarTicks):
+    if match.events["GAMEOVER"]:
+      match = new_match(folder, rng=rng)
+    if not match.on_stage("P1"):
+      match.confirm("P1", [HeadlessChips.get_chip(id) for id in rng.sample(folder, rng.randint(1, 5))])
+    if rng.random() < .15:
+      match.move("P1", rng.choice(((1, 0), (-1, 0), (0, 1), (0, -1))))
+    match.tick()
+  scalarRate = scalarTicks / (time.perf_counter() - start)
+  print("Match: %.0f ticks/s, the batch is %.1f times faster" % (scalarRate, matches * ticks / elapsed / scalarRate))
+
+
+if __name__ == "__main__":
+  # python -m common.batch check [--matches N] [--ticks N] [--seed N]
+  # python -m common.batch bench [--matches N] [--ticks N] [--seed N]
+  from argparse import ArgumentParser
+  parser = ArgumentParser(description="Check batched matches against Match, or measure their speed")
+  parser.add_argument("mode", choices=("check", "bench"))
+  parser.add_argument("--matches", type=int, default=None, help="matches in the batch, 8 when checking and 10000 in the benchmark")
+  parser.add_argument("--ticks", type=int, default=None, help="ticks played, 5000 when checking and 1000 in the benchmark")
+  parser.add_argument("--seed", type=int, default=0, help="seed of the folders, inputs and Bot random numbers")
+  args = parser.parse_args()
+  if args.mode == "check":
+    sys.exit(0 if check(args.matches or 8, args.ticks or 5000, args.seed) else 1)
+  benchmark(args.matches or 10000, args.ticks or 1000, args.seed)
+  sys.exit(0)
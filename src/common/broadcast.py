@@ -0,0 +1,336 @@
+import sys
+import time
+import struct
+import random
+import asyncio
+import logging
+import threading
+from common.combat import Match
+
+logger = logging.getLogger(__name__)
+
+# Spectators are sent a view of the match: what the stage shows, not the rules'
+# state. A keyframe holds every field of the view and a delta only the fields that
+# changed since the last message, so most ticks cost a header or nothing at all.
+# Spectators get a keyframe when they connect and every KEYFRAMEINTERVAL ticks.
+
+KEYFRAME = 0
+DELTA = 1
+
+# Message header: kind | tick | bit i set when field i follows
+MESSAGEHEADER = struct.Struct("!BIB")
+# Fields of a view in order. Positions are row << 4 | col, winner is an index of WINNERS.
+FIELDS = (
+  ("p1Position", struct.Struct("!B")),
+  ("p2Position", struct.Struct("!B")),
+  ("p1Health", struct.Struct("!B")),
+  ("p2Health", struct.Struct("!B")),
+  ("highlight", struct.Struct("!I")), # stage mask of highlighted panels
+  ("hit", struct.Struct("!I")), # stage mask of hit panels
+  ("winner", struct.Struct("!B"))
+)
+ALLFIELDS = (1 << len(FIELDS)) - 1
+WINNERS = (None, "P1", "P2")
+
+def match_view(match : Match) -> tuple:
+  """Return what spectators are shown of a match, one value per field"""
+  p1Row, p1Col = match.p1Manager.player.get_stage_position()
+  p2Row, p2Col = match.p2Manager.player.get_stage_position()
+  highlightMask, hitMask = match.combatManager.stage_masks()
+  return (p1Row << 4 | p1Col, p2Row << 4 | p2Col,
+          max(0, match.p1Manager.player.get_health()), max(0, match.p2Manager.player.get_health()),
+          highlightMask, hitMask, WINNERS.index(match.winner()))
+
+def view_position(view : tuple, key : str) -> tuple:
+  """Return the stage position of the player at a given key in a view"""
+  code = view[0] if key == "P1" else view[1]
+  return (code >> 4, code & 0xF)
+
+def encode_view(tick : int, view : tuple, previous : tuple = None) -> bytes:
+  """Return a keyframe of a view, or a delta from the previous view if given"""
+  if previous is None:
+    kind, changed = KEYFRAME, ALLFIELDS
+  else:
+    kind, changed = DELTA, 0
+    for i in range(len(FIELDS)):
+      if view[i] != previous[i]:
+        changed |= 1 << i
+  parts = [MESSAGEHEADER.pack(kind, tick, changed)]
+  for i, (name, fieldStruct) in enumerate(FIELDS):
+    if changed >> i & 1:
+      parts.append(fieldStruct.pack(view[i]))
+  return b"".join(parts)
+
+def payload_size(changed : int) -> int:
+  """Return the bytes following a header with a given changed field set"""
+  return sum(fieldStruct.size for i, (name, fieldStruct) in enumerate(FIELDS) if changed >> i & 1)
+
+def apply_payload(view : tuple, changed : int, payload : bytes) -> tuple:
+  """Return a view with the changed fields read from a payload"""
+  values = list(view) if view is not None else [0] * len(FIELDS)
+  offset = 0
+  for i, (name, fieldStruct) in enumerate(FIELDS):
+    if changed >> i & 1:
+      values[i] = fieldStruct.unpack_from(payload, offset)[0]
+      offset += fieldStruct.size
+  return tuple(values)
+
+async def read_views(reader : asyncio.StreamReader):
+  """Yield (tick, view) for every message read until the server closes"""
+  view = None
+  while True:
+    try:
+      header = await reader.readexactly(MESSAGEHEADER.size)
+      kind, tick, changed = MESSAGEHEADER.unpack(header)
+      payload = await reader.readexactly(payload_size(changed))
+    except asyncio.IncompleteReadError:
+      return
+    if kind == KEYFRAME:
+      view = None
+    elif view is None:
+      # A delta can only follow a keyframe
+      continue
+    view = apply_payload(view, changed, payload)
+    yield tick, view
+
+###################################################################################
+#                                     Server                                      #
+###################################################################################
+
+class Spectator:
+  """A connected spectator and whether it has fallen behind"""
+  def __init__(self, writer : asyncio.StreamWriter):
+    self.writer = writer
+    self.lagging = True # waits for a keyframe, as when it has just connected
+
+
+class SpectatorServer:
+  """Streams the view of a running match to any number of spectators over TCP"""
+  KEYFRAMEINTERVAL = 100 # ticks between keyframes
+  MAXBUFFER = 16 * 1024 # bytes queued for a spectator before it is skipped until it catches up
+  BACKLOG = 1024 # connections waiting to be accepted, for many spectators joining at once
+
+  def __init__(self, host : str = "127.0.0.1", port : int = 0):
+    self.host = host
+    self.port = port # the port bound once started when 0
+    self.tick = -1 # last tick published
+    self.bytesSent = 0
+    self.messages = 0 # messages encoded, each written to every spectator
+    self.skipped = 0 # times a lagging spectator was left out of a message
+    self._spectators = []
+    self._view = None # last view published
+    self._server = None
+
+  async def start(self) -> None:
+    """Listen for spectators"""
+    self._server = await asyncio.start_server(self._connected, self.host, self.port,
+                                              backlog=SpectatorServer.BACKLOG)
+    self.port = self._server.sockets[0].getsockname()[1]
+    logger.info("spectators may connect to %s:%d", self.host, self.port)
+
+  async def close(self) -> None:
+    """Disconnect every spectator and stop listening"""
+    for spectator in self._spectators:
+      spectator.writer.close()
+    self._spectators.clear()
+    if self._server is not None:
+      self._server.close()
+      await self._server.wait_closed()
+
+  def spectators(self) -> int:
+    return len(self._spectators)
+
+  def publish(self, view : tuple) -> None:
+    """Send the view of the next tick to every spectator"""
+    self.tick += 1
+    keyframeDue = self.tick % SpectatorServer.KEYFRAMEINTERVAL == 0
+    previous = self._view
+    self._view = view
+    keyframe = None
+    delta = None
+    if previous is not None and not keyframeDue and view != previous:
+      delta = encode_view(self.tick, view, previous)
+      self.messages += 1
+    for spectator in self._spectators:
+      transport = spectator.writer.transport
+      if transport.is_closing():
+        continue
+      if transport.get_write_buffer_size() > SpectatorServer.MAXBUFFER:
+        # Let the backlog drain instead of queueing more, then resync with a keyframe
+        spectator.lagging = True
+        self.skipped += 1
+        continue
+      if not spectator.lagging and not keyframeDue and previous is not None:
+        if delta is None:
+          # Nothing changed, spectators keep showing the last view
+          continue
+        message = delta
+      else:
+        if keyframe is None:
+          keyframe = encode_view(self.tick, view)
+          self.messages += 1
+        message = keyframe
+        spectator.lagging = False
+      spectator.writer.write(message)
+      self.bytesSent += len(message)
+
+  async def _connected(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter) -> None:
+    """Send a new spectator the current view then keep it until it disconnects"""
+    spectator = Spectator(writer)
+    self._spectators.append(spectator)
+    if self._view is not None:
+      message = encode_view(self.tick, self._view)
+      writer.write(message)
+      self.bytesSent += len(message)
+      spectator.lagging = False
+    try:
+      # Spectators send nothing, reading only notices when they leave
+      while await reader.read(1024):
+        pass
+    except ConnectionError:
+      pass
+    finally:
+      if spectator in self._spectators:
+        self._spectators.remove(spectator)
+      writer.close()
+
+
+class Broadcast:
+  """A SpectatorServer on its own thread, fed by a game loop that is not asynchronous"""
+  def __init__(self, host : str = "127.0.0.1", port : int = 0):
+    self.server = SpectatorServer(host, port)
+    self._loop = asyncio.new_event_loop()
+    self._thread = threading.Thread(target=self._loop.run_forever, name="broadcast", daemon=True)
+
+  def start(self) -> None:
+    """Start the server thread and wait until spectators may connect"""
+    self._thread.start()
+    asyncio.run_coroutine_threadsafe(self.server.start(), self._loop).result()
+
+  def publish(self, view : tuple) -> None:
+    """Send a view to spectators from any thread"""
+    self._loop.call_soon_threadsafe(self.server.publish, view)
+
+  def close(self) -> None:
+    """Disconnect every spectator and stop the server thread"""
+    asyncio.run_coroutine_threadsafe(self.server.close(), self._loop).result()
+    self._loop.call_soon_threadsafe(self._loop.stop)
+    self._thread.join()
+
+###################################################################################
+#                                 Headless Matches                                #
+###################################################################################
+
+class DemoMatches:
+  """Endless bot matches with random P1 input, to broadcast without a game running"""
+  def __init__(self, rng=random):
+    from common.headless import new_match, HeadlessChips
+    from common.combat import random_folder
+    self._new_match = new_match
+    self._get_chip = HeadlessChips.get_chip
+    self._random_folder = random_folder
+    self._random = rng
+    self._next_match()
+
+  def tick(self) -> tuple:
+    """Advance the match a tick and return its view, starting another once it is over"""
+    match = self.match
+    if match.winner() is not None:
+      self._next_match()
+      match = self.match
+    if not match.on_stage("P1"):
+      ids = self._random.sample(self._folder, self._random.randint(1, 5))
+      match.confirm("P1", [self._get_chip(id) for id in ids])
+    if self._random.random() < .15:
+      match.move("P1", self._random.choice(((1, 0), (-1, 0), (0, 1), (0, -1))))
+    match.tick()
+    return match_view(match)
+
+  def _next_match(self) -> None:
+    self._folder = self._random_folder(self._random)
+    self.match = self._new_match(self._folder, rng=self._random)
+
+
+async def serve(host : str, port : int, tickTime : float, seed : int) -> None:
+  """Broadcast demo matches forever"""
+  server = SpectatorServer(host, port)
+  await server.start()
+  matches = DemoMatches(random.Random(seed))
+  nextTick = time.monotonic()
+  while True:
+    server.publish(matches.tick())
+    nextTick += tickTime
+    await asyncio.sleep(max(0, nextTick - time.monotonic()))
+
+async def load_test(clients : int, ticks : int, tickTime : float, seed : int) -> bool:
+  """Broadcast demo matches to many local spectators, half joining late, return true if all ended in sync"""
+  server = SpectatorServer()
+  await server.start()
+  matches = DemoMatches(random.Random(seed))
+  received = [None] * clients # last (tick, view) of each spectator
+  messages = [0] * clients
+  lag = [0] # most ticks a spectator was behind the server
+
+  async def spectate(index : int) -> None:
+    reader, writer = await asyncio.open_connection(server.host, server.port)
+    async for tick, view in read_views(reader):
+      received[index] = (tick, view)
+      messages[index] += 1
+      lag[0] = max(lag[0], server.tick - tick)
+    writer.close()
+
+  tasks = [asyncio.ensure_future(spectate(i)) for i in range(clients // 2)]
+  start = time.perf_counter()
+  nextTick = time.monotonic()
+  for tick in range(ticks):
+    if tick == ticks // 2:
+      tasks += [asyncio.ensure_future(spectate(i)) for i in range(clients // 2, clients)]
+    server.publish(matches.tick())
+    nextTick += tickTime
+    await asyncio.sleep(max(0, nextTick - time.monotonic()))
+  # Let spectators read everything sent before comparing
+  finalView = server._view
+  for i in range(100):
+    if all(entry is not None and entry[1] == finalView for entry in received):
+      break
+    await asyncio.sleep(.02)
+  elapsed = time.perf_counter() - start
+  synced = sum(1 for entry in received if entry is not None and entry[1] == finalView)
+  print("%d spectators, %d ticks in %.2f s, %d connected at the end" % (clients, ticks, elapsed, server.spectators()))
+  print("%d messages encoded, %d bytes sent, %.1f bytes per spectator per tick, %d skipped while lagging" % (
+    server.messages, server.bytesSent, server.bytesSent / max(1, clients) / ticks, server.skipped))
+  print("messages read per spectator %d to %d, most ticks behind %d" % (min(messages), max(messages), lag[0]))
+  print("%d of %d spectators show the final view" % (synced, clients))
+  await server.close()
+  for task in tasks:
+    task.cancel()
+  results = await asyncio.gather(*tasks, return_exceptions=True)
+  failed = [result for result in results if isinstance(result, OSError)]
+  if len(failed) > 0:
+    print("%d spectators could not connect: %s" % (len(failed), failed[0]))
+  return synced == clients
+
+
+if __name__ == "__main__":
+  # python -m common.broadcast serve PORT [--host HOST] [--tick-ms MS] [--seed N]
+  # python -m common.broadcast loadtest [--clients N] [--ticks N] [--tick-ms MS] [--seed N]
+  from argparse import ArgumentParser
+  parser = ArgumentParser(description="Broadcast bot matches to spectators, or load test the broadcast")
+  parser.add_argument("mode", choices=("serve", "loadtest"))
+  parser.add_argument("port", nargs="?", type=int, default=47800, help="port spectators connect to")
+  parser.add_argument("--host", default="127.0.0.1", help="address to serve on, 0.0.0.0 to let other machines watch")
+  parser.add_argument("--clients", type=int, default=150, help="spectators in the load test")
+  parser.add_argument("--ticks", type=int, default=2000, help="ticks broadcast in the load test")
+  parser.add_argument("--tick-ms", type=float, default=None, help="ms between ticks, 50 when serving and 2 in the load test")
+  parser.add_argument("--seed", type=int, default=0, help="seed of the matches played")
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+  if args.mode == "serve":
+    tickMs = args.tick_ms if args.tick_ms is not None else 50
+    try:
+      asyncio.run(serve(args.host, args.port, tickMs / 1000, args.seed))
+    except KeyboardInterrupt:
+      pass
+    sys.exit(0)
+  tickMs = args.tick_ms if args.tick_ms is not None else 2
+  sys.exit(0 if asyncio.run(load_test(args.clients, args.ticks, tickMs / 1000, args.seed)) else 1)
@@ -0,0 +1,76 @@
+import json, mmap, os, struct, sys
+from common.file_handler import FileHandler
+
+# Bundle layout:
+#   MAGIC | index length (uint32) | index json {id: [offset, length]} | asset json ...
+# Offsets are relative to the end of the index, so one asset can be decoded without the rest.
+MAGIC = b"CSB1"
+HEADER = struct.Struct("<4sI")
+
+class Bundle:
+  def __init__(self, fileName : str):
+    filePath = FileHandler.get_packaged_files_path(fileName)
+    with open(filePath, "rb") as file:
+      try:
+        self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+      except (ValueError, OSError):
+        # mmap is unavailable for some files and platforms
+        self._data = file.read()
+    magic, indexLength = HEADER.unpack_from(self._data, 0)
+    if magic != MAGIC:
+      raise ValueError(fileName + " is not an asset bundle")
+    indexStart = HEADER.size
+    self._start = indexStart + indexLength
+    self._index = json.loads(bytes(self._data[indexStart:self._start]))
+
+  def __getitem__(self, id : str) -> dict:
+    """Decode the json dictionary of a single asset"""
+    offset, length = self._index[id]
+    start = self._start + offset
+    return json.loads(bytes(self._data[start:start+length]))
+
+  def __contains__(self, id : str) -> bool:
+    return id in self._index
+
+  def __len__(self) -> int:
+    return len(self._index)
+
+  def keys(self):
+    return self._index.keys()
+
+  @staticmethod
+  def write(fileName : str, data : dict) -> None:
+    """Write a dictionary of json assets as a bundle"""
+    index = {}
+    payload = bytearray()
+    for key in data.keys():
+      encoded = json.dumps(data[key], separators=(",", ":")).encode()
+      index[key] = [len(payload), len(encoded)]
+      payload += encoded
+    encodedIndex = json.dumps(index, separators=(",", ":")).encode()
+    filePath = FileHandler.get_packaged_files_path(fileName)
+    with open(filePath, "wb") as file:
+      file.write(HEADER.pack(MAGIC, len(encodedIndex)))
+      file.write(encodedIndex)
+      file.write(payload)
+
+
+def bundle_name(fileName : str) -> str:
+  """Return the bundle file name for a given json file name"""
+  return os.path.splitext(fileName)[0] + ".bundle"
+
+def convert_json(fileName : str) -> str:
+  """Convert a packaged json file to a bundle, return the bundle name"""
+  filePath = FileHandler.get_packaged_files_path(fileName)
+  with open(filePath, "r") as file:
+    data = json.load(file)
+  bundleName = bundle_name(fileName)
+  Bundle.write(bundleName, data)
+  return bundleName
+
+
+if __name__ == "__main__":
+  # python -m common.bundle [assets.json chips.json ...]
+  fileNames = sys.argv[1:] or ["assets.json", "chips.json"]
+  for fileName in fileNames:
+    print(fileName, "->", convert_json(fileName))
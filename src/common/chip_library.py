@@ -1,22 +1,49 @@
-from common.json_handler import JsonHandler
-from common.chips import Chip
-from copy import deepcopy as deep_copy
-
-def load_all_chips() -> dict:
-  """Load chips from json file"""
-  chipObjs = JsonHandler.convert_data("chips.json")
-  
-  id = 0
-  chipDict = {}
-  for chip in chipObjs:
-    chipDict[id] = chip
-    id += 1
-  return chipDict
+from common.json_data import load_indexed
+from common.chips import Chip, ChipInstance
+from threading import Lock
+
+DATALOCK = Lock() # chips may be loaded from the loading thread
+
+def load_chip_data() -> dict:
+  """Parse chips json file on first use"""
+  with DATALOCK:
+    if ChipLibrary.chipData is None:
+      ChipLibrary.chipData = load_indexed("chips.json")
+  return ChipLibrary.chipData
+
+def load_chip(id : int) -> Chip:
+  """Convert a single chip in json file to its object"""
+  # Imported here so the library can be used without pygame when chips are converted otherwise
+  from common.json_handler import JsonHandler
+  return JsonHandler.convert_object(load_chip_data()[str(id)])
 
 class ChipLibrary:
-  allChips = load_all_chips()
+  chipData = None # parsed json or bundle, opened on first use
+  allChips = {} # converted chips, filled on first use of each chip
+
+  @classmethod
+  def get_chip(cls, id : int) -> ChipInstance:
+    """Return a new standard instance of the chip at a given id"""
+    return ChipInstance(cls.get_definition(id))
+
+  @classmethod
+  def get_definition(cls, id : int) -> Chip:
+    """Return the shared chip definition at a given id"""
+    if id not in cls.allChips:
+      cls.allChips[id] = cls.convert(id)
+    return cls.allChips[id]
+
+  @staticmethod
+  def convert(id : int) -> Chip:
+    """Convert the chip at a given id with its asset"""
+    return load_chip(id)
+
+  @classmethod
+  def load_all(cls) -> list:
+    """Convert every chip that has not been used yet, return every chip by id"""
+    return [cls.get_definition(id) for id in range(cls.count())]
 
   @staticmethod
-  def get_chip(id : int) -> Chip:
-    """Return chip at a given id"""
-    return deep_copy(ChipLibrary.allChips[id])
+  def count() -> int:
+    """Return the number of chips in the library"""
+    return len(load_chip_data())
@@ -1,34 +1,15 @@
-from random import randint
-from common.graphics import Asset, Colors
-from common.containers import Matrix
+import random
+from common.colors import Colors
+from common.containers import Matrix, matrix_to_mask
 
 class Chip:
-  # Number of frames panels are highlighted
-  FASTHIGHLIGHT = 5
-  STANDARDHIGHLIGHT = 10
-  SLOWHIGHLIGHT = 30
-
-  def __init__(self, asset : Asset, areaMatrix : list):
+  """Shared chip definition, never modified after loading"""
+  def __init__(self, asset, areaMatrix : list, id : int = None):
+    self.id = id
     self._asset = asset
     self._areaMatrix = Matrix(areaMatrix)
     self._invertedMatrix = Matrix(self._invert_matrix())
-    self.highlightFrames = Chip.STANDARDHIGHLIGHT
-    self.highlightColor = Colors.ORANGE
-
-  def fast(self) -> None:
-   """Set highlightFrames to fast"""
-   self.highlightFrames = Chip.FASTHIGHLIGHT
-   self.highlightColor = Colors.RED
-  
-  def standard(self) -> None:
-   """Set highlightFrames to standard"""
-   self.highlightFrames = Chip.STANDARDHIGHLIGHT
-   self.highlightColor = Colors.ORANGE
-
-  def slow(self) -> None:
-   """Set highlightFrames to slow"""
-   self.highlightFrames = Chip.SLOWHIGHLIGHT
-   self.highlightColor = Colors.YELLOW
+    self._areaMask = matrix_to_mask(self._areaMatrix)
 
   def get_asset(self):
     """Return chip asset"""
@@ -41,6 +22,10 @@ class Chip:
   def get_inverted_matrix(self) -> list:
     """Return chip invertedMatrix"""
     return self._invertedMatrix
+
+  def get_area_mask(self) -> int:
+    """Return chip areaMatrix as a side mask"""
+    return self._areaMask
   
   def _invert_matrix(self) -> list:
     """Invert areaMatrix"""
@@ -55,19 +40,83 @@ class Chip:
         invertedMatrix[row][col] = self._areaMatrix[row][c]
     return invertedMatrix
 
+
+class ChipInstance:
+  """A use of a shared Chip with its own speed variant"""
+  # Number of frames panels are highlighted
+  FASTHIGHLIGHT = 5
+  STANDARDHIGHLIGHT = 10
+  SLOWHIGHLIGHT = 30
+
+  __slots__ = ("_chip", "highlightFrames", "highlightColor")
+
+  def __init__(self, chip : Chip):
+    self._chip = chip
+    self.standard()
+
+  def fast(self) -> None:
+   """Set highlightFrames to fast"""
+   self.highlightFrames = ChipInstance.FASTHIGHLIGHT
+   self.highlightColor = Colors.RED
+  
+  def standard(self) -> None:
+   """Set highlightFrames to standard"""
+   self.highlightFrames = ChipInstance.STANDARDHIGHLIGHT
+   self.highlightColor = Colors.ORANGE
+
+  def slow(self) -> None:
+   """Set highlightFrames to slow"""
+   self.highlightFrames = ChipInstance.SLOWHIGHLIGHT
+   self.highlightColor = Colors.YELLOW
+
+  def set_speed(self, highlightFrames : int) -> None:
+    """Set the variant highlighted for a given number of frames"""
+    if highlightFrames == ChipInstance.FASTHIGHLIGHT:
+      self.fast()
+    elif highlightFrames == ChipInstance.SLOWHIGHLIGHT:
+      self.slow()
+    else:
+      self.standard()
+
+  @property
+  def id(self) -> int:
+    """Return id of the shared chip"""
+    return self._chip.id
+
+  def get_chip(self) -> Chip:
+    """Return the shared chip definition"""
+    return self._chip
+
+  def get_asset(self):
+    """Return shared chip asset, copy before transforming"""
+    return self._chip.get_asset()
+  
+  def get_area_matrix(self) -> list:
+    """Return chip areaMatrix"""
+    return self._chip.get_area_matrix()
+  
+  def get_inverted_matrix(self) -> list:
+    """Return chip invertedMatrix"""
+    return self._chip.get_inverted_matrix()
+
+  def get_area_mask(self) -> int:
+    """Return chip areaMatrix as a side mask"""
+    return self._chip.get_area_mask()
+
+
 class Folder:
   def __init__(self, chips : list):
     self._chips = chips
   
-  def shuffle(self) -> None:
-    """Shuffle chips list"""
+  def shuffle(self, rng=random) -> None:
+    """Shuffle chips list with a given random number generator"""
     swaps = len(self._chips) * 2
     maxIndex = len(self._chips) - 1
     for i in range(swaps):
-      index1 = randint(0, maxIndex)
-      index2 = randint(0, maxIndex)
+      index1 = rng.randint(0, maxIndex)
+      index2 = rng.randint(0, maxIndex)
       while index1 == index2:
-        index2 = randint(0, maxIndex)
+        index2 = rng.randint(0, maxIndex)
       self._swap(index1, index2)
   
   def _swap(self, index1 : int, index2 : int) -> None:
@@ -77,8 +126,16 @@ class Folder:
     self._chips[index1] = chip2
     self._chips[index2] = chip1
   
-  def draw(self) -> Chip:
+  def draw(self) -> ChipInstance:
     """Return chip at index 0 and place it at index -1"""
     chip = self._chips.pop(0)
     self._chips.append(chip)
     return chip
+
+  def snapshot(self) -> tuple:
+    """Return the order of the chips"""
+    return tuple(self._chips)
+
+  def restore(self, snapshot : tuple) -> None:
+    """Put the chips back in an order returned by snapshot"""
+    self._chips[:] = snapshot
@@ -0,0 +1,20 @@
+class Colors:
+  RED = (255, 0, 0)
+  GREEN = (0, 255, 0)
+  BLUE = (0, 0, 255)
+  YELLOW = (255, 255, 0)
+  ORANGE = (255, 128, 0)
+  PURPLE = (255, 0, 255)
+  BROWN = (88, 57, 39)
+  PERSIANGREEN = (0, 143, 122)
+  KOBE = (136, 45, 23)
+  PINK = (255, 192, 203)
+  WHITE = (255, 255, 255)
+  BLACK = (0, 0, 0)
+  GREY = (125, 125, 125)
+  PANELGREY = (150, 150, 150)
+  LIGHTGREY = (200, 200, 200)
+  DARKPURPLE = (15, 10, 15)
+  DARKRED = (80, 25, 25)
+  DARKBLUE = (25, 25, 80)
+  MDPURPLE = (60, 40, 60)
@@ -0,0 +1,379 @@
+import random
+from common.player import Player, Bot
+from common.containers import Chain, Timeline, SIDECOLS
+from common.trace import traced
+from common.statehash import StateHash, HashedState
+from common.chip_library import ChipLibrary
+
+# Game rules, kept free of windows and assets so matches can also run headless
+
+FOLDERSIZE = 15 # chips in a folder
+P1COLUMNS = (0, 2) # stage columns P1 may stand on
+P2COLUMNS = (3, 5) # stage columns P2 may stand on
+P2START = (1, 4) # P2's stage position at the start of a game
+
+def random_folder(rng=random) -> list:
+  """Return the ids of a folder of different chips picked with a given random number generator"""
+  ids = []
+  chipCount = ChipLibrary.count()
+  while len(ids) < FOLDERSIZE:
+    id = rng.randint(0, chipCount-1)
+    if id not in ids:
+      ids.append(id)
+  return ids
+
+###################################################################################
+#                                Player Manager                                   #
+###################################################################################
+
+class PlayerManager:
+  def __init__(self, player : Player, colRange : tuple):
+    self._colMin, self._colMax = colRange
+    self.player = player
+    self.events = {
+      "HPZERO" : False
+    }
+  
+  def move_player(self, panelMatrix : list, windowSize : tuple, movement : tuple) -> None:
+    """Move player according to a given movemnet vector"""
+    stagePosition = self._update_stage_position(movement)
+    self._update_asset_position(panelMatrix, windowSize, stagePosition)
+
+  def move_stage(self, movement : tuple) -> tuple:
+    """Move player on the stage only, return the new stage position"""
+    return self._update_stage_position(movement)
+
+  def place_asset(self, panelMatrix : list, windowSize : tuple) -> None:
+    """Move player asset to its stage position"""
+    self._update_asset_position(panelMatrix, windowSize, self.player.get_stage_position())
+
+  def _update_stage_position(self, movement : tuple) -> tuple:
+    """Update players stage position"""
+    x, y = self.player.get_stage_position()
+    col = y+movement[1]
+    row = x+movement[0]
+    if col < self._colMin  or col > self._colMax:
+        col = y
+    if row < 0  or row > 2:
+        row = x
+    if (row, col) != (x, y):
+      self.player.move((row, col))
+    return row, col
+
+  def _update_asset_position(self, panelMatrix : list, windowSize : tuple, stagePosition : tuple) -> None:
+    """Update player asset according to stage position"""
+    row, col = stagePosition
+    panelX, panelY = panelMatrix[col][row]
+    width, height = windowSize
+    assetX = panelX - (width // 12)
+    assetY = panelY - (height // 4)
+    self.player.move_asset((assetX, assetY))
+
+  def damage_player(self) -> None:
+    """Damage player"""
+    self.player.damage()
+    if self.player.get_health() <= 0:
+        self.events["HPZERO"] = True
+
+  def snapshot(self) -> tuple:
+    """Return the player state and events"""
+    return (self.player.snapshot(), self.events["HPZERO"])
+
+  def restore(self, snapshot : tuple) -> None:
+    """Set the state returned by snapshot"""
+    playerState, self.events["HPZERO"] = snapshot
+    self.player.restore(playerState)
+
+###################################################################################
+#                                Combat Manager                                   #
+###################################################################################
+
+HITCOOLDOWN = 20
+SWITCH = 10
+
+class CombatManager(HashedState):
+  HASHED = ("_switchCounter", "_chainIndex", "_p1HitCounter", "_p2HitCounter", "events")
+
+  def __init__(self):
+    self._switchCounter = 0
+    self._chainIndex = 0
+    self._p1Order = Chain()
+    self._p2Order = Chain()
+    self._timeline = Timeline(Chain(), Chain())
+    self._highlightMask = 0 # stage mask of panels highlighted on the stage
+    self._hitMask = 0 # stage mask of panels hit on the stage
+    self._p1HitCounter = HITCOOLDOWN
+    self._p2HitCounter = HITCOOLDOWN
+    self.events = {
+      "ACTIVE" : False,
+      "P1READY" : False,
+      "P2READY" : False,
+      "HIGHLIGHT" : True,
+      "HIT" : False,
+      "P1HIT" : False,
+      "P2HIT" : False,
+      "P1VULNERABLE" : True,
+      "P2VULNERABLE" : True
+    }
+  
+  def load_p1_chip_order(self, chipOrder : list) -> None:
+    """Set p1 chip order for next round"""
+    self._p1Order = self._order_to_chain(chipOrder)
+    self.events["P1READY"] = True
+  
+  def load_p2_chip_order(self, chipOrder : list) -> None:
+    """Set p2 chip order for next round"""
+    self._p2Order = self._order_to_chain(chipOrder)
+    self.events["P2READY"] = True
+
+  def _order_to_chain(self, chipOrder : list) -> Chain:
+    """Convert a list of chips to a chain of area masks"""
+    return Chain((chip.get_area_mask(), chip.highlightFrames) for chip in chipOrder)
+
+  def initialize_combat(self) -> None:
+    """Set state for new round of combat"""
+    if not self.events["ACTIVE"]:
+      self._timeline = Timeline(self._p1Order, self._p2Order)
+      self._chainIndex = 0
+      self.events["HIGHLIGHT"] = True
+      self.events["HIT"] = False
+      self.events["P1HIT"] = False
+      self.events["P2HIT"] = False
+      self.events["P1VULNERABLE"] = True
+      self.events["P2VULNERABLE"] = True
+      self.events["ACTIVE"] = True
+
+  @traced("CombatManager.combat", lambda self, *args: {"phase" : self.phase()})
+  def combat(self, p1Manager : PlayerManager, p2Manager : PlayerManager) -> None:
+    """Update the combat state"""
+    if self.events["HIGHLIGHT"]:
+      self._highlight(p1Manager, p2Manager)
+      self._chainIndex += 1
+    if self.events["HIT"] and self._switchCounter >= SWITCH:
+      self._hit(p1Manager, p2Manager)
+      self._chainIndex += 1
+    self._switchCounter += 1
+  
+  def snapshot(self) -> tuple:
+    """Return counters, masks, chip orders and events as a flat tuple"""
+    # Chains and timelines are replaced, never modified, so they are kept by reference
+    return (self._switchCounter, self._chainIndex, self._p1HitCounter, self._p2HitCounter,
+            self._highlightMask, self._hitMask, self._p1Order, self._p2Order, self._timeline,
+            tuple(self.events.values()))
+
+  def restore(self, snapshot : tuple) -> None:
+    """Set the state returned by snapshot"""
+    (self._switchCounter, self._chainIndex, self._p1HitCounter, self._p2HitCounter,
+     self._highlightMask, self._hitMask, self._p1Order, self._p2Order, self._timeline, events) = snapshot
+    for key, value in zip(self.events, events):
+      self.events[key] = value
+
+  def stage_masks(self) -> tuple:
+    """Return the stage masks of highlighted and hit panels"""
+    return self._highlightMask, self._hitMask
+
+  def hit_tick(self) -> int:
+    """Return the timeline tick whose panels were hit last"""
+    return self._chainIndex - 1
+
+  def phase(self) -> str:
+    """Return the current combat phase, highlight or hit, or None outside combat"""
+    if not self.events["ACTIVE"]:
+      return None
+    if self.events["HIGHLIGHT"]:
+      return "highlight"
+    return "hit"
+
+  def _highlight(self, p1Manager : PlayerManager, p2Manager : PlayerManager) -> None:
+    """Highlight next chips in chip order"""
+    if self._chainIndex < len(self._timeline):
+      self._highlightMask = self._timeline.stage_mask(self._chainIndex)
+    else:
+      self._chainIndex = 0
+      self._switchCounter = 0
+      self.events["HIGHLIGHT"] = False
+      self.events["HIT"] = True
+      self._clear_highlight()
+      if isinstance(p1Manager.player, Bot):
+        p1Manager.player.hitOrder = self._timeline.p1_chain()
+        p1Manager.player.analyze()
+      if isinstance(p2Manager.player, Bot):
+        p2Manager.player.hitOrder = self._timeline.p2_chain()
+        p2Manager.player.analyze()
+  
+  def _hit(self, p1Manager : PlayerManager, p2Manager : PlayerManager) -> None:
+    """Hit next chip in chip order"""
+    if self._chainIndex < len(self._timeline):
+      self._hitMask = self._timeline.stage_mask(self._chainIndex)
+      self._update_vulnerability()
+      self._check_for_hit(p1Manager, p2Manager)
+    else:
+      self._chainIndex = 0
+      self.events["HIGHLIGHT"] = True
+      self.events["HIT"] = False
+      self.events["P1READY"] = False
+      self.events["P2READY"] = False
+      self.events["ACTIVE"] = False
+      self._clear_highlight()
+  
+  def _clear_highlight(self) -> None:
+    """Clear all highlighted and hit panels"""
+    self._highlightMask = 0
+    self._hitMask = 0
+
+  def _update_vulnerability(self) -> None:
+    """Mark players as vulnerable of hit cooldown"""
+    if self._p1HitCounter >= HITCOOLDOWN:
+      self.events["P1VULNERABLE"] = True
+    if self._p2HitCounter >= HITCOOLDOWN:
+      self.events["P2VULNERABLE"] = True
+  
+  def _check_for_hit(self, p1Manager : PlayerManager, p2Manager : PlayerManager) -> None:
+    """Detrmine if a playeer ahs been hit"""
+    row, col = p1Manager.player.get_stage_position()
+    if self._timeline.p1_mask(self._chainIndex) >> (row*SIDECOLS + col) & 1 and self.events["P1VULNERABLE"]:
+      self.events["P1HIT"] = True
+      self.events["P1VULNERABLE"] = False
+      self._p1HitCounter = -1
+    row, col = p2Manager.player.get_stage_position()
+    if self._timeline.p2_mask(self._chainIndex) >> (row*SIDECOLS + col-SIDECOLS) & 1 and self.events["P2VULNERABLE"]:
+      self.events["P2HIT"] = True
+      self.events["P2VULNERABLE"] = False
+      self._p2HitCounter = -1
+    self._p1HitCounter += 1
+    self._p2HitCounter += 1
+
+
+###################################################################################
+#                                     Match                                       #
+###################################################################################
+
+class Match:
+  """One game between P1 and P2, either of whom may be a Bot, advanced a tick at a time"""
+  def __init__(self, player1 : Player, player2 : Player):
+    player2.move(P2START)
+    p1Manager = PlayerManager(player1, P1COLUMNS)
+    p2Manager = PlayerManager(player2, P2COLUMNS)
+    self.p1Manager = p1Manager
+    self.p2Manager = p2Manager
+    self.combatManager = CombatManager()
+    self.stateHash = StateHash() # kept up to date as the match changes
+    self.combatManager.attach_hash(self.stateHash, 0)
+    player1.attach_hash(self.stateHash, 1)
+    player2.attach_hash(self.stateHash, 2)
+    self._managers = {"P1" : p1Manager, "P2" : p2Manager}
+    self._onStage = {"P1" : False, "P2" : False} # players who confirmed chips and may move
+    self._roundPlayed = False # combat ran since chips were last chosen
+    self._dodgeCounter = 0
+    self.events = {
+      "MOVED" : False, # the bot moved during the last tick
+      "DAMAGED" : False, # a player was hit during the last tick
+      "ROUNDOVER" : False, # the last tick ended a round, chips are chosen next
+      "GAMEOVER" : False # a player has no health left
+    }
+
+  def confirm(self, key : str, chipOrder : list) -> None:
+    """Load the chip order a player confirmed for the next round and put them on the stage"""
+    if key == "P1":
+      self.combatManager.load_p1_chip_order(chipOrder)
+    else:
+      self.combatManager.load_p2_chip_order(chipOrder)
+    self._onStage[key] = True
+
+  def on_stage(self, key : str) -> bool:
+    """Return true if the player at a given key may move"""
+    return self._onStage[key]
+
+  def move(self, key : str, movement : tuple) -> bool:
+    """Move the player at a given key by a movement vector, return False if they may not move"""
+    if not self._onStage[key] or self.events["GAMEOVER"]:
+      return False
+    self._managers[key].move_stage(movement)
+    return True
+
+  def tick(self) -> None:
+    """Advance the bot and combat by one tick"""
+    self.events["MOVED"] = False
+    self.events["DAMAGED"] = False
+    self.events["ROUNDOVER"] = False
+    if self.events["GAMEOVER"]:
+      return
+    combatEvents = self.combatManager.events
+    p1Bot = self._bot("P1")
+    p2Bot = self._bot("P2")
+    if p1Bot is not None and not self._onStage["P1"]:
+      self.confirm("P1", p1Bot.select_chips())
+    if p2Bot is not None and combatEvents["P1READY"] and not combatEvents["P2READY"]:
+      self.confirm("P2", p2Bot.select_chips())
+
+    if combatEvents["P1READY"] and combatEvents["P2READY"]:
+      if p1Bot is not None or p2Bot is not None:
+        p1Movement, p2Movement = self._bot_movements(p1Bot, p2Bot)
+        if p1Bot is not None:
+          self.move("P1", p1Movement)
+        if p2Bot is not None:
+          self.events["MOVED"] = self.move("P2", p2Movement)
+      self.combatManager.initialize_combat()
+      self.combatManager.combat(self.p1Manager, self.p2Manager)
+      self._roundPlayed = True
+      if combatEvents["P1HIT"]:
+        self.p1Manager.damage_player()
+        self.events["DAMAGED"] = True
+        combatEvents["P1HIT"] = False
+      if combatEvents["P2HIT"]:
+        self.p2Manager.damage_player()
+        self.events["DAMAGED"] = True
+        combatEvents["P2HIT"] = False
+      if self.winner() is not None:
+        self.events["GAMEOVER"] = True
+    elif self._roundPlayed:
+      self._roundPlayed = False
+      self._onStage["P1"] = False
+      self._onStage["P2"] = False
+      self.events["ROUNDOVER"] = True
+
+  def snapshot(self) -> tuple:
+    """Return everything a tick may change, cheap to take every tick"""
+    return (self.p1Manager.snapshot(), self.p2Manager.snapshot(), self.combatManager.snapshot(),
+            self._onStage["P1"], self._onStage["P2"], self._roundPlayed, self._dodgeCounter,
+            tuple(self.events.values()))
+
+  def restore(self, snapshot : tuple) -> None:
+    """Return the match to the tick a snapshot was taken at"""
+    (p1State, p2State, combatState, self._onStage["P1"], self._onStage["P2"],
+     self._roundPlayed, self._dodgeCounter, events) = snapshot
+    self.p1Manager.restore(p1State)
+    self.p2Manager.restore(p2State)
+    self.combatManager.restore(combatState)
+    for key, value in zip(self.events, events):
+      self.events[key] = value
+
+  def state_hash(self) -> int:
+    """Return the 64-bit hash of positions, health, combat counters and flags and the bot's random state"""
+    return self.stateHash.value
+
+  def winner(self) -> str:
+    """Return the key of the player who won, None while both have health"""
+    if self.p1Manager.events["HPZERO"]:
+      return "P2"
+    if self.p2Manager.events["HPZERO"]:
+      return "P1"
+    return None
+
+  def _bot(self, key : str) -> Bot:
+    """Return the player at a given key if it is a Bot"""
+    player = self._managers[key].player
+    if isinstance(player, Bot):
+      return player
+    return None
+
+  def _bot_movements(self, p1Bot : Bot, p2Bot : Bot) -> tuple:
+    """Return each bot's movement, None for players, idling while chips are highlighted and dodging once they hit"""
+    bots = (p1Bot, p2Bot)
+    if self.combatManager.events["HIGHLIGHT"]:
+      self._dodgeCounter = 0
+      return tuple(bot.idle() if bot is not None else None for bot in bots)
+    if self._dodgeCounter > SWITCH-3:
+      return tuple(bot.dodge() if bot is not None else None for bot in bots)
+    self._dodgeCounter += 1
+    return ((0, 0), (0, 0))
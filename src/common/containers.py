@@ -1,3 +1,6 @@
+from collections import OrderedDict
+from bisect import bisect_right
+
 ROWS = 3
 COLS = 6
 
@@ -33,65 +36,189 @@ class Matrix:
     return len(self._matrix)
 
 
-class Chain:
-  def __init__(self):
-    self._matrixList = []
-  
-  def append(self, matrix : Matrix) -> None:
-    self._matrixList.append(matrix)
+class LRUCache:
+  def __init__(self, capacity : int):
+    self._capacity = capacity
+    self._entries = OrderedDict()
 
-  def clear(self) -> None:
-    self._matrixList.clear()
+  def get(self, key, default=None):
+    """Return the value at key and mark it most recently used"""
+    if key not in self._entries:
+      return default
+    self._entries.move_to_end(key)
+    return self._entries[key]
 
-  def pop(self, index : int) -> Matrix:
-    return self._matrixList.pop(index)
+  def put(self, key, value) -> None:
+    """Store value at key, evicting the least recently used beyond capacity"""
+    self._entries[key] = value
+    self._entries.move_to_end(key)
+    while len(self._entries) > self._capacity:
+      self._entries.popitem(last=False)
 
-  def __getitem__(self, key : int) -> Matrix:
-    return self._matrixList[key]
-  
-  def __str__(self) -> str:
-    string = "[\n"
-    for matrix in self._matrixList:
-      string += str(matrix) + ",\n"
-    string += "]"
-    return string
+  def clear(self) -> None:
+    self._entries.clear()
+
+  def __contains__(self, key) -> bool:
+    return key in self._entries
 
   def __len__(self) -> int:
-    return len(self._matrixList)
+    return len(self._entries)
+
+
+###################################################################
+#                         Panel Masks                             #
+###################################################################
+
+SIDECOLS = COLS // 2 # columns on each player's side of the stage
+
+def matrix_to_mask(matrix, width : int = SIDECOLS) -> int:
+  """Return an int with bit row*width+col set for each true panel of a matrix"""
+  mask = 0
+  for row in range(len(matrix)):
+    for col in range(len(matrix[row])):
+      if matrix[row][col]:
+        mask |= 1 << (row*width + col)
+  return mask
+
+def _spread(sideMask : int) -> int:
+  """Return a side mask moved onto the left side of a stage mask"""
+  mask = 0
+  for row in range(ROWS):
+    rowBits = (sideMask >> (row*SIDECOLS)) & ((1 << SIDECOLS) - 1)
+    mask |= rowBits << (row*COLS)
+  return mask
+
+# Stage masks of the left side for every side mask
+SPREAD = [_spread(sideMask) for sideMask in range(1 << (ROWS*SIDECOLS))]
 
-class ParallelChains:
-  def __init__(self):
-    self._chainDict = {}
 
-  def add_chain(self, key, chain : Chain) -> None:
-    """Add chain at key if key not already used"""
-    if not key in self._chainDict.keys():
-      self._chainDict[key] = chain
+def stage_mask(p1Mask : int, p2Mask : int) -> int:
+  """Return the stage mask of a side mask on each side"""
+  return SPREAD[p1Mask] | SPREAD[p2Mask] << SIDECOLS
+
+
+class Chain:
+  """Side masks by tick, stored as runs of (mask, ticks)"""
+  def __init__(self, segments : list = ()):
+    self._masks = [] # mask of each run
+    self._ends = [] # tick after each run, the prefix sums of run lengths
+    self._cursor = 0 # run found by the last lookup
+    for mask, ticks in segments:
+      self.append(mask, ticks)
+
+  def append(self, mask : int, ticks : int = 1) -> None:
+    """Append a mask lasting a number of ticks"""
+    if ticks <= 0:
+      return
+    if len(self._masks) > 0 and self._masks[-1] == mask:
+      self._ends[-1] += ticks
+    else:
+      self._masks.append(mask)
+      self._ends.append(len(self) + ticks)
 
   def clear(self) -> None:
-    self._chainDict.clear()
-
-  def merge(self, index : int) -> Matrix:
-    mergedMatrix = Matrix([])
-    for row in range(ROWS):
-      mergedRow = []
-      for key in self.keys():
-        mergedRow += self._chainDict[key][index][row]
-      mergedMatrix.append(mergedRow)
-    return mergedMatrix
-
-  def __len__(self):
-    if len(self.keys()) == 0:
+    self._masks.clear()
+    self._ends.clear()
+    self._cursor = 0
+
+  def segments(self):
+    """Iterate (mask, ticks) of each run"""
+    start = 0
+    for mask, end in zip(self._masks, self._ends):
+      yield mask, end - start
+      start = end
+
+  def segment_index(self, tick : int) -> int:
+    """Return the index of the run holding a tick"""
+    if not 0 <= tick < len(self):
+      raise IndexError("chain index out of range")
+    cursor = self._cursor
+    start = self._ends[cursor-1] if cursor > 0 else 0
+    if not start <= tick < self._ends[cursor]:
+      cursor = bisect_right(self._ends, tick)
+      self._cursor = cursor
+    return cursor
+
+  def padded(self, length : int):
+    """Return the chain extended with empty masks to a number of ticks, itself if already long enough"""
+    if len(self) >= length:
+      return self
+    chain = Chain(self.segments())
+    chain.append(0, length - len(self))
+    return chain
+
+  def zip(self, other, combine):
+    """Return a chain of combine(mask, otherMask) at each tick, the shorter chain padded with empty masks"""
+    length = max(len(self), len(other))
+    left = self.padded(length)
+    right = other.padded(length)
+    chain = Chain()
+    i = j = start = 0
+    while start < length:
+      end = min(left._ends[i], right._ends[j])
+      chain.append(combine(left._masks[i], right._masks[j]), end - start)
+      if left._ends[i] == end:
+        i += 1
+      if right._ends[j] == end:
+        j += 1
+      start = end
+    return chain
+
+  def __add__(self, other):
+    chain = Chain(self.segments())
+    for mask, ticks in other.segments():
+      chain.append(mask, ticks)
+    return chain
+
+  def __getitem__(self, tick : int) -> int:
+    return self._masks[self.segment_index(tick)]
+
+  def __iter__(self):
+    for mask, ticks in self.segments():
+      for tick in range(ticks):
+        yield mask
+
+  def __str__(self) -> str:
+    return "[" + ", ".join("%s x %d" % (bin(mask), ticks) for mask, ticks in self.segments()) + "]"
+
+  def __len__(self) -> int:
+    if len(self._ends) == 0:
       return 0
-    firstChainKey = tuple(self.keys())[0]
-    length = len(self._chainDict[firstChainKey])
-    return length
+    return self._ends[-1]
 
-  def __getitem__(self, key) -> Chain:
-    return self._chainDict[key]
 
-  def __setitem__(self, key, chain : Chain) -> None:
-    self._chainDict[key] = chain
+class Timeline:
+  """Panels hit on each side of the stage at every tick of a round, compiled once"""
+  def __init__(self, p1Order : Chain, p2Order : Chain):
+    # Each player's chips land on the other player's side
+    length = max(len(p1Order), len(p2Order))
+    self._p1Chain = p2Order.padded(length)
+    self._p2Chain = p1Order.padded(length)
+    self._stageChain = self._p1Chain.zip(self._p2Chain, stage_mask)
 
-  def keys(self):
-    return self._chainDict.keys()
\ No newline at end of file
+  def p1_mask(self, tick : int) -> int:
+    """Return the side mask of panels hit on P1's side at a tick"""
+    return self._p1Chain[tick]
+
+  def p2_mask(self, tick : int) -> int:
+    """Return the side mask of panels hit on P2's side at a tick"""
+    return self._p2Chain[tick]
+
+  def stage_mask(self, tick : int) -> int:
+    """Return the stage mask of panels hit on both sides at a tick"""
+    return self._stageChain[tick]
+
+  def p1_chain(self) -> Chain:
+    """Return the side masks of P1's side, shared so do not modify"""
+    return self._p1Chain
+
+  def p2_chain(self) -> Chain:
+    """Return the side masks of P2's side, shared so do not modify"""
+    return self._p2Chain
+
+  def orders(self) -> tuple:
+    """Return the chip orders of P1 and P2 padded to the timeline's length, which compile to the same timeline"""
+    return self._p2Chain, self._p1Chain
+
+  def __len__(self) -> int:
+    return len(self._stageChain)
@@ -1,8 +1,11 @@
 from common.user_interface import Environment
 from common.asset_handler import AssetHandler
 from common.graphics import *
+from common.settings import Settings
 
 class BackgroundEnvironment(Environment):
+  LAYOUTCACHE = 4
+
   def __init__(self, windowSize : tuple):
     super().__init__()
     self._build_assets(windowSize)
@@ -11,6 +14,10 @@ class BackgroundEnvironment(Environment):
     """Build all environment assets"""
     self._build_background(windowSize)
 
+  def plays_animations(self) -> bool:
+    """Return true unless background animation is turned off to save time"""
+    return Settings.BACKGROUNDANIMATION
+
   ###################################################################
   #                     Background Builders                         #
   ###################################################################
@@ -36,6 +43,8 @@ class BackgroundEnvironment(Environment):
 
 
 class GameOverEnvironment(Environment):
+  LAYOUTCACHE = 4
+
   def __init__(self, windowSize : tuple):
     super().__init__()
     self._build_assets(windowSize)
@@ -52,6 +61,8 @@ class GameOverEnvironment(Environment):
 
 
 class VictoryEnvironment(Environment):
+  LAYOUTCACHE = 4
+
   def __init__(self, windowSize : tuple):
     super().__init__()
     self._build_assets(windowSize)
@@ -68,6 +79,8 @@ class VictoryEnvironment(Environment):
 
 
 class StageEnvironment(Environment):
+  LAYOUTCACHE = 4
+
   def __init__(self, windowSize : tuple):
     super().__init__()
     self._build_assets(windowSize)
@@ -131,4 +144,37 @@ class StageEnvironment(Environment):
 
       # Color asset
       AssetHandler.color(side, color, "border")
-      self._assets.append(side)
\ No newline at end of file
+      self._assets.append(side)
+
+class LoadingEnvironment(Environment):
+  def __init__(self, windowSize : tuple):
+    super().__init__()
+    self._progress = 0
+    self._build_assets(windowSize)
+
+  def set_progress(self, progress : float, windowSize : tuple) -> None:
+    """Show a given fraction of loading as complete"""
+    self._progress = progress
+    self.resize(windowSize)
+  
+  def _build_assets(self, windowSize : tuple) -> None:
+    self._build_text(windowSize)
+    self._build_bar(windowSize)
+  
+  def _build_text(self, windowSize : tuple) -> None:
+    textWidth, textHeight = self._relative_size(1, 12, windowSize)
+    xCenter = windowSize[0] // 2
+    yCenter = windowSize[1] // 2 - textHeight
+    loadingText = Text(xCenter, yCenter, "Loading", textHeight, Colors.WHITE)
+    self._assets.append(loadingText)
+
+  def _build_bar(self, windowSize : tuple) -> None:
+    """Build progress bar from plain shapes since no assets are loaded yet"""
+    barWidth, barHeight = self._relative_size(2, 24, windowSize)
+    x = windowSize[0] // 4
+    y = windowSize[1] // 2
+    fillWidth = barWidth * self._progress
+    fill = Shape(((x, y), (x+fillWidth, y), (x+fillWidth, y+barHeight), (x, y+barHeight)), Colors.PERSIANGREEN)
+    border = Shape(((x, y), (x+barWidth, y), (x+barWidth, y+barHeight), (x, y+barHeight)), Colors.WHITE, 2)
+    self._assets.append(fill)
+    self._assets.append(border)
@@ -9,4 +9,17 @@ class FileHandler:
     elif __file__:
       filePath = os.path.dirname(__file__)
     filePath = os.path.join(filePath, fileName)
-    return filePath
\ No newline at end of file
+    return filePath
+
+  @staticmethod
+  def get_user_cache_path(fileName):
+    """Location of files written while playing, kept out of the installed game"""
+    if sys.platform == "win32":
+      cachePath = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+      cachePath = os.path.expanduser("~/Library/Caches")
+    else:
+      cachePath = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    cachePath = os.path.join(cachePath, "ChainStrike")
+    os.makedirs(cachePath, exist_ok=True)
+    return os.path.join(cachePath, fileName)
\ No newline at end of file
@@ -1,46 +1,169 @@
 import pygame
+import logging
+from time import perf_counter
 from common.managers import EventManager
+from common.loader import Loader
+from common.startup import StartupTimer
+from common.settings import Settings
+from common.quality import QualityController
+from common.watchdog import FrameWatchdog
+from common.file_handler import FileHandler
+from common.trace import Tracer
+from common.netplay import LockstepPeer
+from common.broadcast import Broadcast
+
+logger = logging.getLogger(__name__)
 
 FRAMERATE = 50 # 1000 // FRAMERATE = FPS
 
 class ChainStrike:
   @staticmethod
-  def go():
+  def go(timing : bool = False):
+    if Settings.TRACEFILE is not None:
+      Tracer.start()
+    peer = ChainStrike.connect()
+    broadcast = ChainStrike.broadcast()
     pygame.init()
-    eventManager = EventManager()
+    eventManager = EventManager(peer, broadcast)
+    loader = Loader(eventManager.loading_steps())
+    loader.start()
+    eventManager.refresh()
+    StartupTimer.mark("first frame")
+
+    quality = None
+    if Settings.ADAPTIVEQUALITY:
+      quality = QualityController(FRAMERATE / 1000, eventManager.rebuild)
+
+    # report what the loop was doing whenever handling an event runs long
+    watchdog = None
+    if Settings.WATCHDOGTHRESHOLD > 0:
+      logPath = Settings.WATCHDOGLOG or FileHandler.get_user_cache_path("slow_frames.log")
+      watchdog = FrameWatchdog(Settings.WATCHDOGTHRESHOLD / 1000, logPath)
+      watchdog.start()
 
     resetCounter = 0
     resetTimer = 20
+
+    # wait for resize events to settle before rebuilding layouts
+    resizePending = False
+    resizeCounter = 0
+    resizeTimer = 2
   
     i = 0
 
     # set frame rate
     REFRESH = pygame.USEREVENT + 1
     pygame.time.set_timer(REFRESH, FRAMERATE)
+    idle = False
     running = True
     while running:
-      for event in pygame.event.get():
+      if idle:
+        # Nothing can change until the next input, so stop refreshing until it arrives
+        pygame.time.set_timer(REFRESH, 0)
+      # Sleep until the next refresh or input instead of polling
+      events = [pygame.event.wait()] + pygame.event.get()
+      if idle:
+        pygame.time.set_timer(REFRESH, FRAMERATE)
+        idle = False
+      for event in events:
+        label = "REFRESH" if event.type == REFRESH else pygame.event.event_name(event.type)
         if event.type == REFRESH:
-          if eventManager.RESET:
-            if resetCounter >= resetTimer:
-              eventManager.reset()
-              resetCounter = 0
-            else:
-              resetCounter += 1
-          eventManager.event_scan()
-          eventManager.refresh()
-        elif event.type == pygame.MOUSEBUTTONDOWN:
-          eventManager.click(pygame.mouse.get_pos())
-        elif event.type == pygame.KEYDOWN:
-          eventManager.key_press(event.key)
-          if event.key == pygame.K_0:
-            pygame.image.save(eventManager._environmentManager._window.window, "image" + str(i) + ".png")
-            i += 1
-        elif event.type == pygame.KEYUP:
-          eventManager.key_release(event.key)
-        elif event.type == pygame.VIDEORESIZE:
-          eventManager.resize()
-        elif event.type == pygame.QUIT:
-          eventManager.quit()
-          running = False
-    pygame.quit()
\ No newline at end of file
+          Tracer.next_tick(eventManager.combat_phase())
+        if watchdog is not None:
+          watchdog.begin(label)
+        dispatchStart = perf_counter()
+        try:
+          if event.type != REFRESH:
+            # input may change the next frame
+            idle = False
+          if not eventManager.LOADED and event.type not in (REFRESH, pygame.VIDEORESIZE, pygame.QUIT):
+            continue
+          if event.type == REFRESH:
+            if resizePending:
+              if resizeCounter >= resizeTimer:
+                eventManager.resize()
+                resizePending = False
+              else:
+                resizeCounter += 1
+            if not eventManager.LOADED:
+              # Draw loading progress while environments come online
+              eventManager.loading_progress(loader.progress())
+              eventManager.refresh()
+              if loader.done():
+                loader.join()
+                eventManager.finish_loading()
+                StartupTimer.mark("loaded")
+                if timing:
+                  print(StartupTimer.report())
+              continue
+            if eventManager.RESET:
+              if resetCounter >= resetTimer:
+                eventManager.reset()
+                resetCounter = 0
+              else:
+                resetCounter += 1
+            frameStart = perf_counter()
+            eventManager.event_scan()
+            drawn = eventManager.refresh()
+            if quality is not None and drawn:
+              quality.record(perf_counter() - frameStart)
+            idle = eventManager.idle() and not resizePending
+          elif event.type == pygame.MOUSEBUTTONDOWN:
+            eventManager.click(pygame.mouse.get_pos())
+          elif event.type == pygame.KEYDOWN:
+            eventManager.key_press(event.key)
+            if event.key == pygame.K_0:
+              pygame.image.save(eventManager._environmentManager._window.window, "image" + str(i) + ".png")
+              i += 1
+          elif event.type == pygame.KEYUP:
+            eventManager.key_release(event.key)
+          elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            eventManager.redraw()
+          elif event.type == pygame.VIDEORESIZE:
+            resizePending = True
+            resizeCounter = 0
+          elif event.type == pygame.QUIT:
+            eventManager.quit()
+            running = False
+        finally:
+          Tracer.complete("dispatch " + label, dispatchStart)
+          if watchdog is not None:
+            watchdog.end()
+    pygame.quit()
+    if broadcast is not None:
+      broadcast.close()
+    if Tracer.enabled():
+      Tracer.write(Settings.TRACEFILE)
+
+  @staticmethod
+  def connect() -> LockstepPeer:
+    """Return a peer connected to the other player, None when playing the bot"""
+    try:
+      if Settings.NETHOST is not None:
+        peer = LockstepPeer.host(Settings.NETHOST, Settings.INPUTDELAY)
+        logger.info("waiting %d seconds for a player to join on port %d", Settings.NETTIMEOUT, Settings.NETHOST)
+      elif Settings.NETJOIN is not None:
+        peer = LockstepPeer.join(Settings.NETJOIN)
+        logger.info("joining %s:%d", *Settings.NETJOIN)
+      else:
+        return None
+    except OSError as error:
+      logger.warning("cannot open a UDP port, playing the bot: %s", error)
+      return None
+    if not peer.connect(Settings.NETTIMEOUT):
+      # As when a session closes, play the bot instead
+      logger.warning("no player answered within %d seconds, playing the bot", Settings.NETTIMEOUT)
+      peer.close()
+      return None
+    logger.info("connected as %s with input delay %d", peer.localKey, peer.delay)
+    return peer
+
+  @staticmethod
+  def broadcast() -> Broadcast:
+    """Return a started broadcast of the match to spectators, None when not broadcasting"""
+    if Settings.SPECTATEPORT is None:
+      return None
+    # The server logs the address spectators may connect to once it listens
+    broadcast = Broadcast(Settings.SPECTATEHOST, Settings.SPECTATEPORT)
+    broadcast.start()
+    return broadcast
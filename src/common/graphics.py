@@ -1,26 +1,6 @@
 import pygame
-
-class Colors:
-  RED = (255, 0, 0)
-  GREEN = (0, 255, 0)
-  BLUE = (0, 0, 255)
-  YELLOW = (255, 255, 0)
-  ORANGE = (255, 128, 0)
-  PURPLE = (255, 0, 255)
-  BROWN = (88, 57, 39)
-  PERSIANGREEN = (0, 143, 122)
-  KOBE = (136, 45, 23)
-  PINK = (255, 192, 203)
-  WHITE = (255, 255, 255)
-  BLACK = (0, 0, 0)
-  GREY = (125, 125, 125)
-  PANELGREY = (150, 150, 150)
-  LIGHTGREY = (200, 200, 200)
-  DARKPURPLE = (15, 10, 15)
-  DARKRED = (80, 25, 25)
-  DARKBLUE = (25, 25, 80)
-  MDPURPLE = (60, 40, 60)
-
+from common.settings import Settings
+from common.colors import Colors
 
 class Asset:
   def __init__(self, id):
@@ -36,38 +16,75 @@ class Text(Asset):
   def __init__(self, x : int, y : int, text : str = "", size : int = 12, color : tuple = Colors.BLACK, antialias : bool = True, font=None):
     super().__init__(text)
     pyFont = pygame.font.Font(font, size)
-    self.text = pyFont.render(text, antialias, color)
+    self.text = pyFont.render(text, antialias and Settings.TEXTANTIALIAS, color)
     self.text_box = self.text.get_rect(center=(x, y))
 
 
 class Shape(Asset):
-  def __init__(self, vertices : tuple = ((0,0), (0,0)), color : tuple = (0,0,0), width : int = 0, id=None):
+  def __init__(self, vertices : tuple = ((0,0), (0,0)), color : tuple = (0,0,0), width : int = 0, id=None, bounds : tuple = None):
     super().__init__(id)
     self.vertices = vertices
     self.color = color
     self.width = width
+    self.bounds = bounds # (xMin, yMin, xMax, yMax), found on first use if not given
+  
+  def get_bounds(self) -> tuple:
+    """Return the corners of the box around the shape"""
+    if self.bounds is None:
+      xs = [point[0] for point in self.vertices]
+      ys = [point[1] for point in self.vertices]
+      self.bounds = (min(xs), min(ys), max(xs), max(ys))
+    return self.bounds
   
   def to_tuple(self) -> tuple:
     return self.color, self.vertices, self.width
 
 
 class Collage(Asset):
-  def __init__(self,shapes : list = [], id=None):
+  def __init__(self,shapes : list = [], id=None, components : dict = None):
     super().__init__(id)
     self.shapes = shapes
+    self._components = components # shape indices by id, built on first use
+    self.lods = [] # (scale, Collage) variants with less detail, largest scale first
+    self.drawnScale = 1 # screen pixels per unit the collage was authored in
+  
+  def level_of_detail(self):
+    """Return the least detailed variant that looks the same at the drawn scale"""
+    collage = self
+    for scale, lod in self.lods:
+      if self.detail_scale() <= scale:
+        collage = lod
+    return collage
+
+  def detail_scale(self) -> float:
+    """Return the drawn scale used to pick a level of detail"""
+    return self.drawnScale * Settings.LODBIAS
   
   def get_component(self, component_id) -> list:
     """Return list of indices of component shapes"""
-    component = []
-    for i in range(len(self.shapes)):
-      if self.shapes[i].id == component_id:
-        component.append(i)
-    return component
+    return self.components().get(component_id, [])
+
+  def components(self) -> dict:
+    """Return lists of shape indices by component id, shared so do not modify"""
+    if self._components is None:
+      self._components = {}
+      for i in range(len(self.shapes)):
+        self._components.setdefault(self.shapes[i].id, []).append(i)
+    return self._components
   
   def update_shape(self, newShape : Shape, index : int) -> None:
     """Change the shape at a given index to a given new shape"""
+    if newShape.id != self.shapes[index].id:
+      self._components = None
     self.shapes[index] = newShape
 
+  def remove_shape(self, index : int) -> None:
+    """Remove the shape at a given index from the collage and its variants"""
+    self.shapes.pop(index)
+    self._components = None
+    for scale, lod in self.lods:
+      lod.remove_shape(index)
+
 
 class Animation(Asset):
   def __init__(self, frames : list = [Shape()], id=None):
@@ -123,3 +140,50 @@ class Graphics:
   def clear(self) -> None:
     """Clear assets"""
     self.assets.clear()
+
+
+###################################################################
+#                        Display Lists                            #
+###################################################################
+
+# Primitive draw commands, each a tuple starting with its kind
+FILL = 0 # (FILL, color, vertices)
+OUTLINE = 1 # (OUTLINE, color, vertices, width)
+BLIT = 2 # (BLIT, surface, rect)
+FRAMES = 3 # (FRAMES, animation, display list of each frame)
+
+def compile_assets(assets : list) -> list:
+  """Flatten assets into a display list of primitive draw commands"""
+  commands = []
+  for asset in assets:
+    compile_asset(asset, commands)
+  return commands
+
+def compile_asset(asset : Asset, commands : list) -> None:
+  """Append the draw commands of a given asset to a display list"""
+  if isinstance(asset, Text):
+    commands.append((BLIT, asset.text, asset.text_box))
+  elif isinstance(asset, Shape):
+    commands.append(shape_command(asset))
+  elif isinstance(asset, Collage):
+    for shape in asset.level_of_detail().shapes:
+      commands.append(shape_command(shape))
+  elif isinstance(asset, Animation):
+    frames = []
+    for frame in asset.frames:
+      frameCommands = compile_assets([frame])
+      # Share the list of a frame that looks like the last so changes can be found by identity
+      if len(frames) > 0 and frames[-1] == frameCommands:
+        frameCommands = frames[-1]
+      frames.append(frameCommands)
+    commands.append((FRAMES, asset, frames))
+  else:
+    print("Invalid object found in graphics")
+    print(asset)
+    print("Object skipped")
+
+def shape_command(shape : Shape) -> tuple:
+  """Return the draw command of a given Shape"""
+  if shape.width == 0:
+    return (FILL, shape.color, shape.vertices)
+  return (OUTLINE, shape.color, shape.vertices, shape.width)
@@ -0,0 +1,214 @@
+import sys
+import time
+import random
+import numpy as np
+from common.headless import new_match
+from common.combat import random_folder
+from common.chips import ChipInstance
+
+# Gym style reset and step over headless Matches of P1 against the Bot, for training
+# and evaluating policies outside the game. Each step is one Match tick. While P1 is off
+# the stage the action is a chip order picked from a hand of chips dealt from P1's
+# folder as the chip menu deals it, and once chips are confirmed it is a movement. A
+# chip order is a list of (hand slot, speed index) pairs and a movement an index of MOVES.
+#
+# Observations are the highlighted and hit stage masks (bit row*6 + col), the positions
+# and health of both players, the phase and the chips in hand (-1 for an empty slot).
+
+SELECT = 0 # P1 chooses chips, the action is a chip order
+HIGHLIGHT = 1 # chips are highlighted, the action is a move
+HIT = 2 # chips hit, the action is a move
+MOVES = ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)) # movement vectors by action
+SPEEDS = (ChipInstance.FASTHIGHLIGHT, ChipInstance.STANDARDHIGHLIGHT, ChipInstance.SLOWHIGHLIGHT) # chip variants by index
+HANDSIZE = 5 # chips to choose from each round
+MAXSTEPS = 10000 # steps after which a match is truncated
+FIELDS = ("phase", "highlight", "hit", "p1Position", "p2Position", "p1Health", "p2Health", "hand")
+
+class MatchEnv:
+  """A match against the Bot stepped a tick at a time, choosing chips from a hand and moving P1"""
+  def __init__(self, p1Folder : list = None, p2Folder : list = None, maxSteps : int = MAXSTEPS, seed : int = None):
+    self.p1Folder = p1Folder # chip ids of P1's folder, drawn at random every match if None
+    self.p2Folder = p2Folder # chip ids of the Bot's folder, drawn at random every match if None
+    self.maxSteps = maxSteps
+    self._rng = random.Random(seed) # folders and the Bot's random numbers
+    self.match = None
+    self.steps = 0
+    self._hand = [] # chips P1 may choose from
+    self._folder = None
+
+  def reset(self, seed : int = None) -> tuple:
+    """Start a new match, return its first observation and an info dict"""
+    if seed is not None:
+      self._rng.seed(seed)
+    p1Folder = self.p1Folder if self.p1Folder is not None else random_folder(self._rng)
+    p2Folder = self.p2Folder if self.p2Folder is not None else random_folder(self._rng)
+    self.match = new_match(p1Folder, p2Folder, random.Random(self._rng.getrandbits(64)))
+    self._p1 = self.match.p1Manager.player
+    self._p2 = self.match.p2Manager.player
+    self._folder = self._p1.get_folder()
+    self._hand = []
+    self._deal()
+    self.steps = 0
+    return self.observation(), {}
+
+  def step(self, action) -> tuple:
+    """Confirm a chip order or make a move and tick, return (observation, reward, terminated, truncated, info)"""
+    reward, terminated, truncated, info = self._advance(action)
+    return self.observation(), reward, terminated, truncated, info
+
+  def _advance(self, action) -> tuple:
+    """Confirm a chip order or make a move and tick, return (reward, terminated, truncated, info)"""
+    match = self.match
+    if not match.on_stage("P1"):
+      self._confirm(action)
+    elif not isinstance(action, (int, np.integer)):
+      raise ValueError("P1 is on the stage, expected a move index, got %r" % (action,))
+    elif not 0 <= action < len(MOVES):
+      raise ValueError("move index %r is outside 0 to %d" % (action, len(MOVES) - 1))
+    elif action != 0:
+      match.move("P1", MOVES[action])
+    p1Health = self._p1.get_health()
+    p2Health = self._p2.get_health()
+    match.tick()
+    self.steps += 1
+    if match.events["ROUNDOVER"]:
+      self._deal()
+    # Hits landed on the Bot less hits taken
+    reward = (p2Health - self._p2.get_health()) - (p1Health - self._p1.get_health())
+    terminated = match.events["GAMEOVER"]
+    truncated = not terminated and self.steps >= self.maxSteps
+    info = {"winner" : match.winner()} if terminated else {}
+    return reward, terminated, truncated, info
+
+  def phase(self) -> int:
+    """Return SELECT, HIGHLIGHT or HIT"""
+    if not self.match.on_stage("P1"):
+      return SELECT
+    return HIT if self.match.combatManager.phase() == "hit" else HIGHLIGHT
+
+  def observation(self) -> dict:
+    """Return the stage masks, positions, health, phase and hand"""
+    return dict(zip(FIELDS, self._fields()))
+
+  def hand(self) -> list:
+    """Return the ids of the chips in hand"""
+    return [chip.id for chip in self._hand]
+
+  def _fields(self) -> tuple:
+    highlight, hit = self.match.combatManager.stage_masks()
+    hand = tuple(chip.id for chip in self._hand) + (-1,) * (HANDSIZE - len(self._hand))
+    return (self.phase(), highlight, hit, self._p1.get_stage_position(), self._p2.get_stage_position(),
+            self._p1.get_health(), self._p2.get_health(), hand)
+
+  def _confirm(self, chipOrder) -> None:
+    """Confirm chips of the hand at the given speeds and take them out of the hand"""
+    if isinstance(chipOrder, (int, np.integer)):
+      raise ValueError("P1 is choosing chips, expected a chip order, got %r" % (chipOrder,))
+    slots = [slot for slot, speed in chipOrder]
+    if len(set(slots)) != len(slots) or any(not 0 <= slot < len(self._hand) for slot in slots):
+      raise ValueError("chip order %r does not pick different chips of a hand of %d" % (chipOrder, len(self._hand)))
+    chips = []
+    for slot, speed in chipOrder:
+      chip = self._hand[slot]
+      chip.set_speed(SPEEDS[speed])
+      chips.append(chip)
+    self.match.confirm("P1", chips)
+    for slot in sorted(slots, reverse=True):
+      self._hand.pop(slot)
+
+  def _deal(self) -> None:
+    """Draw chips not in hand until the hand is full, as the chip menu does"""
+    while len(self._hand) < min(HANDSIZE, len(self._folder.snapshot())):
+      chip = self._folder.draw()
+      while chip in self._hand:
+        chip = self._folder.draw()
+      self._hand.append(chip)
+
+
+class VectorMatchEnv:
+  """MatchEnvs stepped together, observations stacked into arrays and ended matches started over"""
+  def __init__(self, count : int, p1Folder : list = None, p2Folder : list = None, maxSteps : int = MAXSTEPS,
+               seed : int = None):
+    self.envs = [MatchEnv(p1Folder, p2Folder, maxSteps, None if seed is None else seed + i) for i in range(count)]
+
+  def reset(self, seed : int = None) -> tuple:
+    """Start a match in every environment, return their stacked observations and info dicts"""
+    for i, env in enumerate(self.envs):
+      env.reset(None if seed is None else seed + i)
+    return self.observation(), [{} for env in self.envs]
+
+  def step(self, actions) -> tuple:
+    """Step each environment with its action and start over those that ended, their last observation kept in info"""
+    count = len(self.envs)
+    rewards = np.zeros(count, dtype=np.float32)
+    terminated = np.zeros(count, dtype=bool)
+    truncated = np.zeros(count, dtype=bool)
+    infos = [{} for env in self.envs]
+    for i, (env, action) in enumerate(zip(self.envs, actions)):
+      rewards[i], terminated[i], truncated[i], info = env._advance(action)
+      if terminated[i] or truncated[i]:
+        info["final_observation"] = env.observation()
+        infos[i] = info
+        env.reset()
+    return self.observation(), rewards, terminated, truncated, infos
+
+  def observation(self) -> dict:
+    """Return each field of the observations as an array with a row per environment"""
+    rows = [env._fields() for env in self.envs]
+    observation = {}
+    for name, column in zip(FIELDS, zip(*rows)):
+      observation[name] = np.array(column, dtype=np.int32)
+    return observation
+
+  def __len__(self) -> int:
+    return len(self.envs)
+
+###################################################################################
+#                                  Command line                                   #
+###################################################################################
+
+def random_action(phase : int, rng) -> object:
+  """Return a random chip order while choosing chips, a random move otherwise"""
+  if phase == SELECT:
+    count = rng.randint(1, HANDSIZE)
+    return [(slot, rng.randint(0, len(SPEEDS)-1)) for slot in rng.sample(range(HANDSIZE), count)]
+  return rng.randrange(len(MOVES)) if rng.random() < .3 else 0
+
+def benchmark(envs : int, steps : int, seed : int) -> None:
+  """Print the steps per second of one environment and of a vector of them under a random policy"""
+  rng = random.Random(seed)
+  env = MatchEnv(seed=seed)
+  observation, info = env.reset()
+  matches = 0
+  start = time.perf_counter()
+  for step in range(steps):
+    observation, reward, terminated, truncated, info = env.step(random_action(observation["phase"], rng))
+    if terminated or truncated:
+      matches += 1
+      observation, info = env.reset()
+  elapsed = time.perf_counter() - start
+  print("MatchEnv: %d steps in %.2f s, %.0f steps/s, %d matches" % (steps, elapsed, steps / elapsed, matches))
+  vector = VectorMatchEnv(envs, seed=seed)
+  observation, infos = vector.reset()
+  matches = 0
+  vectorSteps = max(1, steps // envs)
+  start = time.perf_counter()
+  for step in range(vectorSteps):
+    actions = [random_action(phase, rng) for phase in observation["phase"]]
+    observation, rewards, terminated, truncated, infos = vector.step(actions)
+    matches += int(np.count_nonzero(terminated | truncated))
+  elapsed = time.perf_counter() - start
+  print("VectorMatchEnv of %d: %d steps in %.2f s, %.0f steps/s, %d matches" % (
+        envs, vectorSteps * envs, elapsed, vectorSteps * envs / elapsed, matches))
+
+
+if __name__ == "__main__":
+  # python -m common.gym_env [--envs N] [--steps N] [--seed N]
+  from argparse import ArgumentParser
+  parser = ArgumentParser(description="Measure the speed of the match environments under a random policy")
+  parser.add_argument("--envs", type=int, default=64, help="environments in the vector")
+  parser.add_argument("--steps", type=int, default=200000, help="steps played by each benchmark")
+  parser.add_argument("--seed", type=int, default=0, help="seed of the folders, policy and Bot")
+  args = parser.parse_args()
+  benchmark(args.envs, args.steps, args.seed)
+  sys.exit(0)
@@ -0,0 +1,33 @@
+import random
+from common.json_data import json_to_matrix
+from common.chip_library import ChipLibrary, load_chip_data
+from common.chips import Chip, Folder
+from common.player import Player, Bot
+from common.combat import Match, random_folder
+
+# Matches built from chip data alone, without pygame, windows or assets
+
+class HeadlessChips(ChipLibrary):
+  allChips = {} # chips converted without assets, filled on first use of each chip
+
+  @staticmethod
+  def convert(id : int) -> Chip:
+    """Convert the area of the chip at a given id, leaving out its asset"""
+    return Chip(None, json_to_matrix(load_chip_data()[str(id)]["1"]), id)
+
+  @staticmethod
+  def load() -> list:
+    """Return every chip by id, converted without assets"""
+    return HeadlessChips.load_all()
+
+
+def to_folder(ids : list) -> Folder:
+  """Convert a list of chip ids to a folder"""
+  return Folder([HeadlessChips.get_chip(id) for id in ids])
+
+def new_match(p1Folder : list, p2Folder : list = None, rng=random, bot : bool = True) -> Match:
+  """Return a match between folders of chip ids, P2 is a Bot using rng unless bot is False"""
+  if p2Folder is None:
+    p2Folder = random_folder(rng)
+  player2 = Bot(to_folder(p2Folder), rng) if bot else Player(to_folder(p2Folder))
+  return Match(Player(to_folder(p1Folder)), player2)
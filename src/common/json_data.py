@@ -0,0 +1,53 @@
+import json, os
+from time import perf_counter
+from common.file_handler import FileHandler
+from common.bundle import Bundle, bundle_name
+from common.startup import StartupTimer
+
+# Readers of packaged json that build no graphics, so they work without pygame
+
+def json_to_matrix(dict : dict) -> list:
+  """Convert dictionary to matrix"""
+  matrix = []
+  row = []
+  r = 0
+  for key in dict.keys():
+    current = int(key[0])
+    if current != r:
+      matrix.append(row)
+      row = []
+      r = int(key[0])
+    row.append(dict[key])
+  matrix.append(row)
+  return matrix
+
+def child_keys(dict : dict) -> list:
+  """Return keys of the shapes, frames, or parts stored in an object"""
+  keys = []
+  for key in dict.keys():
+    if key.isdigit():
+      keys.append(key)
+  return keys
+
+def load_data(fileName : str) -> dict:
+  """Parse json file without converting it to objects"""
+  start = perf_counter()
+  filePath = FileHandler.get_packaged_files_path(fileName)
+  with open(filePath, "r") as file:
+    data = json.load(file)
+  StartupTimer.add("parse " + fileName, perf_counter() - start)
+  return data
+
+def load_indexed(fileName : str):
+  """Open the bundle built from a json file, or parse the json file if there is no current bundle"""
+  bundlePath = FileHandler.get_packaged_files_path(bundle_name(fileName))
+  filePath = FileHandler.get_packaged_files_path(fileName)
+  if not os.path.exists(bundlePath):
+    return load_data(fileName)
+  if os.path.exists(filePath) and os.path.getmtime(filePath) > os.path.getmtime(bundlePath):
+    print(bundle_name(fileName), "is older than", fileName, "and was ignored")
+    return load_data(fileName)
+  start = perf_counter()
+  bundle = Bundle(bundle_name(fileName))
+  StartupTimer.add("open " + bundle_name(fileName), perf_counter() - start)
+  return bundle
@@ -1,23 +1,9 @@
 import json
 from common.file_handler import FileHandler
+from common.json_data import json_to_matrix, child_keys, load_data, load_indexed
 from common.graphics import *
 from common.chips import Chip
 
-def json_to_matrix(dict : dict) -> list:
-  """Convert dictionary to matrix"""
-  matrix = []
-  row = []
-  r = 0
-  for key in dict.keys():
-    current = int(key[0])
-    if current != r:
-      matrix.append(row)
-      row = []
-      r = int(key[0])
-    row.append(dict[key])
-  matrix.append(row)
-  return matrix
-
 ###################################################################
 #                         JsonHandler                             #
 ###################################################################
@@ -26,32 +12,39 @@ class JsonHandler:
   @staticmethod
   def convert_data(fileName : str) -> list:
     """Convert json file to list of objects"""
-    filePath = FileHandler.get_packaged_files_path(fileName)
-    with open(filePath, "r") as file:
-      data = json.load(file)
+    data = JsonHandler.load_data(fileName)
     objs = []
     for key in data.keys():
-      objDict = data[key]
-      if objDict["type"] == 0:
-        obj = JsonHandler.json_to_shape(objDict)
-        objs.append(obj)
-      elif objDict["type"] == 1:
-        obj = JsonHandler.json_to_collage(objDict)
-        objs.append(obj)
-      elif objDict["type"] == 2:
-        obj = JsonHandler.json_to_animation(objDict)
-        objs.append(obj)
-      elif objDict["type"] == 3:
-        obj = JsonHandler.json_to_chip(objDict)
+      obj = JsonHandler.convert_object(data[key])
+      if obj is not None:
         objs.append(obj)
     return objs
 
+  @staticmethod
+  def load_data(fileName : str) -> dict:
+    """Parse json file without converting it to objects"""
+    return load_data(fileName)
+
+  @staticmethod
+  def load_indexed(fileName : str):
+    """Open the bundle built from a json file, or parse the json file if there is no current bundle"""
+    return load_indexed(fileName)
+
+  @staticmethod
+  def convert_object(objDict : dict):
+    """Convert a single json object to its object"""
+    if objDict["type"] == 0:
+      return JsonHandler.json_to_shape(objDict)
+    elif objDict["type"] == 1:
+      return JsonHandler.json_to_collage(objDict)
+    elif objDict["type"] == 2:
+      return JsonHandler.json_to_animation(objDict)
+    elif objDict["type"] == 3:
+      return JsonHandler.json_to_chip(objDict)
+
   @staticmethod
   def load_save(fileName : str) -> dict:
-    filePath = FileHandler.get_packaged_files_path(fileName)
-    with open(filePath, "r") as file:
-      data = json.load(file)
-    return data
+    return JsonHandler.load_data(fileName)
   
   @staticmethod
   def store_save(fileName : str, save : dict) -> None:
@@ -63,10 +56,15 @@ class JsonHandler:
   def json_to_shape(dict : dict) -> Shape:
     """Convert dictionary to Shape object"""
     id = dict["id"]
-    vertices = dict["vertices"]
+    vertices = [tuple(point) for point in dict["vertices"]]
     color = dict["color"]
     width = dict["width"]
-    shape = Shape(vertices, color, width, id)
+    bounds = None
+    if "bounds" in dict:
+      # Added by the asset compiler as x, y, width, height
+      x, y, boundsWidth, boundsHeight = dict["bounds"]
+      bounds = (x, y, x+boundsWidth, y+boundsHeight)
+    shape = Shape(vertices, color, width, id, bounds)
     return shape
 
   @staticmethod
@@ -74,10 +72,13 @@ class JsonHandler:
     """Convert dictionary to Collage object"""
     id = dict["id"]
     shapes = []
-    for key in list(dict.keys())[2:]:
+    for key in child_keys(dict):
       shape = JsonHandler.json_to_shape(dict[key])
       shapes.append(shape)
-    collage = Collage(shapes, id)
+    collage = Collage(shapes, id, dict.get("components"))
+    # Less detailed variants added by the asset compiler
+    for scale, lodDict in dict.get("lods", []):
+      collage.lods.append((scale, JsonHandler.json_to_collage(lodDict)))
     return collage
 
   @staticmethod
@@ -86,7 +87,7 @@ class JsonHandler:
     id = dict["id"]
     frames = []
     skip = False
-    for key in list(dict.keys())[2:]:
+    for key in child_keys(dict):
       frameDict = dict[key]
       if frameDict["type"] == 0:
         frame = JsonHandler.json_to_shape(frameDict)
@@ -116,5 +117,5 @@ class JsonHandler:
     matrixDict = dict[str(1)]
     areaMatrix = json_to_matrix(matrixDict)
 
-    chip = Chip(asset, areaMatrix)
+    chip = Chip(asset, areaMatrix, dict["id"])
     return chip
\ No newline at end of file
@@ -0,0 +1,39 @@
+from threading import Thread
+from common.startup import StartupTimer
+
+class Loader:
+  def __init__(self, steps : list):
+    self._steps = steps # (label, function) pairs run in order
+    self._completed = 0
+    self._error = None
+    self._thread = Thread(target=self._run, name="Loader", daemon=True)
+
+  def start(self) -> None:
+    """Run all steps on a worker thread"""
+    self._thread.start()
+
+  def progress(self) -> float:
+    """Return the fraction of steps completed"""
+    if len(self._steps) == 0:
+      return 1
+    return self._completed / len(self._steps)
+
+  def done(self) -> bool:
+    """Return true once every step has finished or one has failed"""
+    return not self._thread.is_alive()
+
+  def join(self) -> None:
+    """Wait for the worker and raise any error it hit"""
+    self._thread.join()
+    if self._error is not None:
+      raise self._error
+
+  def _run(self) -> None:
+    """Run steps until finished or one fails"""
+    try:
+      for label, step in self._steps:
+        step()
+        self._completed += 1
+        StartupTimer.mark(label)
+    except Exception as error:
+      self._error = error
@@ -0,0 +1,94 @@
+from common.json_data import child_keys
+
+LODSCALES = [0.5, 0.25, 0.125] # on-screen pixels per asset unit of each variant
+MINPIXELS = 1 # shapes smaller than this on screen are dropped
+
+###################################################################
+#                        Merge Helpers                            #
+###################################################################
+
+def merge_outlines(a : list, b : list) -> list:
+  """Return the outline of two polygons sharing exactly one edge, or None"""
+  a = [tuple(point) for point in a]
+  b = [tuple(point) for point in b]
+  shared = set(a) & set(b)
+  if len(shared) != 2 or len(set(a)) != len(a) or len(set(b)) != len(b):
+    return None
+  for i in range(len(a)):
+    p, q = a[i], a[(i+1) % len(a)]
+    if {p, q} != shared:
+      continue
+    if b[(b.index(q)+1) % len(b)] != p:
+      # b runs the same way round as a, so walk it backwards
+      b = b[::-1]
+      if b[(b.index(q)+1) % len(b)] != p:
+        return None
+    # walk a from q to p, then b from p back to q without repeating either
+    aWalk = a[i+1:] + a[:i+1]
+    j = b.index(p)
+    bWalk = b[j:] + b[:j]
+    return [list(point) for point in aWalk + bWalk[1:-1]]
+  return None
+
+def can_merge(a : dict, b : dict) -> bool:
+  """Return true if two shapes look identical when drawn as one"""
+  if a["id"] == "base" or b["id"] == "base":
+    return False
+  return a["id"] == b["id"] and a["color"] == b["color"] and a["width"] == 0 and b["width"] == 0
+
+def bounds(vertices : list) -> list:
+  xs = [point[0] for point in vertices]
+  ys = [point[1] for point in vertices]
+  return [min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys)]
+
+###################################################################
+#                         LOD Builders                            #
+###################################################################
+
+def reduce_shapes(shapes : list, scale : float) -> list:
+  """Drop shapes too small to see at a given scale and merge neighbours that share an edge"""
+  reduced = []
+  for index, shape in enumerate(shapes):
+    x, y, width, height = shape["bounds"]
+    # The first shape anchors positioning and scaling, so it is always kept
+    if index > 0 and shape["id"] != "base" and max(width, height) * scale < MINPIXELS:
+      continue
+    if len(reduced) > 0 and can_merge(reduced[-1], shape):
+      outline = merge_outlines(reduced[-1]["vertices"], shape["vertices"])
+      if outline is not None:
+        merged = dict(reduced[-1])
+        merged["vertices"] = outline
+        merged["bounds"] = bounds(outline)
+        reduced[-1] = merged
+        continue
+    reduced.append(shape)
+  return reduced
+
+def build_lods(collage : dict) -> list:
+  """Return [scale, collage] variants of a compiled collage with fewer shapes"""
+  shapes = [collage[key] for key in child_keys(collage)]
+  lods = []
+  polygons = len(shapes)
+  for scale in LODSCALES:
+    reduced = reduce_shapes(shapes, scale)
+    if len(reduced) >= polygons:
+      continue
+    lod = {"type" : 1, "id" : collage["id"]}
+    for index, shape in enumerate(reduced):
+      lod[str(index)] = shape
+    lods.append([scale, lod])
+    polygons = len(reduced)
+    shapes = reduced
+  return lods
+
+def add_lods(compiled : dict) -> None:
+  """Add LOD variants to every collage in a compiled object"""
+  if compiled["type"] == 1:
+    lods = build_lods(compiled)
+    if len(lods) > 0:
+      compiled["lods"] = lods
+  elif compiled["type"] == 2:
+    for key in child_keys(compiled):
+      add_lods(compiled[key])
+  elif compiled["type"] == 3 and "0" in compiled:
+    add_lods(compiled["0"])
@@ -9,8 +9,14 @@ from common.chips import *
 from common.chip_library import ChipLibrary
 from common.containers import *
 from common.save import Save
-from random import randint
-from copy import deepcopy as deep_copy
+from common.settings import Settings
+from common.asset_handler import AssetHandler
+from common.trace import Tracer, traced
+from common.combat import *
+from common.netplay import LockstepPeer, LockstepSession
+from common.rollback import RollbackSession
+from common.broadcast import Broadcast, match_view
+from threading import RLock
 
 ###################################################################################
 #                              Evironment Manager                                 #
@@ -19,316 +25,287 @@ from copy import deepcopy as deep_copy
 class EnvironmentManager:
   def __init__(self):
     self._window = Window((6, 4))
-    self._environments = {}
+    self._layoutSize = self._window.get_size() # size environments were last resized to
+    self._environments = {} # None until an environment is built
+    self._pending = {} # environment classes and arguments waiting to be built
+    self._activateOnBuild = set() # keys of environments to activate once built
+    self._buildLock = RLock() # environments may be built from the loading thread
     self._pausedAssets = []
     self._activeAssets = []
+    self._pausedEnvironments = [] # paused environments drawn behind active ones
+    self._activeEnvironments = []
+
+  def reserve(self, keys : list) -> None:
+    """Fix the drawing order of environments added later"""
+    for key in keys:
+      self._environments.setdefault(key, None)
 
   def add_environment(self, key, environment : Environment, *args) -> None:
-    """Add a given Environment to environments at a given key"""
-    self._environments[key] = environment(self._window.get_size(), *args)
+    """Add a given Environment at a given key, built on first use"""
+    with self._buildLock:
+      self._environments[key] = None
+      self._pending[key] = (environment, args)
+
+  def activate_when_built(self, key) -> None:
+    """Activate the Environment at a given key as soon as it is built"""
+    with self._buildLock:
+      if self._environments[key] is None:
+        self._activateOnBuild.add(key)
+      else:
+        self._environments[key].activate()
+
+  def build_environment(self, key) -> None:
+    """Build the pending Environment at a given key"""
+    with self._buildLock:
+      if key not in self._pending:
+        return
+      environment, args = self._pending[key]
+      with Tracer.span("build " + key):
+        env = environment(self._window.get_size(), *args)
+      if key in self._activateOnBuild:
+        self._activateOnBuild.remove(key)
+        env.activate()
+      self._environments[key] = env
+      del self._pending[key]
+
+  def build_pending(self) -> bool:
+    """Build the next pending Environment, return False if none remain"""
+    with self._buildLock:
+      if len(self._pending) == 0:
+        return False
+      self.build_environment(next(iter(self._pending)))
+    return True
+
+  def environments(self) -> list:
+    """Return (key, Environment) pairs of all built environments in drawing order"""
+    built = []
+    for key, env in self._environments.items():
+      if env is not None:
+        built.append((key, env))
+    return built
 
   ###################################################################
   #                          Updators                               #
   ###################################################################
 
-  def update(self) -> None:
-    """Update assets to match environemt states"""
+  def update(self) -> bool:
+    """Update assets to match environemt states, return True if a frame was drawn"""
     self._window.clear_assets()
     self._update_active_assets()
     self._window.append_assets(self._activeAssets)
     self._window.update_graphics()
     self._update_paused_assets()
     self._window.prepend_assets(self._pausedAssets)
-    self._window.update()
+    drawn = self._pausedEnvironments + self._activeEnvironments
+    self._window.set_display_lists([env.display_list() for env in drawn])
+    return self._window.update(tuple(env.frame_key() for env in drawn))
 
   def _update_paused_assets(self) -> None:
     """Place all paused assets into pausedAssets list"""
     self._pausedAssets.clear()
-    for key in self._environments.keys():
-      env = self._environments[key]
+    self._pausedEnvironments.clear()
+    for key, env in self.environments():
       if env.status == Environment.PAUSE:
         self._pausedAssets += env.get_assets()
+        self._pausedEnvironments.append(env)
 
   def _update_active_assets(self) -> None:
     """Place all active assets into activeAssets list"""
     self._activeAssets.clear()
-    for key in self._environments.keys():
-      env = self._environments[key]
+    self._activeEnvironments.clear()
+    for key, env in self.environments():
       if env.status == Environment.ACTIVE:
         if isinstance(env, (ActionLayer, ActionMenu)):
           env.frame_update(self._window.get_size())
-        self._activeAssets += env.get_assets()
-
-  def resize(self) -> None:
-    """Resize all assets to fit window"""
-    for key in self._environments.keys():
-      env = self._environments[key]
-      env.resize(self._window.get_size())
+        if env.plays_animations():
+          self._activeAssets += env.get_assets()
+        self._activeEnvironments.append(env)
+
+  def resize(self, force : bool = False) -> bool:
+    """Resize all assets to fit window, return True if any were rebuilt"""
+    with self._buildLock:
+      self._window.resize_canvas()
+      windowSize = self._window.get_size()
+      rebuild = force or windowSize != self._layoutSize
+      if rebuild:
+        for key, env in self.environments():
+          env.resize(windowSize)
+        self._layoutSize = windowSize
+    self._window.request_redraw()
     self.update()
+    return rebuild
+
+  def rebuild(self) -> None:
+    """Rebuild all environments with the current settings"""
+    with self._buildLock:
+      for key, env in self.environments():
+        env.forget_layouts()
+      self.resize(True)
+
+  def request_redraw(self) -> None:
+    """Draw the next frame even if nothing in it changed"""
+    self._window.request_redraw()
 
   ###################################################################
   #                          Accessors                              #
   ###################################################################
 
+  def idle(self) -> bool:
+    """Return true if no frame can change until the next input"""
+    if len(self._pending) > 0:
+      return False
+    for env in self._activeEnvironments:
+      if env.animated():
+        return False
+    return True
+
   def active_menu(self) -> Menu:
     """Return the current active Menu if any"""
-    for key in self._environments.keys():
-      env = self._environments[key]
+    for key, env in self.environments():
       if isinstance(env, Menu) and env.status == Environment.ACTIVE:
         return env
   
   def get_environment(self, key) -> Environment:
-    """Return the Environment at a given key"""
+    """Return the Environment at a given key, building it if needed"""
+    if self._environments[key] is None:
+      self.build_environment(key)
     return self._environments[key]
   
   def get_window_size(self) -> tuple:
     """Return width and height of window as a tuple"""
     return self._window.get_size()
-  
 
-###################################################################################
-#                                Player Manager                                   #
-###################################################################################
-
-class PlayerManager:
-  def __init__(self, player : Player, colRange : tuple):
-    self._colMin, self._colMax = colRange
-    self.player = player
-    self.events = {
-      "HPZERO" : False
-    }
+  def to_window(self, position : tuple) -> tuple:
+    """Convert a position on screen to a position in the laid out window"""
+    return self._window.to_canvas(position)
   
-  def move_player(self, panelMatrix : list, windowSize : tuple, movement : tuple) -> None:
-    """Move player according to a given movemnet vector"""
-    stagePosition = self._update_stage_position(movement)
-    self._update_asset_position(panelMatrix, windowSize, stagePosition)
-
-  def _update_stage_position(self, movement : tuple) -> tuple:
-    """Update players stage position"""
-    x, y = self.player.get_stage_position()
-    col = y+movement[1]
-    row = x+movement[0]
-    if col < self._colMin  or col > self._colMax:
-        col = y
-    if row < 0  or row > 2:
-        row = x
-    self.player.move((row, col))
-    return row, col
-
-  def _update_asset_position(self, panelMatrix : list, windowSize : tuple, stagePosition : tuple) -> None:
-    """Update player asset according to stage position"""
-    row, col = stagePosition
-    panelX, panelY = panelMatrix[col][row]
-    width, height = windowSize
-    assetX = panelX - (width // 12)
-    assetY = panelY - (height // 4)
-    self.player.move_asset((assetX, assetY))
-
-  def damage_player(self) -> None:
-    """Damage player"""
-    self.player.damage()
-    if self.player.get_health() <= 0:
-        self.events["HPZERO"] = True
 
 ###################################################################################
-#                                Combat Manager                                   #
+#                                 Event Manager                                   #
 ###################################################################################
 
-HITCOOLDOWN = 20
-SWITCH = 10
-EMPTYMATRIX = Matrix([[False]*3]*3)
+class EventManager:
+  def __init__(self, peer : LockstepPeer = None, broadcast : Broadcast = None):
+    self._environmentManager = EnvironmentManager()
+    self._environmentManager.reserve(["BE", "SE", "SAL", "PAL", "GOE", "VE", "CAM", "PM", "FAM", "MM", "LE"])
+    self._environmentManager.add_environment("LE", LoadingEnvironment)
+    self._environmentManager.get_environment("LE").activate()
+    self._initialize_menu_environments()
+    self._initialize_state_variables()
+    self._match = None # created with the players
+    self._peer = peer # connection to the other player, None when playing the bot
+    self._session = None
+    self._broadcast = broadcast # spectators shown the match, None when not broadcasting
+    self._shownPositions = None # stage positions player assets were last placed at
+    self._shownHealth = None # health of both players last shown
+    self._choosing = True # the local player was choosing chips last frame
+    self.LOADED = False
 
-class CombatManager:
-  def __init__(self):
-    self._switchCounter = 0
-    self._combinedChain = ParallelChains()
-    self._p1HitCounter = HITCOOLDOWN
-    self._p2HitCounter = HITCOOLDOWN
-    self.events = {
-      "ACTIVE" : False,
-      "P1READY" : False,
-      "P2READY" : False,
-      "HIGHLIGHT" : True,
-      "HIT" : False,
-      "P1HIT" : False,
-      "P2HIT" : False,
-      "P1VULNERABLE" : True,
-      "P2VULNERABLE" : True
-    }
-  
-  def load_p1_chip_order(self, chipOrder : list) -> None:
-    """Set p1 chip order for next round"""
-    self._p1Chain = self._order_to_chain(chipOrder)
-    self.events["P1READY"] = True
-  
-  def load_p2_chip_order(self, chipOrder : list) -> None:
-    """Set p2 chip order for next round"""
-    self._p2Chain = self._order_to_chain(chipOrder)
-    self.events["P2READY"] = True
-
-  def _order_to_chain(self, chipOrder : list) -> list:
-    """Convert a list of chips to a list of panel matrices"""
-    chain = Chain()
-    for chip in chipOrder:
-      for i in range(chip.highlightFrames):
-        chain.append(chip.get_area_matrix())
-    return chain
-
-  def _combine_chains(self) -> None:
-    """Combine p1Chain and p2Chain"""
-    self._combinedChain.clear()
-    self._combinedChain["P1"] = Chain()
-    self._combinedChain["P2"] = Chain()
-    while len(self._p1Chain) > 0 or len(self._p2Chain) > 0:
-      if len(self._p1Chain) == 0:
-        rightChain = EMPTYMATRIX
-      else:
-        rightChain = self._p1Chain.pop(0)
-      if len(self._p2Chain) == 0:
-        leftChain = EMPTYMATRIX
-      else:
-        leftChain = self._p2Chain.pop(0)
-      self._combinedChain["P1"].append(leftChain)
-      self._combinedChain["P2"].append(rightChain)
-
-  def initialize_combat(self) -> None:
-    """Set state for new round of combat"""
-    if not self.events["ACTIVE"]:
-      self._combine_chains()
-      self._chainIndex = 0
-      self.events["HIGHLIGHT"] = True
-      self.events["HIT"] = False
-      self.events["P1HIT"] = False
-      self.events["P2HIT"] = False
-      self.events["P1VULNERABLE"] = True
-      self.events["P2VULNERABLE"] = True
-      self.events["ACTIVE"] = True
-
-  def combat(self, SAL : StageLayer, p1Manager : PlayerManager, p2Manager : PlayerManager) -> None:
-    """Update the combat state"""
-    if self.events["HIGHLIGHT"]:
-      self._highlight(SAL, p2Manager)
-      self._chainIndex += 1
-    if self.events["HIT"] and self._switchCounter >= SWITCH:
-      self._hit(SAL, p1Manager, p2Manager)
-      self._chainIndex += 1
-    self._switchCounter += 1
-  
-  def _highlight(self, SAL : StageLayer, p2Manager : PlayerManager) -> None:
-    """Highlight next chips in chip order"""
-    if self._chainIndex < len(self._combinedChain):
-      SAL.highlight(self._combinedChain.merge(self._chainIndex))
-    else:
-      self._chainIndex = 0
-      self._switchCounter = 0
-      self.events["HIGHLIGHT"] = False
-      self.events["HIT"] = True
-      SAL.clear_highlight()
-      p2Manager.player.hitOrder = self._combinedChain["P2"]
-      p2Manager.player.analyze()
-  
-  def _hit(self, SAL : StageLayer, p1Manager : PlayerManager, p2Manager : PlayerManager) -> None:
-    """Hit next chip in chip order"""
-    if self._chainIndex < len(self._combinedChain):
-      SAL.hit(self._combinedChain.merge(self._chainIndex))
-      self._update_vulnerability()
-      self._check_for_hit(p1Manager, p2Manager)
-    else:
-      self._chainIndex = 0
-      self.events["HIGHLIGHT"] = True
-      self.events["HIT"] = False
-      self.events["P1READY"] = False
-      self.events["P2READY"] = False
-      self.events["ACTIVE"] = False
-      SAL.clear_highlight()
-  
-  def _update_vulnerability(self) -> None:
-    """Mark players as vulnerable of hit cooldown"""
-    if self._p1HitCounter >= HITCOOLDOWN:
-      self.events["P1VULNERABLE"] = True
-    if self._p2HitCounter >= HITCOOLDOWN:
-      self.events["P2VULNERABLE"] = True
-  
-  def _check_for_hit(self, p1Manager : PlayerManager, p2Manager : PlayerManager) -> None:
-    """Detrmine if a playeer ahs been hit"""
-    row, col = p1Manager.player.get_stage_position()
-    if self._combinedChain["P1"][self._chainIndex][row][col] and self.events["P1VULNERABLE"]:
-      self.events["P1HIT"] = True
-      self.events["P1VULNERABLE"] = False
-      self._p1HitCounter = -1
-    row, col = p2Manager.player.get_stage_position()
-    if self._combinedChain["P2"][self._chainIndex][row][col-3] and self.events["P2VULNERABLE"]:
-      self.events["P2HIT"] = True
-      self.events["P2VULNERABLE"] = False
-      self._p2HitCounter = -1
-    self._p1HitCounter += 1
-    self._p2HitCounter += 1
+  ###################################################################
+  #                          Loading                                #
+  ###################################################################
 
+  def loading_steps(self) -> list:
+    """Return the (label, function) steps that load the game off the main thread"""
+    steps = [
+      ("load assets", AssetHandler.load_data),
+      ("main menu", self._build_menu_environments),
+      ("convert chips", ChipLibrary.load_all),
+      ("players", self._load_players)
+    ]
+    for key in ["BE", "SAL", "PAL", "GOE", "VE", "CAM", "PM", "FAM"]:
+      steps.append(("build " + key, self._build_step(key)))
+    return steps
+
+  def loading_progress(self, progress : float) -> None:
+    """Show a given fraction of loading as complete"""
+    LE = self._environmentManager.get_environment("LE")
+    LE.set_progress(progress, self._environmentManager.get_window_size())
+
+  def finish_loading(self) -> None:
+    """Place players and hand control to the main menu once loading is done"""
+    self._position_players()
+    self._environmentManager.get_environment("LE").deactivate()
+    self.LOADED = True
 
-###################################################################################
-#                                 Event Manager                                   #
-###################################################################################
+  def _build_menu_environments(self) -> None:
+    """Build the environments shown by the main menu"""
+    for key in ["SE", "MM"]:
+      self._environmentManager.build_environment(key)
 
-class EventManager:
-  def __init__(self):
-    self._environmentManager = EnvironmentManager()
+  def _load_players(self) -> None:
+    """Create players and add the environments that depend on them"""
     self._initialize_players()
-    self._initialize_environments()
-    self._position_players()
-    self._initialize_state_variables()
-    self._combatManager = CombatManager()
+    self._initialize_game_environments()
+
+  def _build_step(self, key):
+    """Build loading step for the environment at a given key"""
+    def step():
+      self._environmentManager.build_environment(key)
+    return step
   
   def reset(self):
+    if self._session is not None:
+      # The other player is not waiting for a rematch, so go back to the bot
+      self._session.close()
+      self._session = None
+      self._peer = None
     self._initialize_players()
     self._initialize_environments()
     self._position_players()
-    self._combatManager = CombatManager()
     self.RESET = False
     self._pause = False
 
   def _initialize_players(self) -> None:
     """Create a folder and assign it to two new player objects"""
-    p2Chips = []
-    used = []
-    while len(p2Chips) < 15:
-      id = randint(0, 119)
-      if id not in used:
-        chip = ChipLibrary.get_chip(id)
-        p2Chips.append(chip)
-        used.append(id)
-    p2Folder = Folder(p2Chips)
+    p2Folder = self._to_folder(random_folder())
     self._playerFolder = self._to_folder(Save.attribute("playerFolder"))
 
-    player1 = Player(self._playerFolder)
-    player2 = Bot(p2Folder)
-    player2.move((1, 4))
-
-    self._p1Manager = PlayerManager(player1, (0, 2))
-    self._p2Manager = PlayerManager(player2, (3, 5))
+    if self._peer is None:
+      self._match = Match(Player(self._playerFolder), Bot(p2Folder))
+    else:
+      self._match = Match(Player(self._playerFolder), Player(p2Folder))
+      if Settings.ROLLBACK > 0:
+        self._session = RollbackSession(self._match, self._peer, ChipLibrary.get_chip, Settings.ROLLBACK)
+      else:
+        self._session = LockstepSession(self._match, self._peer, ChipLibrary.get_chip)
+    self._p1Manager = self._match.p1Manager
+    self._p2Manager = self._match.p2Manager
+    self._shownHealth = self._healths()
+    self._choosing = True
 
   def _position_players(self) -> None:
-    """Position player assets at starting position"""
-    status = self._environmentManager.get_environment("PAL").status
-    self._environmentManager.get_environment("PAL").activate()
-    self._move_p1((0, 0))
-    self._move_p2((0, 0))
-    self._environmentManager.get_environment("PAL").status = status
+    """Position player assets at their stage positions"""
+    self._place_asset(self._p1Manager)
+    self._place_asset(self._p2Manager)
+    self._shownPositions = self._stage_positions()
+    self.movement_event()
 
   def _initialize_environments(self) -> None:
     """Intanciate an object for each environment and add them to environments list"""
+    self._initialize_menu_environments()
+    self._initialize_game_environments()
+    self._build_menu_environments()
+    self._environmentManager.build_environment("BE")
+
+  def _initialize_menu_environments(self) -> None:
+    """Add the environments shown by the main menu"""
     self._environmentManager.add_environment("BE", BackgroundEnvironment)
     self._environmentManager.add_environment("SE", StageEnvironment)
+    self._environmentManager.add_environment("MM", MainMenu, self._start, self._activate_FAM, self.quit)
+    self._environmentManager.activate_when_built("BE")
+    self._environmentManager.activate_when_built("SE")
+    self._environmentManager.activate_when_built("MM")
+
+  def _initialize_game_environments(self) -> None:
+    """Add the environments that need players or chips"""
     self._environmentManager.add_environment("SAL", StageLayer)
     self._environmentManager.add_environment("PAL", PlayerLayer, self._p1Manager.player, self._p2Manager.player)
     self._environmentManager.add_environment("GOE", GameOverEnvironment)
     self._environmentManager.add_environment("VE", VictoryEnvironment)
-    self._environmentManager.add_environment("CAM", ChipMenu, self._p1Manager.player.get_folder(), self._confirm)
+    self._environmentManager.add_environment("CAM", ChipMenu, self._playerFolder, self._confirm)
     self._environmentManager.add_environment("PM", PauseMenu, self._resume, self._main_menu, self.quit)
     self._environmentManager.add_environment("FAM", FolderSelectMenu, Save.attribute("playerFolder"), self._save_folder, self._close_folder_menu)
-    self._environmentManager.add_environment("MM", MainMenu, self._start, self._activate_FAM, self.quit)
-    self._environmentManager.get_environment("MM").activate()
-    self._environmentManager.get_environment("BE").activate()
-    self._environmentManager.get_environment("SE").activate()
 
   def _initialize_state_variables(self) -> None:
     """Initialize class state variables"""
@@ -336,45 +313,68 @@ class EventManager:
     self._pause = False
     self._shiftActive = False
     self._ctrlActive = False
-    self._dodgeCounter = 0
 
   ###################################################################
   #                           Events                                #
   ###################################################################
 
+  @traced("EventManager.event_scan")
   def event_scan(self) -> None:
     """Scan action environments for non-pygame events"""
     if self._pause:
+      if self._session is not None:
+        # Keep the other player supplied with the inputs already sent
+        self._session.flush()
       return
     
-    if self._combatManager.events["P1READY"] and not self._combatManager.events["P2READY"]:
-      p2ChipOrder = self._p2Manager.player.select_chips()
-      self._combatManager.load_p2_chip_order(p2ChipOrder)
-
-    if self._combatManager.events["P1READY"] and self._combatManager.events["P2READY"]:
-      if self._combatManager.events["HIGHLIGHT"]:
-        vector = self._p2Manager.player.idle()
-        self._dodgeCounter = 0
-      elif self._dodgeCounter > SWITCH-3:
-        vector = self._p2Manager.player.dodge()
+    if self._session is not None:
+      self._session.advance()
+      if self._session.closed():
+        self.reset()
       else:
-        vector = (0, 0)
-        self._dodgeCounter += 1
-      self._move_p2(vector)
-
-      self._combatManager.initialize_combat()
-      SAL = self._environmentManager.get_environment("SAL")
-      self._combatManager.combat(SAL, self._p1Manager, self._p2Manager)
-      if self._combatManager.events["P1HIT"]:
-        self._p1Manager.damage_player()
-        self._damage_event()
-        self._combatManager.events["P1HIT"] = False
-      if self._combatManager.events["P2HIT"]:
-        self._p2Manager.damage_player()
-        self._damage_event()
-        self._combatManager.events["P2HIT"] = False
-    elif self._environmentManager.get_environment("SAL").status == Environment.ACTIVE:
+        self._show_session()
+        self._publish()
+      return
+    self._match.tick()
+    self._publish()
+    events = self._match.events
+    if events["MOVED"]:
+      self._place_asset(self._p2Manager)
+      self.movement_event()
+    self._show_stage_masks()
+    if events["DAMAGED"]:
+      self._damage_event()
+    if events["ROUNDOVER"]:
       self._activate_CAM()
+
+  def _show_session(self) -> None:
+    """Show the online match as played so far, compared with what was last shown since rollback may rewrite recent ticks"""
+    if self._stage_positions() != self._shownPositions:
+      self._position_players()
+    self._show_stage_masks()
+    health = self._healths()
+    if health != self._shownHealth:
+      self._shownHealth = health
+      self._show_health()
+    if self._session.predicted() == 0:
+      # Only end the game on ticks both players' inputs are known for
+      self._check_winner()
+    choosing = self._session.choosing()
+    if choosing and not self._choosing:
+      self._activate_CAM()
+    self._choosing = choosing
+
+  def _publish(self) -> None:
+    """Send the match as shown to spectators"""
+    if self._broadcast is not None:
+      self._broadcast.publish(match_view(self._match))
+
+  def _show_stage_masks(self) -> None:
+    """Highlight the panels of the current tick of combat"""
+    highlightMask, hitMask = self._match.combatManager.stage_masks()
+    SAL = self._environmentManager.get_environment("SAL")
+    SAL.highlight(highlightMask)
+    SAL.hit(hitMask)
   
   def _activate_CAM(self) -> None:
     PAL = self._environmentManager.get_environment("PAL")
@@ -393,30 +393,56 @@ class EventManager:
     FAM.activate()
     MM.deactivate()
 
-  def refresh(self) -> None:
-    """Draw the next frame"""
-    self._environmentManager.update()
+  def refresh(self) -> bool:
+    """Draw the next frame, return True unless it was unchanged and skipped"""
+    drawn = self._environmentManager.update()
+    if self.LOADED:
+      # Build one waiting environment per frame so menus open without a stall
+      self._environmentManager.build_pending()
+    return drawn
   
+  def combat_phase(self) -> str:
+    """Return the phase of the current round of combat, None outside combat"""
+    if self._match is None:
+      return None
+    return self._match.combatManager.phase()
+
+  def idle(self) -> bool:
+    """Return true if nothing will change until the next input"""
+    if not self.LOADED or self.RESET or self._session is not None:
+      return False
+    return self._environmentManager.idle()
+
+  def redraw(self) -> None:
+    """Draw the next frame even if nothing in it changed"""
+    self._environmentManager.request_redraw()
+
+  def rebuild(self) -> None:
+    """Rebuild all assets after a change in settings"""
+    self._environmentManager.rebuild()
+    if self.LOADED:
+      self._position_players()
+
   def resize(self) -> None:
     """Resize assets to window"""
-    self._environmentManager.resize()
-    self._position_players()
+    if self._environmentManager.resize() and self.LOADED:
+      self._position_players()
 
   def click(self, position : tuple) -> None:
     """Process a click event"""
-    x, y = position
+    x, y = self._environmentManager.to_window(position)
     self._check_buttons(x, y)
   
   def key_press(self, key) -> None:
     """Process a key-press event"""
     if key == pygame.K_UP:
-      self._move_p1((-1, 0))
+      self._move_local((-1, 0))
     elif key == pygame.K_DOWN:
-      self._move_p1((1, 0))
+      self._move_local((1, 0))
     elif key == pygame.K_LEFT:
-      self._move_p1((0, -1))
+      self._move_local((0, -1))
     elif key == pygame.K_RIGHT:
-      self._move_p1((0, 1))
+      self._move_local((0, 1))
     elif key == pygame.K_ESCAPE:
       self._pause_game()
     elif key == pygame.K_LSHIFT or key == pygame.K_RSHIFT:
@@ -449,7 +475,7 @@ class EventManager:
     SE.deactivate()
     MM = self._environmentManager.get_environment("MM")
     MM.deactivate()
-    self._environmentManager.resize()
+    self._environmentManager.resize(True)
 
   def _confirm(self) -> None:
     """Button event for confirming current chip order in CAM"""
@@ -460,7 +486,10 @@ class EventManager:
     SAL = self._environmentManager.get_environment("SAL")
     SAL.activate()
     CAM = self._environmentManager.get_environment("CAM")
-    self._combatManager.load_p1_chip_order(CAM.export_chip_order())
+    if self._session is not None:
+      self._session.queue_chips(CAM.export_chip_order())
+    else:
+      self._match.confirm("P1", CAM.export_chip_order())
     CAM.get_events()["CONFIRM"]()
 
   def _pause_game(self) -> None:
@@ -475,10 +504,9 @@ class EventManager:
   def _save_state(self) -> None:
     """Save the current status of all environments"""
     self._state = []
-    environments = self._environmentManager._environments
-    for key in environments.keys():
-      if environments[key].status != Environment.INACTIVE:
-        self._state.append((key, environments[key].status))
+    for key, env in self._environmentManager.environments():
+      if env.status != Environment.INACTIVE:
+        self._state.append((key, env.status))
   
   def _load_state(self) -> None:
     """Set the status of all environments to the previous save state"""
@@ -498,6 +526,9 @@ class EventManager:
   def quit(self) -> None:
     """Quit game"""
     Save.write()
+    if self._session is not None:
+      self._session.close()
+      self._session = None
     pygame.event.post(pygame.event.Event(pygame.QUIT))
 
   def _save_folder(self) -> None:
@@ -508,7 +539,7 @@ class EventManager:
       self._playerFolder = self._to_folder(newFolder)
       CAM = self._environmentManager.get_environment("CAM")
       CAM.set_folder(self._playerFolder)
-      Save.attributes["playerFolder"] = deep_copy(FAM.get_folder())
+      Save.set_attribute("playerFolder", FAM.get_folder())
   
   def _to_folder(self, indexList : list) -> Folder:
     """Convert list of chip ids to folder object"""
@@ -555,27 +586,31 @@ class EventManager:
   #                          Movement                               #
   ###################################################################
 
-  def _move_p1(self, movement : tuple) -> None:
-    """Move p1 by a given movement vector"""
+  def _move_local(self, movement : tuple) -> None:
+    """Move the player at this keyboard by a given movement vector"""
     PAL = self._environmentManager.get_environment("PAL")
     if PAL.status != Environment.ACTIVE:
       return
+    if self._session is not None:
+      # Moves once the tick it is sent for is simulated
+      self._session.queue_move(movement)
+    elif self._match.move("P1", movement):
+      self._place_asset(self._p1Manager)
+      self.movement_event()
+
+  def _place_asset(self, playerManager : PlayerManager) -> None:
+    """Move a player's asset to their stage position"""
     SAL = self._environmentManager.get_environment("SAL")
-    panelMatrix = SAL.get_panel_matrix()
     windowSize = self._environmentManager.get_window_size()
-    self._p1Manager.move_player(panelMatrix, windowSize, movement)
-    self.movement_event()
-  
-  def _move_p2(self, movement : tuple) -> None:
-    """Move p2 by a given movement vector"""
-    PAL = self._environmentManager.get_environment("PAL")
-    if PAL.status != Environment.ACTIVE:
-      return
-    SAL = self._environmentManager.get_environment("SAL")
-    panelMatrix = SAL.get_panel_matrix()
-    windowSize = self._environmentManager.get_window_size()
-    self._p2Manager.move_player(panelMatrix, windowSize, movement)
-    self.movement_event()
+    playerManager.place_asset(SAL.get_panel_matrix(), windowSize)
+
+  def _stage_positions(self) -> tuple:
+    """Return the stage positions of both players"""
+    return (self._p1Manager.player.get_stage_position(), self._p2Manager.player.get_stage_position())
+
+  def _healths(self) -> tuple:
+    """Return the health of both players"""
+    return (self._p1Manager.player.get_health(), self._p2Manager.player.get_health())
 
   def movement_event(self) -> None:
     """Trigger MOVEMENT event in PlayerActionLayer"""
@@ -591,26 +626,33 @@ class EventManager:
 
   def _damage_event(self) -> None:
     """Trigger DAMAGE event in PlayerActionLayer"""
+    self._show_health()
+    self._check_winner()
+
+  def _show_health(self) -> None:
+    """Update player assets to their health"""
     PAL = self._environmentManager.get_environment("PAL")
     windowSize = self._environmentManager.get_window_size()
     player1 = self._p1Manager.player
     player2 = self._p2Manager.player
     PAL.update(windowSize, player1, player2)
 
-    p1State = self._p1Manager.events["HPZERO"]
-    p2State = self._p2Manager.events["HPZERO"]
-    if p1State:
-      self._game_over()
-      self._pause_all_active()
-    elif p2State:
+  def _check_winner(self) -> None:
+    """End the game if a player has no health left"""
+    winner = self._match.winner()
+    if winner is None:
+      return
+    localKey = "P1" if self._session is None else self._session.local_key()
+    if winner == localKey:
       self._victory()
-      self._pause_all_active()
+    else:
+      self._game_over()
+    self._pause_all_active()
   
   def _pause_all_active(self):
-    environments = self._environmentManager._environments
-    for key in environments.keys():
-      if environments[key].status == Environment.ACTIVE:
-        environments[key].pause()
+    for key, env in self._environmentManager.environments():
+      if env.status == Environment.ACTIVE:
+        env.pause()
   
   def _game_over(self):
     self._environmentManager.get_environment("GOE").activate()
@@ -6,6 +6,8 @@ from common.graphics import *
 ###################################################################
 
 class MainMenu(Menu):
+  LAYOUTCACHE = 4
+
   def __init__(self, windowSize : tuple, start_function, folder_function, quit_function):
     super().__init__()
     self._start = start_function
@@ -111,6 +113,9 @@ class MainMenu(Menu):
 ###################################################################
 
 class PauseMenu(Menu):
+  LAYOUTCACHE = 4
+  LAYOUT = Menu.LAYOUT + ("_frameSize", "_framePosition")
+
   def __init__(self, windowSize : tuple, resumeFunction, mainMenuFunction, quitFunction):
     super().__init__()
     self._resumeFunction = resumeFunction
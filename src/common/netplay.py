@@ -0,0 +1,648 @@
+import sys
+import time
+import heapq
+import random
+import select
+import socket
+import struct
+import logging
+from common.combat import Match
+
+logger = logging.getLogger(__name__)
+
+# Lockstep play: peers exchange only their inputs and both simulate the same Match.
+# Input for tick t is sent when the sender simulates tick t-delay, so it usually
+# arrives before it is needed and the match only waits when packets are late.
+# Peers also send the state hash after each tick so a desync is reported at the
+# tick it happened.
+
+MAGIC = b"CS"
+VERSION = 2
+HELLO = 0 # connection request, answered with the host's input delay
+INPUTS = 1 # inputs not yet acknowledged by the receiver
+BYE = 2 # the sender left the match
+
+# Hello packet: MAGIC | kind | version | input delay
+HELLOPACKET = struct.Struct("!2sBBB")
+# Inputs packet, followed by hash count (tick, state hash) pairs then count inputs:
+#   MAGIC | kind | sequence | last tick received with all before it | sent ms |
+#   sent ms of the last packet received | ms it was held | first tick | count | hash count
+HEADER = struct.Struct("!2sBIiIIHIBB")
+TICKHASH = struct.Struct("!IQ")
+NOECHO = 0xFFFFFFFF # no packet has been received to echo
+
+# An input is (movement, chip order or None), a chip order is ((chip id, highlight frames), ...).
+# Encoded as a movement byte, with CHIPS set when a count byte and id, frames byte pairs follow.
+MOVES = [(0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)]
+CHIPS = 0x80
+EMPTYINPUT = ((0, 0), None)
+
+def encode_input(input : tuple) -> bytes:
+  """Return the bytes of an input"""
+  movement, chipOrder = input
+  code = MOVES.index(movement)
+  if chipOrder is None:
+    return bytes([code])
+  encoded = bytearray([code | CHIPS, len(chipOrder)])
+  for id, frames in chipOrder:
+    encoded += bytes([id, frames])
+  return bytes(encoded)
+
+def decode_inputs(data : bytes, offset : int, count : int) -> list:
+  """Return count inputs encoded in data from offset"""
+  inputs = []
+  for i in range(count):
+    code = data[offset]
+    offset += 1
+    chipOrder = None
+    if code & CHIPS:
+      length = data[offset]
+      offset += 1
+      chipOrder = tuple((data[offset + 2*j], data[offset + 2*j + 1]) for j in range(length))
+      offset += 2 * length
+    inputs.append((MOVES[code & ~CHIPS], chipOrder))
+  return inputs
+
+def chip_instance(get_chip, id : int, highlightFrames : int):
+  """Return a new instance of a chip id with the variant highlighted for a number of frames"""
+  chip = get_chip(id)
+  chip.set_speed(highlightFrames)
+  return chip
+
+def play_tick(match : Match, inputs : tuple, get_chip) -> None:
+  """Apply P1's and P2's inputs then advance a match one tick, in the order every peer and replay plays them"""
+  for key, (movement, chipOrder) in zip(("P1", "P2"), inputs):
+    if chipOrder is not None:
+      match.confirm(key, [chip_instance(get_chip, id, frames) for id, frames in chipOrder])
+  for key, (movement, chipOrder) in zip(("P1", "P2"), inputs):
+    match.move(key, movement)
+  match.tick()
+
+def milliseconds() -> int:
+  """Return a wrapping millisecond clock for packet timestamps"""
+  return int(time.monotonic() * 1000) & 0xFFFFFFFF
+
+###################################################################################
+#                                   Statistics                                    #
+###################################################################################
+
+class NetStats:
+  """Packet, latency and stall counts of a connection"""
+  def __init__(self):
+    self.sent = 0 # packets sent
+    self.received = 0 # packets received
+    self.lost = 0 # packets never received, found by gaps in sequence numbers
+    self.late = 0 # packets received after a later one
+    self.resent = 0 # inputs sent again because no acknowledgement arrived
+    self.stalls = 0 # frames the match waited for remote input
+    self.desyncTick = None # first tick the remote's state hash differed at
+    self.rollbacks = 0 # times guessed remote input was wrong
+    self.resimulated = 0 # ticks played again after a wrong guess
+    self.rtt = None # smoothed round trip time in ms
+    self.jitter = 0.0 # smoothed change in round trip time in ms
+    self.minRtt = None
+    self.maxRtt = None
+    self._lastSequence = None
+    self._lastRtt = None
+
+  def record_sequence(self, sequence : int) -> None:
+    """Count a received packet and any skipped before it"""
+    self.received += 1
+    if self._lastSequence is None or sequence > self._lastSequence:
+      if self._lastSequence is not None:
+        self.lost += sequence - self._lastSequence - 1
+      self._lastSequence = sequence
+    else:
+      # A packet counted as lost arrived after all
+      self.late += 1
+      self.lost = max(0, self.lost - 1)
+
+  def record_rtt(self, rtt : int) -> None:
+    """Add a round trip time sample in ms"""
+    if self.rtt is None:
+      self.rtt = float(rtt)
+      self.minRtt = self.maxRtt = rtt
+    else:
+      self.rtt += (rtt - self.rtt) / 8
+      self.minRtt = min(self.minRtt, rtt)
+      self.maxRtt = max(self.maxRtt, rtt)
+    if self._lastRtt is not None:
+      self.jitter += (abs(rtt - self._lastRtt) - self.jitter) / 16
+    self._lastRtt = rtt
+
+  def loss(self) -> float:
+    """Return the fraction of packets lost"""
+    if self.received + self.lost == 0:
+      return 0.0
+    return self.lost / (self.received + self.lost)
+
+  def summary(self) -> str:
+    """Return a one line report"""
+    if self.rtt is None:
+      latency = "rtt unknown"
+    else:
+      latency = "rtt %.1f ms (min %d, max %d), jitter %.1f ms" % (self.rtt, self.minRtt, self.maxRtt, self.jitter)
+    report = "%s, sent %d, received %d, lost %.1f%%, late %d, resent inputs %d, stalled frames %d" % (
+      latency, self.sent, self.received, 100 * self.loss(), self.late, self.resent, self.stalls)
+    if self.rollbacks > 0:
+      report += ", rollbacks %d (%d ticks replayed)" % (self.rollbacks, self.resimulated)
+    if self.desyncTick is not None:
+      report += ", DESYNC at tick %d" % self.desyncTick
+    return report
+
+###################################################################################
+#                                      Peer                                       #
+###################################################################################
+
+class LockstepPeer:
+  """One end of a lockstep connection, sending inputs over UDP until they are acknowledged"""
+  REDUNDANCY = 32 # most unacknowledged inputs sent in one packet
+  HASHES = 8 # most state hashes sent in one packet
+  HASHHISTORY = 256 # ticks state hashes are kept for to compare with the remote's
+  RETRY = .2 # seconds between hello packets while connecting
+  TIMEOUT = 10 # seconds without packets before the peer is considered gone
+
+  def __init__(self, localKey : str, port : int, remoteAddress : tuple = None, delay : int = 3):
+    self.localKey = localKey
+    self.remoteKey = "P2" if localKey == "P1" else "P1"
+    self.delay = delay # ticks between sending an input and using it
+    self.connected = False
+    self.closed = False # set when the remote left or timed out
+    self.stats = NetStats()
+    self._remoteAddress = remoteAddress # learned from the first hello when hosting
+    self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self._socket.bind(("", port))
+    self._socket.setblocking(False)
+    self._sequence = 0
+    self._unacked = {} # local inputs by tick until the remote has them
+    self._nextLocal = 0 # first tick without local input
+    self._sentUpTo = 0 # first tick never sent
+    self._ackedLocal = -1 # last local tick the remote has with all before it
+    self._remoteInputs = {} # remote inputs by tick until taken
+    self._remoteReceived = -1 # last remote tick received with all before it
+    self._hashes = {} # local state hashes by tick, kept until they are old
+    self._lastHashed = -1 # last tick a local state hash was recorded for
+    self._remoteHashes = {} # remote state hashes of ticks not yet played here
+    self._unsentHashes = [] # (tick, hash) pairs for the next packet
+    self._echo = NOECHO # sent ms of the last packet received
+    self._echoTime = 0 # when it was received
+    self._lastHeard = time.monotonic()
+
+  @staticmethod
+  def host(port : int, delay : int = 3):
+    """Return the P1 peer waiting for a player to join on a port"""
+    return LockstepPeer("P1", port, None, delay)
+
+  @staticmethod
+  def join(address : tuple, port : int = 0):
+    """Return the P2 peer joining a host, the input delay is the host's"""
+    return LockstepPeer("P2", port, address, 0)
+
+  ###################################################################
+  #                          Connection                             #
+  ###################################################################
+
+  def connect(self, timeout : float = None) -> bool:
+    """Exchange hello packets until connected, return False on timeout"""
+    start = time.monotonic()
+    lastHello = None
+    while not self.connected:
+      now = time.monotonic()
+      if timeout is not None and now - start > timeout:
+        return False
+      if self.localKey == "P2" and (lastHello is None or now - lastHello > LockstepPeer.RETRY):
+        self._send_hello()
+        lastHello = now
+      select.select([self._socket], [], [], LockstepPeer.RETRY)
+      self.receive()
+    return True
+
+  def _start(self, delay : int) -> None:
+    """Begin the match, the first ticks have no input so both peers can start at once"""
+    self.delay = delay
+    self.connected = True
+    self._lastHeard = time.monotonic()
+    for tick in range(delay):
+      self._remoteInputs[tick] = EMPTYINPUT
+    self._nextLocal = delay
+    self._sentUpTo = delay
+    self._ackedLocal = delay - 1
+    self._remoteReceived = delay - 1
+
+  def _send_hello(self) -> None:
+    self._socket.sendto(HELLOPACKET.pack(MAGIC, HELLO, VERSION, self.delay), self._remoteAddress)
+
+  def close(self) -> None:
+    """Tell the remote the match is over and release the socket"""
+    if self.connected and not self.closed:
+      try:
+        self._socket.sendto(HELLOPACKET.pack(MAGIC, BYE, VERSION, 0), self._remoteAddress)
+      except OSError:
+        pass
+    self.closed = True
+    self._socket.close()
+
+  ###################################################################
+  #                            Inputs                               #
+  ###################################################################
+
+  def next_local(self) -> int:
+    """Return the first tick without local input"""
+    return self._nextLocal
+
+  def add_local(self, input : tuple) -> int:
+    """Add the local input for the next tick, return that tick"""
+    tick = self._nextLocal
+    self._unacked[tick] = input
+    self._nextLocal += 1
+    return tick
+
+  def take_remote(self, tick : int) -> tuple:
+    """Remove and return the remote input for a tick, None if it has not arrived"""
+    return self._remoteInputs.pop(tick, None)
+
+  def add_hash(self, tick : int, stateHash : int) -> None:
+    """Record the state hash after a tick all inputs are final for, to send and compare"""
+    self._hashes[tick] = stateHash
+    self._hashes.pop(tick - LockstepPeer.HASHHISTORY, None)
+    self._lastHashed = tick
+    self._unsentHashes.append((tick, stateHash))
+    if tick in self._remoteHashes:
+      self._compare_hash(tick, self._remoteHashes.pop(tick))
+
+  def _compare_hash(self, tick : int, remoteHash : int) -> None:
+    """Report the first tick the remote's state hash differs at"""
+    if remoteHash != self._hashes[tick] and (self.stats.desyncTick is None or tick < self.stats.desyncTick):
+      self.stats.desyncTick = tick
+      logger.error("state differs from %s after tick %d: %016x here, %016x there",
+                   self._remoteAddress, tick, self._hashes[tick], remoteHash)
+
+  def all_acknowledged(self) -> bool:
+    """Return true once the remote has every local input"""
+    return self._ackedLocal >= self._nextLocal - 1
+
+  ###################################################################
+  #                            Packets                              #
+  ###################################################################
+
+  def send(self) -> None:
+    """Send every unacknowledged local input, oldest first"""
+    if not self.connected or self.closed:
+      return
+    first = self._ackedLocal + 1
+    last = min(self._nextLocal, first + LockstepPeer.REDUNDANCY)
+    # Hashes are not resent, a lost one only delays noticing a desync to a later tick
+    hashes = self._unsentHashes[-LockstepPeer.HASHES:]
+    self._unsentHashes.clear()
+    payload = b"".join(TICKHASH.pack(tick, stateHash) for tick, stateHash in hashes)
+    payload += b"".join(encode_input(self._unacked[tick]) for tick in range(first, last))
+    now = milliseconds()
+    hold = 0
+    if self._echo != NOECHO:
+      hold = min(0xFFFF, (now - self._echoTime) & 0xFFFFFFFF)
+    header = HEADER.pack(MAGIC, INPUTS, self._sequence, self._remoteReceived, now,
+                         self._echo, hold, first, last - first, len(hashes))
+    try:
+      self._socket.sendto(header + payload, self._remoteAddress)
+    except OSError as error:
+      logger.warning("sending to %s failed: %s", self._remoteAddress, error)
+      return
+    self._sequence += 1
+    self.stats.sent += 1
+    self.stats.resent += max(0, min(last, self._sentUpTo) - first)
+    self._sentUpTo = max(self._sentUpTo, last)
+
+  def receive(self) -> None:
+    """Read every waiting packet"""
+    while not self.closed:
+      try:
+        data, address = self._socket.recvfrom(2048)
+      except (BlockingIOError, InterruptedError):
+        break
+      except OSError:
+        # ICMP port unreachable while the remote is not listening yet
+        continue
+      try:
+        self._read_packet(data, address)
+      except (struct.error, IndexError, ValueError):
+        logger.warning("ignored a malformed packet from %s", address)
+    if self.connected and not self.closed and time.monotonic() - self._lastHeard > LockstepPeer.TIMEOUT:
+      logger.warning("no packets from %s for %d seconds", self._remoteAddress, LockstepPeer.TIMEOUT)
+      self.closed = True
+
+  def _read_packet(self, data : bytes, address : tuple) -> None:
+    """Handle a single packet"""
+    magic, kind = data[:2], data[2]
+    if magic != MAGIC:
+      return
+    if kind == HELLO:
+      magic, kind, version, delay = HELLOPACKET.unpack_from(data)
+      if version != VERSION:
+        logger.warning("%s uses protocol version %d, not %d", address, version, VERSION)
+        return
+      if self.localKey == "P1":
+        if self._remoteAddress is None:
+          self._remoteAddress = address
+        if address == self._remoteAddress:
+          # Answer every hello in case earlier answers were lost
+          self._send_hello()
+          if not self.connected:
+            self._start(self.delay)
+      elif not self.connected and address == self._remoteAddress:
+        self._start(delay)
+      return
+    if address != self._remoteAddress or not self.connected:
+      return
+    self._lastHeard = time.monotonic()
+    if kind == BYE:
+      self.closed = True
+      return
+    magic, kind, sequence, ack, sent, echo, hold, first, count, hashCount = HEADER.unpack_from(data)
+    self.stats.record_sequence(sequence)
+    now = milliseconds()
+    if echo != NOECHO:
+      self.stats.record_rtt(((now - echo) & 0xFFFFFFFF) - hold)
+    self._echo = sent
+    self._echoTime = now
+    if ack > self._ackedLocal:
+      for tick in range(self._ackedLocal + 1, ack + 1):
+        self._unacked.pop(tick, None)
+      self._ackedLocal = ack
+    for i in range(hashCount):
+      tick, remoteHash = TICKHASH.unpack_from(data, HEADER.size + i * TICKHASH.size)
+      if tick in self._hashes:
+        self._compare_hash(tick, remoteHash)
+      elif tick > self._lastHashed:
+        self._remoteHashes[tick] = remoteHash
+    for i, input in enumerate(decode_inputs(data, HEADER.size + hashCount * TICKHASH.size, count)):
+      tick = first + i
+      if tick > self._remoteReceived:
+        self._remoteInputs[tick] = input
+    while self._remoteReceived + 1 in self._remoteInputs:
+      self._remoteReceived += 1
+
+###################################################################################
+#                                    Session                                      #
+###################################################################################
+
+class LockstepSession:
+  """Advances a Match in lockstep with a peer, simulating each tick once both players' inputs are known"""
+  STATSINTERVAL = 200 # ticks between logged connection reports
+
+  def __init__(self, match : Match, peer : LockstepPeer, get_chip, replay=None):
+    # The peer must be connected so its input delay is known
+    self._match = match
+    self._peer = peer
+    self._get_chip = get_chip # returns a new chip instance for a chip id
+    self._replay = replay # ReplayWriter every tick is recorded to once both inputs are final, None does not record
+    self.tick = 0 # next tick to simulate
+    self._moves = [] # local movements waiting for a tick
+    self._chipOrder = None # local chip order waiting for a tick
+    self._scheduled = {} # local inputs by tick until simulated
+    for tick in range(peer.delay):
+      self._scheduled[tick] = EMPTYINPUT
+    self._orderPending = False # a local chip order has not been simulated yet
+
+  def local_key(self) -> str:
+    """Return the key of the player controlled here"""
+    return self._peer.localKey
+
+  def stats(self) -> NetStats:
+    return self._peer.stats
+
+  def closed(self) -> bool:
+    """Return true if the remote left or stopped answering"""
+    return self._peer.closed
+
+  def predicted(self) -> int:
+    """Return the number of ticks played on guessed remote input, never any in lockstep"""
+    return 0
+
+  def choosing(self) -> bool:
+    """Return true while the local player should choose chips"""
+    return not self._match.on_stage(self.local_key()) and not self._orderPending
+
+  def queue_move(self, movement : tuple) -> None:
+    """Send a local movement as input of the next tick available"""
+    self._moves.append(movement)
+
+  def queue_chips(self, chipOrder : list) -> None:
+    """Send a local chip order as input of the next tick available"""
+    self._chipOrder = tuple((chip.id, chip.highlightFrames) for chip in chipOrder)
+    self._orderPending = True
+
+  def advance(self, on_tick=None) -> int:
+    """Exchange inputs and simulate every tick both are known for, calling on_tick after each, return ticks simulated"""
+    peer = self._peer
+    peer.receive()
+    if peer.next_local() <= self.tick + peer.delay:
+      movement = self._moves.pop(0) if len(self._moves) > 0 else (0, 0)
+      tick = peer.add_local((movement, self._chipOrder))
+      self._scheduled[tick] = (movement, self._chipOrder)
+      self._chipOrder = None
+    simulated = 0
+    # Both peers stop on the tick the match ends, however many ticks of input arrived at once
+    while self.tick in self._scheduled and not self._match.events["GAMEOVER"]:
+      remote = peer.take_remote(self.tick)
+      if remote is None:
+        break
+      local = self._scheduled.pop(self.tick)
+      if self._replay is not None:
+        self._record(local, remote, self._match.snapshot())
+      self._simulate(local, remote)
+      peer.add_hash(self.tick, self._match.state_hash())
+      self.tick += 1
+      simulated += 1
+      if self.tick % LockstepSession.STATSINTERVAL == 0:
+        logger.info("tick %d: %s", self.tick, peer.stats.summary())
+      if on_tick is not None:
+        on_tick()
+    if simulated == 0:
+      peer.stats.stalls += 1
+    peer.send()
+    return simulated
+
+  def flush(self) -> None:
+    """Keep answering the remote without simulating, so it can reach the ticks already played here"""
+    self._peer.receive()
+    self._peer.send()
+
+  def close(self) -> None:
+    logger.info("session closed at tick %d: %s", self.tick, self._peer.stats.summary())
+    self._peer.close()
+
+  def _simulate(self, local : tuple, remote : tuple) -> None:
+    """Apply both players' inputs then advance the match one tick, in the same order on both peers"""
+    if local[1] is not None:
+      self._orderPending = False
+    play_tick(self._match, self._by_key(local, remote), self._get_chip)
+
+  def _record(self, local : tuple, remote : tuple, snapshot : tuple) -> None:
+    """Add a tick to the replay with the match snapshot taken before it"""
+    self._replay.append(self._by_key(local, remote), snapshot)
+
+  def _by_key(self, local : tuple, remote : tuple) -> tuple:
+    """Return local and remote inputs as P1's and P2's"""
+    if self._peer.localKey == "P1":
+      return (local, remote)
+    return (remote, local)
+
+###################################################################################
+#                                      Proxy                                      #
+###################################################################################
+
+class LossyProxy:
+  """Forwards UDP packets between a joining peer and a host, dropping and delaying some"""
+  def __init__(self, port : int, target : tuple, loss : float = 0, latency : float = 0, jitter : float = 0, rng=random):
+    self._target = target
+    self._loss = loss # fraction of packets dropped
+    self._latency = latency # ms added to every packet
+    self._jitter = jitter # most ms added or removed at random, so packets may be reordered
+    self._random = rng
+    self._client = None # address of the joining peer, learned from its first packet
+    self._queue = [] # (due time, order, packet, address) heap
+    self._order = 0
+    self.forwarded = 0
+    self.dropped = 0
+    self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self._socket.bind(("", port))
+
+  def run(self, duration : float = None) -> None:
+    """Forward packets until stopped, or for a number of seconds"""
+    end = None if duration is None else time.monotonic() + duration
+    while end is None or time.monotonic() < end:
+      timeout = 1.0
+      if len(self._queue) > 0:
+        timeout = max(0, self._queue[0][0] - time.monotonic())
+      readable, writable, failed = select.select([self._socket], [], [], timeout)
+      if readable:
+        try:
+          data, address = self._socket.recvfrom(2048)
+          self._forward(data, address)
+        except OSError:
+          pass
+      now = time.monotonic()
+      while len(self._queue) > 0 and self._queue[0][0] <= now:
+        due, order, data, address = heapq.heappop(self._queue)
+        try:
+          self._socket.sendto(data, address)
+        except OSError:
+          pass
+
+  def _forward(self, data : bytes, address : tuple) -> None:
+    """Queue a packet for the other side, unless it is dropped"""
+    if address == self._target:
+      destination = self._client
+    else:
+      self._client = address
+      destination = self._target
+    if destination is None:
+      return
+    if self._random.random() < self._loss:
+      self.dropped += 1
+      return
+    delay = self._latency + self._random.uniform(-self._jitter, self._jitter)
+    heapq.heappush(self._queue, (time.monotonic() + max(0, delay) / 1000, self._order, data, destination))
+    self._order += 1
+    self.forwarded += 1
+
+###################################################################################
+#                                    Headless                                     #
+###################################################################################
+
+def play_headless(peer : LockstepPeer, seed : int, frameTime : float, maxTicks : int, rollback : int = 0,
+                  record : str = None) -> Match:
+  """Play a match with random inputs until it ends, in lockstep or with up to rollback predicted ticks, return the match"""
+  from common.headless import HeadlessChips
+  from common.combat import random_folder
+  from common.rollback import RollbackSession
+  from common.replay import ReplayWriter, replay_match
+  rng = random.Random(seed)
+  folder = random_folder(rng)
+  match = replay_match(folder, folder, seed, False)
+  replay = ReplayWriter(record, seed, folder, folder, bot=False) if record is not None else None
+  if rollback > 0:
+    session = RollbackSession(match, peer, HeadlessChips.get_chip, rollback, replay)
+  else:
+    session = LockstepSession(match, peer, HeadlessChips.get_chip, replay)
+  nextFrame = time.monotonic()
+  while (match.winner() is None or session.predicted() > 0) and session.tick < maxTicks and not session.closed():
+    if session.choosing():
+      chipOrder = [HeadlessChips.get_chip(id) for id in rng.sample(folder, rng.randint(1, 5))]
+      for chip in chipOrder:
+        chip.set_speed(rng.choice((5, 10, 30)))
+      session.queue_chips(chipOrder)
+    if rng.random() < .15:
+      session.queue_move(rng.choice(MOVES[1:]))
+    session.advance()
+    nextFrame += frameTime
+    time.sleep(max(0, nextFrame - time.monotonic()))
+  # Keep answering until the remote has every input it needs to finish too
+  end = time.monotonic() + 2
+  while not peer.all_acknowledged() and not peer.closed and time.monotonic() < end:
+    session.flush()
+    time.sleep(frameTime)
+  print("tick", session.tick, "winner", match.winner(), "state hash %016x" % match.state_hash())
+  print(peer.stats.summary())
+  session.close()
+  if replay is not None:
+    replay.close()
+    print("replay of %d ticks written to %s" % (replay.tick, replay.path))
+  return match
+
+def parse_address(text : str) -> tuple:
+  """Convert HOST:PORT to an address tuple, raise ValueError if text is not one"""
+  host, port = text.rsplit(":", 1)
+  if not 0 < int(port) < 65536:
+    raise ValueError("port %s is outside 1 to 65535" % port)
+  return (host or "127.0.0.1", int(port))
+
+
+if __name__ == "__main__":
+  # python -m common.netplay host PORT [--delay TICKS] [options]
+  # python -m common.netplay join HOST:PORT [options]
+  #   options: --seed N, --frame-ms MS, --ticks N, --rollback TICKS, --record PATH
+  # python -m common.netplay proxy PORT HOST:PORT [--loss FRACTION] [--latency MS] [--jitter MS] [--seed N]
+  from argparse import ArgumentParser
+  parser = ArgumentParser(description="Headless lockstep peer and a lossy proxy for testing it")
+  parser.add_argument("mode", choices=("host", "join", "proxy"))
+  parser.add_argument("address", help="PORT to host or proxy on, or HOST:PORT to join")
+  parser.add_argument("target", nargs="?", help="HOST:PORT the proxy forwards to")
+  parser.add_argument("--delay", type=int, default=3, help="input delay in ticks when hosting")
+  parser.add_argument("--seed", type=int, default=0, help="seed of the random inputs played")
+  parser.add_argument("--frame-ms", type=float, default=50, help="ms between ticks")
+  parser.add_argument("--ticks", type=int, default=20000, help="most ticks played")
+  parser.add_argument("--rollback", type=int, default=0, help="most ticks played on guessed input, 0 for lockstep")
+  parser.add_argument("--record", metavar="PATH", help="write a replay of the match to PATH")
+  parser.add_argument("--loss", type=float, default=0, help="fraction of packets the proxy drops")
+  parser.add_argument("--latency", type=float, default=0, help="ms the proxy delays each packet")
+  parser.add_argument("--jitter", type=float, default=0, help="most ms the proxy adds or removes at random")
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+  if args.mode == "proxy":
+    proxy = LossyProxy(int(args.address), parse_address(args.target), args.loss, args.latency, args.jitter,
+                       random.Random(args.seed))
+    try:
+      proxy.run()
+    except KeyboardInterrupt:
+      print("forwarded", proxy.forwarded, "dropped", proxy.dropped)
+    sys.exit(0)
+  if args.record is not None:
+    from common.replay import check_header, ReplayWriter
+    try:
+      check_header(args.seed, ReplayWriter.KEYFRAMEINTERVAL)
+    except ValueError as error:
+      parser.error(str(error))
+  if not 1 <= args.delay <= LockstepPeer.REDUNDANCY:
+    # Inputs in flight must fit in one packet
+    parser.error("--delay must be between 1 and %d" % LockstepPeer.REDUNDANCY)
+  if args.mode == "host":
+    peer = LockstepPeer.host(int(args.address), args.delay)
+  else:
+    peer = LockstepPeer.join(parse_address(args.address))
+  print("waiting for peer")
+  if not peer.connect(30):
+    print("no peer answered")
+    sys.exit(1)
+  print("connected as", peer.localKey, "with input delay", peer.delay)
+  play_headless(peer, args.seed, args.frame_ms / 1000, args.ticks, args.rollback, args.record)
@@ -1,11 +1,12 @@
 from common.chips import Folder
-from common.containers import Matrix, Chain
-from random import randint
+from common.containers import SIDECOLS, Chain
+from common.trace import traced
+from common.statehash import HashedState
+import random
 
-EMPTYMATRIX = Matrix([[False]*3]*3)
-
-class Player:
+class Player(HashedState):
   MAXHEALTH = 3
+  HASHED = ("_stage_position", "_health")
 
   def __init__(self, folder : Folder):
     self._folder = folder
@@ -41,44 +42,61 @@ class Player:
     "Return player asset position"
     return self._asset_position
 
+  def snapshot(self) -> tuple:
+    """Return the stage position and health"""
+    return (self._stage_position, self._health)
+
+  def restore(self, snapshot : tuple) -> None:
+    """Set the state returned by snapshot"""
+    self._stage_position, self._health = snapshot
+
+
+PLANNERS = ("greedy", "lookahead") # ways a Bot plans its route through the hits of a round
 
 class Bot(Player):
-  def __init__(self, folder : Folder):
+  # The random state is too big to hash every draw, so it is stood for by the state
+  # it started in and the number of actions that drew from it since
+  HASHED = Player.HASHED + ("_randomStart", "_randomUses")
+
+  def __init__(self, folder : Folder, rng=random, firstCol : int = SIDECOLS, errorRate : int = 5,
+               movementCooldown : int = 2, planner : str = "greedy"):
     super().__init__(folder)
-    self.hitOrder = Chain()
+    if planner not in PLANNERS:
+      raise ValueError("unknown planner %r, expected one of %s" % (planner, ", ".join(PLANNERS)))
+    self._random = rng # random number generator for chips and mistakes
+    self._randomStart = hash(rng.getstate()[1]) # ints hash the same in every process
+    self._randomUses = 0 # actions that drew random numbers
+    self._firstCol = firstCol # first stage column of the bot's side, P2's unless playing P1
+    self.hitOrder = Chain() # side masks of the bot's side by tick
     self._route = []
-    self._errorRate = 5
-    self._movementCooldown = 2
+    self._errorRate = errorRate # percent of dodges that move at random
+    self._movementCooldown = movementCooldown # ticks stood still between idle moves
+    self._planner = planner
     self._frameCounter = 0
 
   ###################################################################
   #                            Actions                              #
   ###################################################################
 
+  @traced("Bot.analyze")
   def analyze(self) -> None:
     """Determine the route for the bot to take"""
     self._route.clear()
-    position = self._stage_position
-    for i in range(len(self.hitOrder)):
-      currentHit = self.hitOrder[i]
-      nextHit = EMPTYMATRIX
-      if i + 1 < len(self.hitOrder):
-        nextHit = self.hitOrder[i+1]
-      safePanels = self._safe_panels(nextHit)
-      safeSteps = self._safe_steps(currentHit, position)
-      bestStep = self._best_step(safeSteps, safePanels)
-      self._route.append(self._vector(bestStep, position))
-      position = bestStep
+    if self._planner == "lookahead":
+      self._plan_lookahead()
+    else:
+      self._plan_greedy()
 
   def dodge(self) -> tuple:
     """Return next movement vector on route"""
     self._frameCounter = 0
     if len(self._route) == 0:
       return self.idle()
-    rand = randint(1, 100)
+    self._randomUses += 1
+    rand = self._random.randint(1, 100)
     if rand <= self._errorRate:
       vectors = [(1, 0), (-1, 0), (0, 1), (0, -1)]
-      rand = randint(0, 3)
+      rand = self._random.randint(0, 3)
       return vectors[rand]
     return self._route.pop(0)
   
@@ -88,17 +106,20 @@ class Bot(Player):
       self._frameCounter += 1
       return (0, 0)
     self._frameCounter = 0
+    self._randomUses += 1
     vectors = [(1, 0), (-1, 0), (0, 1), (0, -1)]
-    rand = randint(0, 3)
+    rand = self._random.randint(0, 3)
     return vectors[rand]
 
+  @traced("Bot.select_chips")
   def select_chips(self) -> list:
     """Build chip order"""
-    self._folder.shuffle()
+    self._randomUses += 1
+    self._folder.shuffle(self._random)
     chipOrder = []
     for i in range(5):
       chip = self._folder.draw()
-      rand = randint(0, 2)
+      rand = self._random.randint(0, 2)
       if rand == 0:
         chip.fast()
       elif rand == 1:
@@ -107,11 +128,75 @@ class Bot(Player):
         chip.slow()
       chipOrder.append(chip)
     return chipOrder
+
+  def snapshot(self) -> tuple:
+    """Return the player state, route, movement counter, folder order and random state"""
+    # The hit order is replaced, never modified, so it is kept by reference
+    return (super().snapshot(), tuple(self._route), self._frameCounter, self.hitOrder,
+            self._folder.snapshot(), self._random.getstate(), self._randomUses)
+
+  def restore(self, snapshot : tuple) -> None:
+    """Set the state returned by snapshot"""
+    playerState, route, self._frameCounter, self.hitOrder, folderOrder, randomState, self._randomUses = snapshot
+    super().restore(playerState)
+    self._route[:] = route
+    self._folder.restore(folderOrder)
+    self._random.setstate(randomState)
   
 ###################################################################
 #                            Helpers                              #
 ###################################################################
 
+  def _plan_greedy(self) -> None:
+    """Plan each step towards the panel safe from the next hit nearest to a step safe from the current one"""
+    position = self._stage_position
+    segments = list(self.hitOrder.segments())
+    for i in range(len(segments)):
+      currentHit, ticks = segments[i]
+      nextHit = 0
+      if i + 1 < len(segments):
+        nextHit = segments[i+1][0]
+      # Every tick but the last of a run is followed by the same hit
+      position = self._plan_run(currentHit, currentHit, position, ticks-1)
+      position = self._plan_run(currentHit, nextHit, position, 1)
+
+  def _plan_lookahead(self) -> None:
+    """Plan the steps standing on the fewest hit panels over the whole round, then making the fewest moves"""
+    costs = {self._stage_position : (0, 0)} # (hits, moves) of the best steps to each panel reached
+    choices = [] # panel stepped from to reach each panel, by tick
+    for hit in self.hitOrder:
+      nextCosts = {}
+      previous = {}
+      for position, (hits, moves) in costs.items():
+        for step in self._safe_steps(0, position):
+          row, col = step
+          cost = (hits + (hit >> (row*SIDECOLS + col-self._firstCol) & 1), moves + (step != position))
+          if step not in nextCosts or cost < nextCosts[step]:
+            nextCosts[step] = cost
+            previous[step] = position
+      costs = nextCosts
+      choices.append(previous)
+    if len(choices) == 0:
+      return
+    position = min(costs, key=costs.get)
+    for previous in reversed(choices):
+      self._route.append(self._vector(position, previous[position]))
+      position = previous[position]
+    self._route.reverse()
+
+  def _plan_run(self, currentHit : int, nextHit : int, position : tuple, ticks : int) -> tuple:
+    """Add steps for ticks with the same hits to the route and return the final position"""
+    safePanels = self._safe_panels(nextHit)
+    for tick in range(ticks):
+      bestStep = self._best_step(self._safe_steps(currentHit, position), safePanels)
+      self._route.append(self._vector(bestStep, position))
+      if bestStep == position:
+        # The same step is chosen for the rest of the run
+        self._route += [(0, 0)] * (ticks - tick - 1)
+        break
+      position = bestStep
+    return position
+
   def _best_step(self, steps : list, safePanels : list) -> tuple:
     """Return best step to take in safe steps list"""
     if len(steps) == 0:
@@ -126,16 +211,16 @@ class Bot(Player):
         minDist = dist
     return bestStep
 
-  def _safe_panels(self, nextHit : Matrix) -> list:
+  def _safe_panels(self, nextHit : int) -> list:
     """Return a list of all panels safe to stand on"""
     safePanels = []
-    for row in range(len(nextHit)):
-      for col in range(len(nextHit[row])):
-        if not nextHit[row][col]:
-          safePanels.append((row, col+3))
+    for row in range(3):
+      for col in range(SIDECOLS):
+        if not nextHit >> (row*SIDECOLS + col) & 1:
+          safePanels.append((row, col+self._firstCol))
     return safePanels
   
-  def _safe_steps(self, currentHit : Matrix, position : tuple) -> tuple:
+  def _safe_steps(self, currentHit : int, position : tuple) -> tuple:
     """Return a list of safe movement options"""
     possibleSteps = [(0, 0), (-1, 0), (0, -1), (1, 0), (0, 1)]
     safeSteps = []
@@ -143,9 +228,9 @@ class Bot(Player):
     for step in possibleSteps:
       stepRow = row + step[0]
       stepCol = col + step[1]
-      if not (0 <= stepRow < 3) or not (3 <= stepCol < 6):
+      if not (0 <= stepRow < 3) or not (self._firstCol <= stepCol < self._firstCol+SIDECOLS):
         continue
-      if not currentHit[stepRow][stepCol-3]:
+      if not currentHit >> (stepRow*SIDECOLS + stepCol-self._firstCol) & 1:
         safeSteps.append((stepRow, stepCol))
     return safeSteps
 
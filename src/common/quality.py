@@ -0,0 +1,82 @@
+import logging
+from common.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+# (description, Settings attribute, lowered value, rebuild assets), lowered in order
+STEPS = [
+  ("pause background animation", "BACKGROUNDANIMATION", False, False),
+  ("draw coarser levels of detail", "LODBIAS", .5, True),
+  ("render at 75% resolution", "RENDERSCALE", .75, True),
+  ("render at 50% resolution", "RENDERSCALE", .5, True),
+  ("draw text without antialiasing", "TEXTANTIALIAS", False, True),
+]
+
+class QualityController:
+  WINDOW = 20 # drawn frames averaged per decision
+  HEADROOM = .5 # fraction of the budget frames must stay under to step up
+  STEPUPDELAY = 100 # drawn frames with headroom needed before stepping up
+
+  def __init__(self, budget : float, rebuild):
+    self._budget = budget # seconds a frame may take
+    self._rebuild = rebuild # called when a step changes how assets are built
+    self._previous = [] # Settings values replaced by each step taken
+    self._frameTimes = []
+    self._headroomFrames = 0
+    self._stepUpDelay = QualityController.STEPUPDELAY
+    self._steppedUp = False # True until the level reached by stepping up is proven
+
+  def level(self) -> int:
+    """Return the number of quality steps taken down"""
+    return len(self._previous)
+
+  def record(self, seconds : float) -> None:
+    """Record the time taken to draw a frame and adjust quality if needed"""
+    self._frameTimes.append(seconds)
+    if len(self._frameTimes) < QualityController.WINDOW:
+      return
+    average = sum(self._frameTimes) / len(self._frameTimes)
+    self._frameTimes.clear()
+    if average > self._budget:
+      self._headroomFrames = 0
+      if self._steppedUp:
+        # The last step up did not hold, wait longer before trying again
+        self._stepUpDelay *= 2
+        self._steppedUp = False
+      self._step_down(average)
+      return
+    self._steppedUp = False
+    if average < self._budget * QualityController.HEADROOM:
+      self._headroomFrames += QualityController.WINDOW
+      if self._headroomFrames >= self._stepUpDelay:
+        self._headroomFrames = 0
+        self._step_up(average)
+    else:
+      self._headroomFrames = 0
+
+  def _step_down(self, average : float) -> None:
+    """Lower quality by the next step"""
+    if self.level() == len(STEPS):
+      return
+    description, attribute, value, rebuild = STEPS[self.level()]
+    previous = getattr(Settings, attribute)
+    self._previous.append(previous)
+    if not isinstance(value, bool):
+      value = min(previous, value)
+    setattr(Settings, attribute, value)
+    logger.info("frames took %.1f ms of a %.1f ms budget, quality level %d: %s",
+                average*1000, self._budget*1000, self.level(), description)
+    if rebuild:
+      self._rebuild()
+
+  def _step_up(self, average : float) -> None:
+    """Undo the last quality step"""
+    if self.level() == 0:
+      return
+    description, attribute, value, rebuild = STEPS[self.level()-1]
+    setattr(Settings, attribute, self._previous.pop())
+    self._steppedUp = True
+    logger.info("frames took %.1f ms of a %.1f ms budget, quality level %d: stop %s",
+                average*1000, self._budget*1000, self.level(), description)
+    if rebuild:
+      self._rebuild()
@@ -0,0 +1,506 @@
+import sys
+import time
+import zlib
+import struct
+import random
+from common.combat import Match
+from common.containers import Chain, Timeline
+from common.chips import ChipInstance
+from common.netplay import encode_input, decode_inputs, play_tick, EMPTYINPUT
+
+# A replay is the setup of a match and the inputs of every tick, which replay
+# exactly since matches are deterministic. Every KEYFRAMEINTERVAL ticks it also
+# holds a keyframe, the full match snapshot before that tick, so seeking restores
+# the keyframe before the tick wanted and plays at most an interval of ticks.
+#
+# File: header, folders, then blocks as they are recorded. Closing adds an index of
+# keyframe offsets and a trailer pointing at it. A file without a trailer, one still
+# being recorded or cut short, is indexed by reading the block headers instead.
+
+MAGIC = b"CSRP"
+VERSION = 1
+HEADER = struct.Struct("!4sBBHQ") # magic, version, flags, keyframe interval, seed
+MAXINTERVAL = 0xFFFF # longest keyframe interval the header holds
+MAXSEED = (1 << 64) - 1 # largest seed the header holds
+COMPRESSED = 1 # block payloads are zlib compressed
+BOT = 2 # P2 is a Bot, so only P1's inputs are stored
+
+KEYFRAME = 0 # payload is an encoded match snapshot
+INPUTS = 1 # payload is the inputs of consecutive ticks
+INDEX = 2 # payload is the tick count and keyframe offsets
+BLOCKHEADER = struct.Struct("!BIII") # kind, first tick, ticks of inputs, payload size
+TRAILER = struct.Struct("!Q4s") # offset of the index block, end magic
+ENDMAGIC = b"CSRX"
+
+TICKTIME = .05 # seconds per tick in realtime, the game's frame rate
+
+def replay_match(p1Folder : list, p2Folder : list, seed : int, bot : bool) -> Match:
+  """Return the match a replay starts from"""
+  from common.headless import new_match
+  return new_match(p1Folder, p2Folder, random.Random(seed), bot)
+
+def check_header(seed : int, keyframeInterval : int) -> None:
+  """Raise ValueError unless a seed and keyframe interval fit in a replay header"""
+  if not 0 <= seed <= MAXSEED:
+    raise ValueError("seed %d is outside 0 to %d" % (seed, MAXSEED))
+  if not 0 < keyframeInterval <= MAXINTERVAL:
+    raise ValueError("keyframe interval %d is outside 1 to %d ticks" % (keyframeInterval, MAXINTERVAL))
+
+def chip_getter():
+  """Return the function replays make chip instances with"""
+  from common.headless import HeadlessChips
+  return HeadlessChips.get_chip
+
+###################################################################################
+#                                   Keyframes                                     #
+###################################################################################
+
+# Snapshots are nested tuples of ints, bools, None, chains, timelines and chips,
+# written as a tag byte and a varint or the items that follow. Chips are written
+# as their id and variant, so snapshots decode without the match they came from.
+
+NONE, FALSE, TRUE, INT, FLOAT, TUPLE, CHAIN, TIMELINE, CHIP = range(9)
+FLOATFORMAT = struct.Struct("!d")
+
+def write_varint(out : bytearray, value : int) -> None:
+  """Append a non-negative int 7 bits a byte, lowest first"""
+  while value >= 0x80:
+    out.append(value & 0x7F | 0x80)
+    value >>= 7
+  out.append(value)
+
+def read_varint(data : bytes, offset : int) -> tuple:
+  """Return the varint at an offset and the offset after it"""
+  value = shift = 0
+  while True:
+    byte = data[offset]
+    offset += 1
+    value |= (byte & 0x7F) << shift
+    if byte < 0x80:
+      return value, offset
+    shift += 7
+
+def write_chain(out : bytearray, chain : Chain) -> None:
+  """Append the runs of a chain"""
+  segments = list(chain.segments())
+  write_varint(out, len(segments))
+  for mask, ticks in segments:
+    write_varint(out, mask)
+    write_varint(out, ticks)
+
+def read_chain(data : bytes, offset : int) -> tuple:
+  """Return the chain at an offset and the offset after it"""
+  count, offset = read_varint(data, offset)
+  chain = Chain()
+  for i in range(count):
+    mask, offset = read_varint(data, offset)
+    ticks, offset = read_varint(data, offset)
+    chain.append(mask, ticks)
+  return chain, offset
+
+def write_state(out : bytearray, value) -> None:
+  """Append a snapshot value"""
+  if value is None:
+    out.append(NONE)
+  elif value is True or value is False:
+    out.append(TRUE if value else FALSE)
+  elif isinstance(value, int):
+    out.append(INT)
+    write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+  elif isinstance(value, float):
+    out.append(FLOAT)
+    out += FLOATFORMAT.pack(value)
+  elif isinstance(value, (tuple, list)):
+    out.append(TUPLE)
+    write_varint(out, len(value))
+    for item in value:
+      write_state(out, item)
+  elif isinstance(value, Chain):
+    out.append(CHAIN)
+    write_chain(out, value)
+  elif isinstance(value, Timeline):
+    out.append(TIMELINE)
+    for order in value.orders():
+      write_chain(out, order)
+  elif isinstance(value, ChipInstance):
+    out.append(CHIP)
+    write_varint(out, value.id)
+    write_varint(out, value.highlightFrames)
+  else:
+    raise TypeError("cannot write %s in a keyframe" % type(value).__name__)
+
+def read_state(data : bytes, offset : int, get_chip) -> tuple:
+  """Return the snapshot value at an offset and the offset after it, making chips with get_chip"""
+  tag = data[offset]
+  offset += 1
+  if tag == NONE:
+    return None, offset
+  if tag == FALSE or tag == TRUE:
+    return tag == TRUE, offset
+  if tag == INT:
+    code, offset = read_varint(data, offset)
+    return (code >> 1 if code & 1 == 0 else -((code + 1) >> 1)), offset
+  if tag == FLOAT:
+    return FLOATFORMAT.unpack_from(data, offset)[0], offset + FLOATFORMAT.size
+  if tag == TUPLE:
+    length, offset = read_varint(data, offset)
+    items = []
+    for i in range(length):
+      item, offset = read_state(data, offset, get_chip)
+      items.append(item)
+    return tuple(items), offset
+  if tag == CHAIN:
+    return read_chain(data, offset)
+  if tag == TIMELINE:
+    p1Order, offset = read_chain(data, offset)
+    p2Order, offset = read_chain(data, offset)
+    return Timeline(p1Order, p2Order), offset
+  if tag == CHIP:
+    id, offset = read_varint(data, offset)
+    frames, offset = read_varint(data, offset)
+    chip = get_chip(id)
+    chip.set_speed(frames)
+    return chip, offset
+  raise ValueError("unknown keyframe tag %d" % tag)
+
+def encode_snapshot(snapshot : tuple) -> bytes:
+  """Return the bytes of a match snapshot"""
+  out = bytearray()
+  write_state(out, snapshot)
+  return bytes(out)
+
+def decode_snapshot(data : bytes, get_chip) -> tuple:
+  """Return the match snapshot encoded in data"""
+  return read_state(data, 0, get_chip)[0]
+
+###################################################################################
+#                                    Writer                                       #
+###################################################################################
+
+class ReplayWriter:
+  """Records a match to a file a block at a time, so readers can follow it and a crash loses only the last block"""
+  KEYFRAMEINTERVAL = 600 # ticks between keyframes, most ticks played after a seek
+  CHUNKTICKS = 100 # most ticks of inputs kept before writing a block
+
+  def __init__(self, path : str, seed : int, p1Folder : list, p2Folder : list, bot : bool = True,
+               compress : bool = True, keyframeInterval : int = KEYFRAMEINTERVAL):
+    check_header(seed, keyframeInterval)
+    self.path = path
+    self.bot = bot
+    self.compress = compress
+    self.keyframeInterval = keyframeInterval
+    self.tick = 0 # next tick to record
+    self._inputs = bytearray() # inputs of ticks not yet written
+    self._inputsStart = 0 # first tick in _inputs
+    self._keyframes = [] # offset of every keyframe block
+    self._file = open(path, "wb")
+    flags = (COMPRESSED if compress else 0) | (BOT if bot else 0)
+    self._file.write(HEADER.pack(MAGIC, VERSION, flags, keyframeInterval, seed))
+    for folder in (p1Folder, p2Folder):
+      self._file.write(bytes([len(folder)] + list(folder)))
+
+  def append(self, inputs : tuple, snapshot : tuple) -> None:
+    """Record P1's and P2's inputs of the next tick, with the match snapshot taken before it"""
+    if self.tick % self.keyframeInterval == 0:
+      self._write_inputs()
+      self._keyframes.append(self._file.tell())
+      self._write_block(KEYFRAME, self.tick, 0, encode_snapshot(snapshot))
+    self._inputs += encode_input(inputs[0])
+    if not self.bot:
+      self._inputs += encode_input(inputs[1])
+    self.tick += 1
+    if self.tick - self._inputsStart >= ReplayWriter.CHUNKTICKS:
+      self._write_inputs()
+
+  def flush(self) -> None:
+    """Write every tick recorded so far, for readers following the file"""
+    self._write_inputs()
+
+  def close(self) -> None:
+    """Write the remaining ticks and the index"""
+    if self._file.closed:
+      return
+    self._write_inputs()
+    indexOffset = self._file.tell()
+    index = struct.pack("!I%dQ" % len(self._keyframes), self.tick, *self._keyframes)
+    self._file.write(BLOCKHEADER.pack(INDEX, 0, 0, len(index)) + index)
+    self._file.write(TRAILER.pack(indexOffset, ENDMAGIC))
+    self._file.close()
+
+  def _write_inputs(self) -> None:
+    """Write the inputs not yet written as a block"""
+    if self.tick > self._inputsStart:
+      self._write_block(INPUTS, self._inputsStart, self.tick - self._inputsStart, bytes(self._inputs))
+    self._inputs.clear()
+    self._inputsStart = self.tick
+
+  def _write_block(self, kind : int, tick : int, ticks : int, payload : bytes) -> None:
+    if self.compress:
+      payload = zlib.compress(payload)
+    self._file.write(BLOCKHEADER.pack(kind, tick, ticks, len(payload)) + payload)
+    # Readers following the recording see each block once it is complete
+    self._file.flush()
+
+###################################################################################
+#                                    Reader                                       #
+###################################################################################
+
+class ReplayReader:
+  """Seeks and plays a replay file, including one still being recorded"""
+  def __init__(self, path : str, get_chip=None):
+    self._get_chip = get_chip if get_chip is not None else chip_getter()
+    self._file = open(path, "rb")
+    magic, version, flags, self.keyframeInterval, self.seed = HEADER.unpack(self._file.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+      raise ValueError("%s is not a version %d replay" % (path, VERSION))
+    self.compressed = bool(flags & COMPRESSED)
+    self.bot = bool(flags & BOT)
+    self.p1Folder = self._read_folder()
+    self.p2Folder = self._read_folder()
+    self.ticks = 0 # ticks recorded
+    self.complete = False # the recording was closed and indexed
+    self._keyframes = [] # offset of every keyframe block
+    self._scanned = self._file.tell() # offset of the first block not yet indexed
+    if not self._read_index():
+      self.refresh()
+
+  def new_match(self) -> Match:
+    """Return the match as it was before the first tick"""
+    return replay_match(self.p1Folder, self.p2Folder, self.seed, self.bot)
+
+  def refresh(self) -> int:
+    """Index blocks written since the last refresh of a file still being recorded, return the ticks recorded"""
+    if self.complete:
+      return self.ticks
+    for kind, tick, ticks, offset, end in self._block_headers(self._scanned):
+      if kind == KEYFRAME:
+        self._keyframes.append(offset)
+      elif kind == INPUTS:
+        self.ticks = tick + ticks
+      self._scanned = end
+    return self.ticks
+
+  def seek(self, tick : int, match : Match = None) -> Match:
+    """Return a match as it was after a number of ticks, restored from the keyframe before and played forward"""
+    if not 0 <= tick <= self.ticks:
+      raise IndexError("tick %d is outside the %d ticks recorded" % (tick, self.ticks))
+    if match is None:
+      match = self.new_match()
+    if len(self._keyframes) == 0:
+      return match
+    keyframe = min(tick // self.keyframeInterval, len(self._keyframes) - 1)
+    offset = self._keyframes[keyframe]
+    self._file.seek(offset)
+    kind, start, ticks, size = BLOCKHEADER.unpack(self._file.read(BLOCKHEADER.size))
+    match.restore(decode_snapshot(self._payload(self._file.read(size)), self._get_chip))
+    self.play(match, start, tick)
+    return match
+
+  def play(self, match : Match, start : int, end : int = None, on_tick=None) -> int:
+    """Play a match that is at tick start up to tick end or the last tick recorded, calling on_tick(tick) after each, return the tick reached"""
+    end = self.ticks if end is None else min(end, self.ticks)
+    tick = start
+    if tick >= end:
+      return tick
+    keyframe = min(start // self.keyframeInterval, len(self._keyframes) - 1)
+    for kind, first, ticks, offset, blockEnd in self._block_headers(self._keyframes[keyframe]):
+      if kind != INPUTS or first + ticks <= tick:
+        continue
+      self._file.seek(offset + BLOCKHEADER.size)
+      inputs = self._decode_inputs(self._payload(self._file.read(blockEnd - offset - BLOCKHEADER.size)), ticks)
+      for played in inputs[tick - first:end - first]:
+        play_tick(match, played, self._get_chip)
+        tick += 1
+        if on_tick is not None:
+          on_tick(tick)
+      if tick >= end:
+        break
+    return tick
+
+  def keyframe_sizes(self) -> list:
+    """Return the stored size of every keyframe"""
+    sizes = []
+    for offset in self._keyframes:
+      self._file.seek(offset)
+      sizes.append(BLOCKHEADER.unpack(self._file.read(BLOCKHEADER.size))[3])
+    return sizes
+
+  def keyframe(self, index : int) -> tuple:
+    """Return the tick and encoded snapshot of a keyframe"""
+    self._file.seek(self._keyframes[index])
+    kind, tick, ticks, size = BLOCKHEADER.unpack(self._file.read(BLOCKHEADER.size))
+    return tick, self._payload(self._file.read(size))
+
+  def keyframes(self) -> int:
+    return len(self._keyframes)
+
+  def close(self) -> None:
+    self._file.close()
+
+  ###################################################################
+  #                           Helpers                               #
+  ###################################################################
+
+  def _read_folder(self) -> list:
+    length = self._file.read(1)[0]
+    return list(self._file.read(length))
+
+  def _read_index(self) -> bool:
+    """Load the index written on close, return False if there is none"""
+    self._file.seek(0, 2)
+    fileSize = self._file.tell()
+    if fileSize < self._scanned + TRAILER.size:
+      return False
+    self._file.seek(fileSize - TRAILER.size)
+    indexOffset, endMagic = TRAILER.unpack(self._file.read(TRAILER.size))
+    if endMagic != ENDMAGIC:
+      return False
+    self._file.seek(indexOffset)
+    kind, tick, ticks, size = BLOCKHEADER.unpack(self._file.read(BLOCKHEADER.size))
+    index = self._file.read(size)
+    count = (size - 4) // 8
+    self.ticks, *self._keyframes = struct.unpack("!I%dQ" % count, index)
+    self.complete = True
+    return True
+
+  def _block_headers(self, offset : int):
+    """Iterate (kind, first tick, ticks, offset, end offset) of every complete block from an offset"""
+    self._file.seek(0, 2)
+    fileSize = self._file.tell()
+    while offset + BLOCKHEADER.size <= fileSize:
+      self._file.seek(offset)
+      kind, tick, ticks, size = BLOCKHEADER.unpack(self._file.read(BLOCKHEADER.size))
+      end = offset + BLOCKHEADER.size + size
+      if kind == INDEX or end > fileSize:
+        return
+      yield kind, tick, ticks, offset, end
+      offset = end
+
+  def _payload(self, data : bytes) -> bytes:
+    return zlib.decompress(data) if self.compressed else data
+
+  def _decode_inputs(self, data : bytes, ticks : int) -> list:
+    """Return the (P1, P2) inputs of a number of ticks"""
+    if self.bot:
+      return [(input, EMPTYINPUT) for input in decode_inputs(data, 0, ticks)]
+    inputs = decode_inputs(data, 0, 2 * ticks)
+    return list(zip(inputs[0::2], inputs[1::2]))
+
+###################################################################################
+#                                  Command line                                   #
+###################################################################################
+
+def record(path : str, seed : int, maxTicks : int, keyframeInterval : int, compress : bool) -> None:
+  """Record a bot match with random P1 input until it ends"""
+  from common.combat import random_folder
+  rng = random.Random(seed)
+  p1Folder = random_folder(rng)
+  p2Folder = random_folder(rng)
+  match = replay_match(p1Folder, p2Folder, seed, True)
+  get_chip = chip_getter()
+  writer = ReplayWriter(path, seed, p1Folder, p2Folder, True, compress, keyframeInterval)
+  while match.winner() is None and writer.tick < maxTicks:
+    chipOrder = None
+    if not match.on_stage("P1"):
+      chipOrder = tuple((id, rng.choice((5, 10, 30))) for id in rng.sample(p1Folder, rng.randint(1, 5)))
+    movement = (0, 0)
+    if rng.random() < .15:
+      movement = rng.choice(((1, 0), (-1, 0), (0, 1), (0, -1)))
+    inputs = ((movement, chipOrder), EMPTYINPUT)
+    writer.append(inputs, match.snapshot())
+    play_tick(match, inputs, get_chip)
+  writer.close()
+  print("recorded %d ticks, winner %s, state hash %016x" % (writer.tick, match.winner(), match.state_hash()))
+
+def info(path : str) -> None:
+  """Print the setup and size of a replay"""
+  import os
+  reader = ReplayReader(path)
+  size = os.path.getsize(path)
+  keyframeBytes = sum(reader.keyframe_sizes())
+  print("%d ticks, %d keyframes every %d ticks, %s%s" % (reader.ticks, reader.keyframes(), reader.keyframeInterval,
+        "compressed" if reader.compressed else "uncompressed", "" if reader.complete else ", not closed"))
+  print("P1 folder %s" % reader.p1Folder)
+  print("P2 folder %s%s, seed %d" % (reader.p2Folder, " (bot)" if reader.bot else "", reader.seed))
+  print("%d bytes, %.2f per tick, %d in keyframes" % (size, size / max(1, reader.ticks), keyframeBytes))
+  reader.close()
+
+def seek(path : str, tick : int) -> None:
+  """Print the state hash after a number of ticks and the time taken to get there"""
+  reader = ReplayReader(path)
+  start = time.perf_counter()
+  match = reader.seek(tick)
+  elapsed = time.perf_counter() - start
+  print("tick %d: state hash %016x, winner %s, seek took %.2f ms" % (tick, match.state_hash(), match.winner(), elapsed * 1000))
+  reader.close()
+
+def play(path : str, start : int, end : int, speed : float) -> None:
+  """Play a replay at a multiple of realtime, as fast as possible when speed is 0, printing progress every second"""
+  reader = ReplayReader(path)
+  match = reader.seek(start)
+  began = time.perf_counter()
+  shown = [began]
+  def on_tick(tick):
+    now = time.perf_counter()
+    if speed > 0:
+      time.sleep(max(0, began + (tick - start) * TICKTIME / speed - now))
+    if now - shown[0] >= 1:
+      shown[0] = now
+      print("tick %d: state hash %016x" % (tick, match.state_hash()))
+  tick = reader.play(match, start, end, on_tick)
+  elapsed = time.perf_counter() - began
+  played = tick - start
+  print("tick %d: state hash %016x, winner %s" % (tick, match.state_hash(), match.winner()))
+  print("played %d ticks in %.3f s, %.0f times realtime" % (played, elapsed, played * TICKTIME / max(elapsed, 1e-9)))
+  reader.close()
+
+def verify(path : str) -> bool:
+  """Play a replay from the start and check every keyframe matches the match played to it"""
+  reader = ReplayReader(path)
+  match = reader.new_match()
+  mismatched = played = 0
+  for index in range(reader.keyframes()):
+    tick, encoded = reader.keyframe(index)
+    played = reader.play(match, played, tick)
+    if encode_snapshot(match.snapshot()) != encoded:
+      print("keyframe at tick %d does not match the ticks played to it" % tick)
+      mismatched += 1
+  print("%d of %d keyframes match" % (reader.keyframes() - mismatched, reader.keyframes()))
+  reader.close()
+  return mismatched == 0
+
+
+if __name__ == "__main__":
+  # python -m common.replay record PATH [--seed N] [--ticks N] [--interval TICKS] [--uncompressed]
+  # python -m common.replay info PATH
+  # python -m common.replay seek PATH TICK
+  # python -m common.replay play PATH [--from TICK] [--to TICK] [--speed X]
+  # python -m common.replay verify PATH
+  from argparse import ArgumentParser
+  parser = ArgumentParser(description="Record, inspect, seek and play replays")
+  parser.add_argument("mode", choices=("record", "info", "seek", "play", "verify"))
+  parser.add_argument("path", help="replay file")
+  parser.add_argument("tick", nargs="?", type=int, default=0, help="tick to seek to")
+  parser.add_argument("--seed", type=int, default=0, help="seed of the match recorded")
+  parser.add_argument("--ticks", type=int, default=100000, help="most ticks recorded")
+  parser.add_argument("--interval", type=int, default=ReplayWriter.KEYFRAMEINTERVAL, help="ticks between keyframes")
+  parser.add_argument("--uncompressed", action="store_true", help="store blocks without compression")
+  parser.add_argument("--from", dest="start", type=int, default=0, help="tick to start playing from")
+  parser.add_argument("--to", dest="end", type=int, default=None, help="tick to stop playing at")
+  parser.add_argument("--speed", type=float, default=0, help="multiple of realtime to play at, 0 for as fast as possible")
+  args = parser.parse_args()
+  if args.mode == "record":
+    try:
+      check_header(args.seed, args.interval)
+    except ValueError as error:
+      parser.error(str(error))
+    record(args.path, args.seed, args.ticks, args.interval, not args.uncompressed)
+  elif args.mode == "info":
+    info(args.path)
+  elif args.mode == "seek":
+    seek(args.path, args.tick)
+  elif args.mode == "play":
+    play(args.path, args.start, args.end, args.speed)
+  elif args.mode == "verify":
+    sys.exit(0 if verify(args.path) else 1)
+  sys.exit(0)
@@ -0,0 +1,181 @@
+import sys
+import time
+import random
+import logging
+from common.combat import Match
+from common.netplay import LockstepPeer, LockstepSession, EMPTYINPUT
+
+logger = logging.getLogger(__name__)
+
+# Rollback play: instead of waiting for the remote input of a tick, guess it and keep
+# going. A snapshot of the match is taken before every tick, so when the real input
+# arrives and differs from the guess the match is restored to that tick and played
+# forward again with the right inputs, all within one frame.
+
+MAXROLLBACK = 8 # most ticks played on guessed input before waiting
+
+class RollbackSession(LockstepSession):
+  """Advances a Match a tick every frame, predicting remote input and correcting mispredictions"""
+  def __init__(self, match : Match, peer : LockstepPeer, get_chip, maxRollback : int = MAXROLLBACK, replay=None):
+    super().__init__(match, peer, get_chip, replay)
+    self.maxRollback = maxRollback
+    self._confirmed = peer.delay - 1 # last tick with every remote input known before it
+    self._snapshots = {} # match snapshots taken before each unconfirmed tick
+    self._used = {} # remote inputs unconfirmed ticks were played with
+    self._remote = {} # remote inputs known for unconfirmed ticks
+    self._hashes = {} # state hashes after unconfirmed ticks
+
+  def advance(self, on_tick=None) -> int:
+    """Correct mispredicted ticks and play the next one, calling on_tick after each new tick, return ticks played"""
+    peer = self._peer
+    peer.receive()
+    if peer.next_local() <= self.tick + peer.delay:
+      movement = self._moves.pop(0) if len(self._moves) > 0 else (0, 0)
+      tick = peer.add_local((movement, self._chipOrder))
+      self._scheduled[tick] = (movement, self._chipOrder)
+      self._chipOrder = None
+    rollbackTick = self._receive_remote()
+    if rollbackTick is not None:
+      self._rollback(rollbackTick)
+    simulated = 0
+    while self.tick in self._scheduled and not self._match.events["GAMEOVER"]:
+      # Play confirmed ticks to catch up, and one more on a guess if not too far ahead
+      if self.tick > self._confirmed and (simulated > 0 or self.tick - self._confirmed > self.maxRollback):
+        break
+      self._play(self.tick)
+      self.tick += 1
+      simulated += 1
+      if self.tick % LockstepSession.STATSINTERVAL == 0:
+        logger.info("tick %d: %s", self.tick, peer.stats.summary())
+      if on_tick is not None:
+        on_tick()
+    if simulated == 0:
+      peer.stats.stalls += 1
+    self._forget_confirmed()
+    peer.send()
+    return simulated
+
+  def predicted(self) -> int:
+    """Return the number of ticks played on guessed remote input"""
+    return max(0, self.tick - self._confirmed - 1)
+
+  ###################################################################
+  #                           Helpers                               #
+  ###################################################################
+
+  def _receive_remote(self) -> int:
+    """Take every remote input that arrived, return the first tick played with a wrong guess, None if all were right"""
+    rollbackTick = None
+    while True:
+      remote = self._peer.take_remote(self._confirmed + 1)
+      if remote is None:
+        return rollbackTick
+      self._confirmed += 1
+      tick = self._confirmed
+      self._remote[tick] = remote
+      # Ticks after a corrected game over were never played, so their old guesses are not checked
+      if tick < self.tick and tick in self._used and self._used[tick] != remote and rollbackTick is None:
+        rollbackTick = tick
+
+  def _rollback(self, tick : int) -> None:
+    """Restore the match to before a tick and play it and every tick after it again"""
+    stats = self._peer.stats
+    stats.rollbacks += 1
+    stats.resimulated += self.tick - tick
+    self._match.restore(self._snapshots[tick])
+    for replayed in range(tick, self.tick):
+      if self._match.events["GAMEOVER"]:
+        # The corrected match ended sooner, so the ticks after it were never played
+        self._truncate(replayed)
+        break
+      self._play(replayed)
+
+  def _truncate(self, tick : int) -> None:
+    """Forget the ticks from a tick on, played before a correction ended the match sooner"""
+    for played in range(tick, self.tick):
+      self._snapshots.pop(played, None)
+      self._used.pop(played, None)
+      self._hashes.pop(played, None)
+    self.tick = tick
+
+  def _play(self, tick : int) -> None:
+    """Snapshot the match then play a tick with the remote input known or guessed for it"""
+    self._snapshots[tick] = self._match.snapshot()
+    remote = self._remote.get(tick)
+    if remote is None:
+      remote = self._predict(tick)
+    self._used[tick] = remote
+    self._simulate(self._scheduled[tick], remote)
+    self._hashes[tick] = self._match.state_hash()
+
+  def _predict(self, tick : int) -> tuple:
+    """Guess the remote input of a tick"""
+    # Moves and chip orders are single key presses, so standing still is by far the likeliest input
+    return EMPTYINPUT
+
+  def _forget_confirmed(self) -> None:
+    """Drop state kept for ticks that can no longer be rolled back, handing their final hashes to the peer and replay"""
+    for tick in list(self._used):
+      if tick <= self._confirmed and tick < self.tick:
+        self._peer.add_hash(tick, self._hashes.pop(tick))
+        if self._replay is not None:
+          self._record(self._scheduled[tick], self._used[tick], self._snapshots[tick])
+        del self._used[tick]
+        del self._snapshots[tick]
+        self._scheduled.pop(tick, None)
+        self._remote.pop(tick, None)
+
+###################################################################################
+#                                   Benchmark                                     #
+###################################################################################
+
+def benchmark(depths : list, seed : int, repeats : int, frameTime : float) -> None:
+  """Print the time to snapshot a tick and to restore and replay each rollback depth"""
+  from common.headless import new_match
+  from common.combat import random_folder
+  rng = random.Random(seed)
+  match = new_match(random_folder(rng), rng=random.Random(seed))
+  folder = match.p1Manager.player.get_folder()
+  def play(movements):
+    for movement in movements:
+      if not match.on_stage("P1"):
+        match.confirm("P1", list(folder.snapshot()[:3]))
+      match.move("P1", movement)
+      match.tick()
+  def movements(ticks):
+    return [rng.choice(((0, 0), (0, 0), (1, 0), (-1, 0), (0, 1), (0, -1))) for tick in range(ticks)]
+  # Start from the middle of a round so replayed ticks include combat and bot movement
+  play(movements(200))
+  start = time.perf_counter()
+  for i in range(repeats):
+    match.snapshot()
+  snapshotTime = (time.perf_counter() - start) / repeats
+  print("snapshot %.1f us per tick" % (snapshotTime * 1e6))
+  print("depth  restore+replay (us)  of frame")
+  for depth in depths:
+    snapshot = match.snapshot()
+    replayed = movements(depth)
+    total = 0
+    for i in range(repeats):
+      start = time.perf_counter()
+      match.restore(snapshot)
+      for movement in replayed:
+        match.snapshot()
+        play((movement,))
+      total += time.perf_counter() - start
+    cost = total / repeats
+    print("%5d  %19.1f  %7.2f%%" % (depth, cost * 1e6, 100 * cost / frameTime))
+    match.restore(snapshot)
+
+
+if __name__ == "__main__":
+  # python -m common.rollback [--depths 1,2,4,8,16,32,64] [--repeats N] [--seed N] [--frame-ms MS]
+  from argparse import ArgumentParser
+  parser = ArgumentParser(description="Measure the cost of rolling a match back by a number of ticks")
+  parser.add_argument("--depths", default="1,2,4,8,16,32,64", help="comma separated rollback depths in ticks")
+  parser.add_argument("--repeats", type=int, default=2000, help="rollbacks timed per depth")
+  parser.add_argument("--seed", type=int, default=0, help="seed of the match played")
+  parser.add_argument("--frame-ms", type=float, default=50, help="frame budget the cost is compared to")
+  args = parser.parse_args()
+  benchmark([int(depth) for depth in args.depths.split(",")], args.seed, args.repeats, args.frame_ms / 1000)
+  sys.exit(0)
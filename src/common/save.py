@@ -2,12 +2,25 @@ from common.json_handler import JsonHandler
 from copy import deepcopy as deep_copy
 
 class Save:
-  attributes = JsonHandler.load_save("save.json")
+  attributes = None # loaded on first use
+
+  @staticmethod
+  def load() -> dict:
+    """Return save attributes, reading save file on first use"""
+    if Save.attributes is None:
+      Save.attributes = JsonHandler.load_save("save.json")
+    return Save.attributes
 
   @staticmethod
   def attribute(name : str):
-    return deep_copy(Save.attributes[name])
+    return deep_copy(Save.load()[name])
+
+  @staticmethod
+  def set_attribute(name : str, value) -> None:
+    Save.load()[name] = deep_copy(value)
 
   @staticmethod
   def write():
+    if Save.attributes is None:
+      return
     JsonHandler.store_save("save.json", Save.attributes)
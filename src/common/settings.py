@@ -0,0 +1,34 @@
+class Settings:
+  # Size environments are laid out and drawn at before scaling to the window.
+  # None lays out at the window size and rebuilds assets on every resize.
+  LOGICALSIZE = None
+  # Fraction of the logical (or window) size actually rendered, lower is faster
+  RENDERSCALE = 1
+  # Filter used to scale the rendered frame to the window, smooth or fast
+  SMOOTHSCALE = True
+  # Step quality down when frames take longer than the frame period
+  ADAPTIVEQUALITY = False
+  # Milliseconds handling one event may take before the watchdog reports it, 0 disables
+  WATCHDOGTHRESHOLD = 0
+  WATCHDOGLOG = None # rotating log file of watchdog reports, None for slow_frames.log in the user cache
+  # Chrome trace-event JSON file written on quit, None disables tracing
+  TRACEFILE = None
+  # Lockstep play against another player over UDP, None plays the bot
+  NETHOST = None # port to wait on for a player to join
+  NETJOIN = None # (host, port) of a game to join
+  INPUTDELAY = 3 # ticks between pressing a key and it taking effect when hosting
+  NETTIMEOUT = 30 # seconds to wait for the other player before playing the bot
+  ROLLBACK = 0 # most ticks played on guessed remote input, 0 waits for every input
+  # TCP port spectators may watch the match on, None does not broadcast
+  SPECTATEPORT = None
+  SPECTATEHOST = "127.0.0.1" # address the broadcast listens on, 0.0.0.0 for every interface
+
+  # Quality switches lowered by the adaptive quality controller
+  BACKGROUNDANIMATION = True
+  LODBIAS = 1 # multiplies the drawn scale used to pick a level of detail
+  TEXTANTIALIAS = True
+
+  @staticmethod
+  def uses_canvas() -> bool:
+    """Return true if frames are rendered off screen and scaled to the window"""
+    return Settings.LOGICALSIZE is not None or Settings.RENDERSCALE != 1
@@ -0,0 +1,112 @@
+import sys
+import asyncio
+import logging
+import pygame
+from common.managers import EnvironmentManager
+from common.environments import BackgroundEnvironment
+from common.action_layers import StageLayer, PlayerLayer
+from common.asset_handler import AssetHandler
+from common.chips import Folder
+from common.player import Player
+from common.combat import PlayerManager, P1COLUMNS, P2COLUMNS
+from common.broadcast import read_views, view_position
+from common.netplay import parse_address
+
+logger = logging.getLogger(__name__)
+
+FRAMETIME = .05 # seconds between frames, the game's frame rate
+
+class SpectatorWindow:
+  """Shows views of a broadcast match with the game's own stage and player environments"""
+  def __init__(self):
+    AssetHandler.load_data()
+    self._p1Manager = PlayerManager(Player(Folder([])), P1COLUMNS)
+    self._p2Manager = PlayerManager(Player(Folder([])), P2COLUMNS)
+    self._environmentManager = EnvironmentManager()
+    self._environmentManager.reserve(["BE", "SAL", "PAL"])
+    self._environmentManager.add_environment("BE", BackgroundEnvironment)
+    self._environmentManager.add_environment("SAL", StageLayer)
+    self._environmentManager.add_environment("PAL", PlayerLayer, self._p1Manager.player, self._p2Manager.player)
+    for key in ["BE", "SAL", "PAL"]:
+      self._environmentManager.activate_when_built(key)
+      self._environmentManager.build_environment(key)
+    self._shownView = None
+    self._place_players()
+
+  def show(self, view : tuple) -> None:
+    """Show a view received from the server"""
+    if view == self._shownView:
+      return
+    p1Health, p2Health, highlightMask, hitMask = view[2:6]
+    self._p1Manager.player.restore((view_position(view, "P1"), p1Health))
+    self._p2Manager.player.restore((view_position(view, "P2"), p2Health))
+    SAL = self._environmentManager.get_environment("SAL")
+    SAL.highlight(highlightMask)
+    SAL.hit(hitMask)
+    self._shownView = view
+    self._place_players()
+
+  def refresh(self) -> None:
+    """Draw the next frame"""
+    self._environmentManager.update()
+
+  def resize(self) -> None:
+    """Resize assets to the window"""
+    if self._environmentManager.resize():
+      self._place_players()
+
+  def _place_players(self) -> None:
+    """Move player assets to their stage positions and health"""
+    SAL = self._environmentManager.get_environment("SAL")
+    windowSize = self._environmentManager.get_window_size()
+    for playerManager in (self._p1Manager, self._p2Manager):
+      playerManager.place_asset(SAL.get_panel_matrix(), windowSize)
+    PAL = self._environmentManager.get_environment("PAL")
+    PAL.update(windowSize, self._p1Manager.player, self._p2Manager.player)
+
+
+async def watch(address : tuple) -> None:
+  """Show the match broadcast at an address until the window is closed or the server stops"""
+  pygame.init()
+  window = SpectatorWindow()
+  reader, writer = await asyncio.open_connection(*address)
+  latest = [None] # last view received
+
+  async def receive():
+    async for tick, view in read_views(reader):
+      latest[0] = view
+    logger.info("the broadcast ended")
+
+  receiving = asyncio.ensure_future(receive())
+  running = True
+  while running and not receiving.done():
+    for event in pygame.event.get():
+      if event.type == pygame.QUIT:
+        running = False
+      elif event.type == pygame.VIDEORESIZE:
+        window.resize()
+    if latest[0] is not None:
+      window.show(latest[0])
+    window.refresh()
+    await asyncio.sleep(FRAMETIME)
+  receiving.cancel()
+  writer.close()
+  pygame.quit()
+
+
+if __name__ == "__main__":
+  # python -m common.spectator HOST:PORT
+  from argparse import ArgumentParser
+  parser = ArgumentParser(description="Watch a match broadcast by a game started with --spectate-port")
+  parser.add_argument("address", metavar="HOST:PORT", help="address of the broadcast")
+  args = parser.parse_args()
+  try:
+    address = parse_address(args.address)
+  except ValueError:
+    parser.error("%s is not HOST:PORT" % args.address)
+  logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+  try:
+    asyncio.run(watch(address))
+  except (ConnectionError, KeyboardInterrupt) as error:
+    print(error)
+  sys.exit(0)
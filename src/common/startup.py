@@ -0,0 +1,23 @@
+from time import perf_counter
+
+class StartupTimer:
+  START = perf_counter() # set when first imported
+  _entries = [] # (label, kind, seconds) in the order they were recorded
+
+  @staticmethod
+  def mark(label : str) -> None:
+    """Record the time elapsed since startup under a given label"""
+    StartupTimer._entries.append((label, "at", perf_counter() - StartupTimer.START))
+
+  @staticmethod
+  def add(label : str, seconds : float) -> None:
+    """Record the duration of a given startup task"""
+    StartupTimer._entries.append((label, "took", seconds))
+
+  @staticmethod
+  def report() -> str:
+    """Return the recorded timings as a printable report"""
+    report = "Startup timing (ms)\n"
+    for label, kind, seconds in StartupTimer._entries:
+      report += "  {:<24}{:<5}{:>8.1f}\n".format(label, kind, seconds * 1000)
+    return report
@@ -0,0 +1,112 @@
+from zlib import crc32
+
+# Zobrist hashing: every (field, value) pair has a fixed pseudo-random 64-bit key and
+# the hash of a state is the XOR of the keys of its fields' current values. Setting
+# a field XORs out the key of its old value and XORs in the new one, so the hash is
+# always current without ever being recomputed, and equal states hash equal no
+# matter which path led to them. Keys only use ints, so every process agrees on them.
+
+MASK = (1 << 64) - 1
+
+def mix(x : int) -> int:
+  """Return the splitmix64 finalizer of an int, spreading every input bit over all 64 output bits"""
+  x = (x + 0x9E3779B97F4A7C15) & MASK
+  x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+  x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK
+  return x ^ (x >> 31)
+
+def encode(value) -> int:
+  """Return an int standing for a bool, int or tuple of them"""
+  if isinstance(value, tuple):
+    code = len(value)
+    for item in value:
+      code = mix(code ^ encode(item))
+    return code
+  return int(value) & MASK
+
+def field_id(name : str, slot : int = 0) -> int:
+  """Return the id of a named field of the object in a given slot"""
+  return mix(crc32(name.encode()) ^ slot << 32)
+
+MAXKEYS = 1 << 12 # most keys remembered per field
+
+class FieldKeys(dict):
+  """Keys of the values of one field, computed on first use"""
+  def __init__(self, field : int):
+    super().__init__()
+    self._field = field
+
+  def __missing__(self, value) -> int:
+    key = mix(self._field ^ encode(value))
+    if len(self) < MAXKEYS:
+      self[value] = key
+    return key
+
+_fieldKeys = {} # key tables by field id, shared by every match
+
+def field_keys(name : str, slot : int = 0) -> FieldKeys:
+  """Return the key table of a named field of the object in a given slot"""
+  field = field_id(name, slot)
+  if field not in _fieldKeys:
+    _fieldKeys[field] = FieldKeys(field)
+  return _fieldKeys[field]
+
+
+class StateHash:
+  """64-bit hash of a set of fields, updated one field at a time"""
+  def __init__(self):
+    self.value = 0
+
+  def __int__(self) -> int:
+    return self.value
+
+  def __str__(self) -> str:
+    return "%016x" % self.value
+
+
+class HashedEvents(dict):
+  """Event flags that update a state hash whenever one changes"""
+  def __init__(self, events : dict, stateHash : StateHash, slot : int):
+    super().__init__(events)
+    self._stateHash = stateHash
+    self._keys = {key : field_keys("events." + key, slot) for key in events}
+    for key, value in self.items():
+      stateHash.value ^= self._keys[key][value]
+
+  def __setitem__(self, key, value) -> None:
+    old = self[key]
+    if old != value:
+      keys = self._keys[key]
+      self._stateHash.value ^= keys[old] ^ keys[value]
+      dict.__setitem__(self, key, value)
+
+
+class HashedState:
+  """Mixin keeping the attributes named in HASHED in a state hash once attached"""
+  HASHED = () # names of attributes, dicts of flags among them
+  stateHash = None
+  _hashKeys = {} # key tables of hashed attributes once attached
+
+  def attach_hash(self, stateHash : StateHash, slot : int) -> None:
+    """Add the hashed attributes to a state hash, told apart from other objects' by slot"""
+    hashKeys = {}
+    for name in self.HASHED:
+      value = getattr(self, name)
+      if isinstance(value, dict):
+        # Flags update the hash as they are set, the dict itself is never replaced
+        object.__setattr__(self, name, HashedEvents(value, stateHash, slot))
+      else:
+        hashKeys[name] = field_keys(name, slot)
+        stateHash.value ^= hashKeys[name][value]
+    object.__setattr__(self, "_hashKeys", hashKeys)
+    object.__setattr__(self, "stateHash", stateHash)
+
+  def __setattr__(self, name : str, value) -> None:
+    # Hashed objects keep plain attributes only, so the instance dict can be written directly
+    values = self.__dict__
+    keys = self._hashKeys.get(name)
+    if keys is not None:
+      old = values[name]
+      if old != value:
+        self.stateHash.value ^= keys[old] ^ keys[value]
+    values[name] = value
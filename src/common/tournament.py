@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import random
+import signal
+import logging
+from multiprocessing import Pool, cpu_count
+from common.json_data import load_data
+from common.headless import HeadlessChips, to_folder
+from common.combat import Match, random_folder, P1COLUMNS, P2COLUMNS
+from common.player import Bot, PLANNERS
+
+logger = logging.getLogger(__name__)
+
+# Bot against Bot tournaments played on every core. Each match is appended to a results
+# file as a line of json as soon as it ends, so a tournament stopped part way through is
+# resumed by running it again on the same file: matches already there are not played again.
+
+MAXTICKS = 20000 # ticks after which a match is a draw
+CHUNKSIZE = 8 # matches handed to a worker at a time
+PROGRESSINTERVAL = 5 # seconds between progress lines
+
+# An entrant's folder is a list of chip ids, "save" for the folder in save.json or
+# "random" for a folder drawn from the match seed
+ENTRANT = {"folder" : "random", "errorRate" : 5, "movementCooldown" : 2, "planner" : "greedy"}
+DEFAULTENTRANTS = [dict(ENTRANT, name=planner, planner=planner) for planner in PLANNERS]
+
+def load_entrants(entrants : list) -> list:
+  """Return entrants with defaults filled in and save folders read, raise ValueError on a bad entrant"""
+  loaded = []
+  names = set()
+  for entrant in entrants:
+    entrant = dict(ENTRANT, **entrant)
+    if "name" not in entrant:
+      raise ValueError("entrant %s has no name" % entrant)
+    if entrant["name"] in names:
+      raise ValueError("entrant %s is named twice" % entrant["name"])
+    names.add(entrant["name"])
+    if entrant["planner"] not in PLANNERS:
+      raise ValueError("entrant %s has unknown planner %r" % (entrant["name"], entrant["planner"]))
+    if entrant["folder"] == "save":
+      entrant["folder"] = load_data("save.json")["playerFolder"]
+    if entrant["folder"] != "random":
+      chips = len(HeadlessChips.load())
+      if len(entrant["folder"]) == 0 or any(not 0 <= id < chips for id in entrant["folder"]):
+        raise ValueError("entrant %s has a folder of ids outside 0 to %d" % (entrant["name"], chips-1))
+    loaded.append(entrant)
+  return loaded
+
+def pairings(entrants : list) -> list:
+  """Return every ordered pair of different entrants, or the entrant against itself if alone"""
+  if len(entrants) == 1:
+    return [(entrants[0], entrants[0])]
+  return [(p1, p2) for p1 in entrants for p2 in entrants if p1 is not p2]
+
+###################################################################################
+#                                    Matches                                      #
+###################################################################################
+
+class EntrantBot(Bot):
+  """Bot keeping the ids and highlight frames of the chips it chose last"""
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.chipOrder = []
+
+  def select_chips(self) -> list:
+    """Build chip order and remember it"""
+    chipOrder = super().select_chips()
+    self.chipOrder = [(chip.id, chip.highlightFrames) for chip in chipOrder]
+    return chipOrder
+
+
+def new_bot(entrant : dict, folder : list, rng, colRange : tuple) -> EntrantBot:
+  """Return a bot playing an entrant's folder and parameters on the side of a column range"""
+  return EntrantBot(to_folder(folder), rng, colRange[0], entrant["errorRate"], entrant["movementCooldown"],
+                    entrant["planner"])
+
+def hit_chip(chipOrder : list, tick : int) -> tuple:
+  """Return the id and highlight frames of the chip in an order landing at a timeline tick"""
+  for id, frames in chipOrder:
+    if tick < frames:
+      return id, frames
+    tick -= frames
+  return None
+
+def play_match(task : tuple) -> dict:
+  """Play a match between two entrants from a seed, return its result"""
+  p1, p2, seed, maxTicks = task
+  start = time.perf_counter()
+  rng = random.Random(seed)
+  folders = [random_folder(rng) if entrant["folder"] == "random" else entrant["folder"] for entrant in (p1, p2)]
+  p1Bot = new_bot(p1, folders[0], random.Random(rng.getrandbits(64)), P1COLUMNS)
+  p2Bot = new_bot(p2, folders[1], random.Random(rng.getrandbits(64)), P2COLUMNS)
+  match = Match(p1Bot, p2Bot)
+  chips = {} # uses and hits of each chip id
+  rounds = [] # ticks each round lasted
+  roundTicks = 0
+  for tick in range(maxTicks):
+    health = (p1Bot.get_health(), p2Bot.get_health())
+    match.tick()
+    roundTicks += 1
+    if match.events["DAMAGED"]:
+      # Each player is hit by the chips of the other
+      hitTick = match.combatManager.hit_tick()
+      for attacker, defender, before in ((p2Bot, p1Bot, health[0]), (p1Bot, p2Bot, health[1])):
+        if defender.get_health() < before:
+          id, frames = hit_chip(attacker.chipOrder, hitTick)
+          chips.setdefault(id, [0, 0])[1] += 1
+    if match.events["ROUNDOVER"] or match.events["GAMEOVER"]:
+      rounds.append(roundTicks)
+      roundTicks = 0
+      for bot in (p1Bot, p2Bot):
+        for id, frames in bot.chipOrder:
+          chips.setdefault(id, [0, 0])[0] += 1
+    if match.events["GAMEOVER"]:
+      break
+  return {"p1" : p1["name"], "p2" : p2["name"], "seed" : seed, "winner" : match.winner(), "ticks" : tick + 1,
+          "rounds" : rounds, "chips" : chips, "seconds" : time.perf_counter() - start}
+
+###################################################################################
+#                                    Results                                      #
+###################################################################################
+
+class ResultsFile:
+  """Json lines of match results after a header naming the entrants, appended to as matches end"""
+  def __init__(self, path : str, entrants : list, maxTicks : int):
+    self.path = path
+    self.results = []
+    header = {"entrants" : entrants, "maxTicks" : maxTicks}
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+      self._load(header)
+    else:
+      with open(path, "w") as file:
+        file.write(json.dumps(header) + "\n")
+    self._file = open(path, "a")
+
+  def done(self) -> set:
+    """Return the (P1, P2, seed) of every match in the file"""
+    return set((result["p1"], result["p2"], result["seed"]) for result in self.results)
+
+  def write(self, result : dict) -> None:
+    """Append a match result, on disk before returning"""
+    self._file.write(json.dumps(result) + "\n")
+    self._file.flush()
+    self.results.append(result)
+
+  def close(self) -> None:
+    self._file.close()
+
+  def _load(self, header : dict) -> None:
+    """Read the results of an earlier run, cutting off a line left half written"""
+    with open(self.path, "rb+") as file:
+      data = file.read()
+      end = data.rfind(b"\n") + 1
+      if end < len(data):
+        logger.warning("dropped a half written result at the end of %s", self.path)
+        file.truncate(end)
+    lines = data[:end].decode().splitlines()
+    if len(lines) == 0 or json.loads(lines[0]) != json.loads(json.dumps(header)):
+      raise ValueError("%s holds results of other entrants or a different tick limit" % self.path)
+    self.results = [json.loads(line) for line in lines[1:]]
+
+
+class Tally:
+  """Win rates, round lengths, chip hits and speed aggregated over match results"""
+  def __init__(self, results : list = ()):
+    self.pairings = {} # P1 wins, P2 wins and draws of each pairing
+    self.matches = 0
+    self.rounds = 0
+    self.roundTicks = 0
+    self.seconds = 0
+    self.chips = {} # uses and hits of each chip id
+    for result in results:
+      self.add(result)
+
+  def add(self, result : dict) -> None:
+    """Count a match result"""
+    outcomes = self.pairings.setdefault((result["p1"], result["p2"]), [0, 0, 0])
+    outcomes[{"P1" : 0, "P2" : 1, None : 2}[result["winner"]]] += 1
+    self.matches += 1
+    self.rounds += len(result["rounds"])
+    self.roundTicks += sum(result["rounds"])
+    self.seconds += result["seconds"]
+    for id, (uses, hits) in result["chips"].items():
+      counts = self.chips.setdefault(int(id), [0, 0])
+      counts[0] += uses
+      counts[1] += hits
+
+  def report(self, chipLines : int = 10) -> str:
+    """Return a table of each pairing and entrant, round lengths, and the chips hitting most and least often per use"""
+    lines = ["%-24s %7s %7s %7s %7s" % ("P1 vs P2", "matches", "P1 won", "P2 won", "drawn")]
+    entrants = {}
+    for (p1, p2), outcomes in sorted(self.pairings.items()):
+      played = sum(outcomes)
+      lines.append("%-24s %7d %6.1f%% %6.1f%% %6.1f%%" % (p1 + " vs " + p2, played,
+                   *(100 * outcome / played for outcome in outcomes)))
+      for name, won in ((p1, outcomes[0]), (p2, outcomes[1])):
+        record = entrants.setdefault(name, [0, 0])
+        record[0] += played
+        record[1] += won
+    lines.append("")
+    for name, (played, won) in sorted(entrants.items(), key=lambda item: -item[1][1] / item[1][0]):
+      lines.append("%-24s won %6.1f%% of %d matches" % (name, 100 * won / played, played))
+    if self.matches > 0:
+      lines.append("")
+      lines.append("%.2f rounds per match, %.1f ticks per round, %.1f matches/s on one core" % (
+                   self.rounds / self.matches, self.roundTicks / max(1, self.rounds), self.matches / max(self.seconds, 1e-9)))
+    rates = sorted((hits / uses, id, uses, hits) for id, (uses, hits) in self.chips.items() if uses > 0)
+    if len(rates) > 0:
+      lines.append("")
+      lines.append("chip   uses   hits  hits/use")
+      shown = rates[::-1] if len(rates) <= 2*chipLines else rates[:-chipLines-1:-1] + [None] + rates[chipLines-1::-1]
+      for rate in shown:
+        lines.append("  ..." if rate is None else "%4d %6d %6d  %8.3f" % (rate[1], rate[2], rate[3], rate[0]))
+    return "\n".join(lines)
+
+###################################################################################
+#                                   Tournament                                    #
+###################################################################################
+
+def _ignore_interrupts() -> None:
+  """Leave Ctrl-C to the parent process, which stops the workers"""
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def run(path : str, entrants : list, matches : int, seed : int, workers : int, maxTicks : int = MAXTICKS) -> Tally:
+  """Play the matches of every pairing not yet in a results file on a pool of processes, return the tally of the file"""
+  entrants = load_entrants(entrants)
+  results = ResultsFile(path, entrants, maxTicks)
+  done = results.done()
+  # Seeds are the outer loop so a stopped tournament has played every pairing about equally
+  tasks = [(p1, p2, matchSeed, maxTicks) for matchSeed in range(seed, seed + matches)
+           for p1, p2 in pairings(entrants) if (p1["name"], p2["name"], matchSeed) not in done]
+  logger.info("%d matches in %s, %d to play on %d processes", len(results.results), path, len(tasks), workers)
+  played = 0
+  start = lastProgress = time.perf_counter()
+  try:
+    if len(tasks) > 0:
+      with Pool(workers, initializer=_ignore_interrupts) as pool:
+        for result in pool.imap_unordered(play_match, tasks, CHUNKSIZE):
+          results.write(result)
+          played += 1
+          now = time.perf_counter()
+          if now - lastProgress >= PROGRESSINTERVAL:
+            lastProgress = now
+            logger.info("%d of %d matches, %.1f matches/s", played, len(tasks), played / (now - start))
+  except KeyboardInterrupt:
+    logger.info("stopped, run again with the same results file to resume")
+  finally:
+    results.close()
+  elapsed = time.perf_counter() - start
+  if played > 0:
+    logger.info("played %d matches in %.1f s, %.1f matches/s", played, elapsed, played / elapsed)
+  return Tally(results.results)
+
+
+if __name__ == "__main__":
+  # python -m common.tournament RESULTS [--entrants FILE] [--matches N] [--seed N] [--workers N] [--max-ticks N]
+  from argparse import ArgumentParser
+  parser = ArgumentParser(description="Play Bot against Bot matches on every core and tally the results")
+  parser.add_argument("results", help="json lines file results are appended to and resumed from")
+  parser.add_argument("--entrants", help="json list of entrants, each a name with any of " + ", ".join(ENTRANT))
+  parser.add_argument("--matches", type=int, default=1000, help="matches of each pairing, one per seed")
+  parser.add_argument("--seed", type=int, default=0, help="first match seed")
+  parser.add_argument("--workers", type=int, default=cpu_count(), help="processes matches are played on")
+  parser.add_argument("--max-ticks", type=int, default=MAXTICKS, help="ticks after which a match is a draw")
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+  entrants = DEFAULTENTRANTS
+  if args.entrants is not None:
+    with open(args.entrants) as file:
+      entrants = json.load(file)
+  try:
+    tally = run(args.results, entrants, args.matches, args.seed, args.workers, args.max_ticks)
+  except ValueError as error:
+    parser.error(str(error))
+  print(tally.report())
+  sys.exit(0)
@@ -0,0 +1,96 @@
+import os
+import json
+from threading import current_thread
+from functools import wraps
+from time import perf_counter
+
+class Tracer:
+  START = perf_counter() # set when first imported
+  MAXEVENTS = 1000000 # events kept before recording stops
+  events = None # Chrome trace events, None while tracing is off
+  tick = 0 # game loop tick added to every event
+  phase = None # combat phase added to every event
+  _threads = {} # names of threads that recorded events by id
+
+  @staticmethod
+  def start() -> None:
+    """Start recording trace events"""
+    Tracer.events = []
+
+  @staticmethod
+  def enabled() -> bool:
+    return Tracer.events is not None
+
+  @staticmethod
+  def next_tick(phase : str) -> None:
+    """Count a game loop tick running in a given combat phase"""
+    Tracer.tick += 1
+    Tracer.phase = phase
+
+  @staticmethod
+  def complete(name : str, start : float, args : dict = None) -> None:
+    """Record a span that started at a given perf_counter time and ends now"""
+    if Tracer.events is None or len(Tracer.events) >= Tracer.MAXEVENTS:
+      return
+    end = perf_counter()
+    thread = current_thread()
+    Tracer._threads.setdefault(thread.ident, thread.name)
+    spanArgs = {"tick" : Tracer.tick, "phase" : Tracer.phase}
+    if args is not None:
+      spanArgs.update(args)
+    Tracer.events.append({
+      "name" : name,
+      "ph" : "X",
+      "ts" : (start - Tracer.START) * 1000000,
+      "dur" : (end - start) * 1000000,
+      "pid" : os.getpid(),
+      "tid" : thread.ident,
+      "args" : spanArgs
+    })
+
+  @staticmethod
+  def span(name : str):
+    """Return a context manager recording its body as a span"""
+    return _Span(name)
+
+  @staticmethod
+  def write(path : str) -> None:
+    """Write recorded events as Chrome trace-event JSON"""
+    events = []
+    for ident, name in Tracer._threads.items():
+      events.append({"name" : "thread_name", "ph" : "M", "pid" : os.getpid(), "tid" : ident, "args" : {"name" : name}})
+    events += Tracer.events
+    with open(path, "w") as file:
+      json.dump({"traceEvents" : events, "displayTimeUnit" : "ms"}, file)
+
+
+class _Span:
+  def __init__(self, name : str):
+    self._name = name
+
+  def __enter__(self):
+    self._start = perf_counter()
+    return self
+
+  def __exit__(self, *exception):
+    Tracer.complete(self._name, self._start)
+    return False
+
+
+def traced(name : str, span_args=None):
+  """Decorate a function to record each call as a span, span_args builds extra arguments from the call"""
+  def decorate(function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+      if Tracer.events is None:
+        return function(*args, **kwargs)
+      extra = None
+      if span_args is not None:
+        extra = span_args(*args, **kwargs)
+      start = perf_counter()
+      try:
+        return function(*args, **kwargs)
+      finally:
+        Tracer.complete(name, start, extra)
+    return wrapper
+  return decorate
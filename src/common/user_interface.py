@@ -1,5 +1,9 @@
 from common.asset_handler import AssetHandler
-from common.graphics import Asset
+from common.graphics import Asset, FRAMES, compile_assets
+from common.containers import LRUCache
+from itertools import count
+
+COMPILES = count() # serial numbers given to compiled display lists
 
 class Button:
   def __init__(self, xRange : tuple, yRange : tuple):
@@ -12,20 +16,86 @@ class Environment:
   ACTIVE = 2
   PAUSE =  1
   INACTIVE = 0
+  # Layouts remembered per window size, 0 rebuilds on every resize.
+  # Only for environments whose assets depend on nothing but the window size.
+  LAYOUTCACHE = 0
+  LAYOUT = ("_assets",) # attributes building a layout sets, remembered with it
 
   def __init__(self):
     self.status = Environment.INACTIVE
     self._assets = [] # list of assets to be drawn when active
+    self._displayList = None # assets compiled to draw commands, None until drawn
+    self._compileNumber = None # serial number of the current display list
+    self._animations = [] # FRAMES commands in the display list
   
   def get_assets(self) -> list:
     """Return environment assets"""
     return self._assets
+
+  def display_list(self) -> list:
+    """Return environment assets compiled to primitive draw commands"""
+    if self._displayList is None:
+      self._displayList = compile_assets(self.get_assets())
+      self._compileNumber = next(COMPILES)
+      self._animations = [command for command in self._displayList if command[0] == FRAMES]
+    return self._displayList
+
+  def plays_animations(self) -> bool:
+    """Return true if animations in the environment advance while active"""
+    return True
+
+  def forget_layouts(self) -> None:
+    """Drop remembered layouts so the next resize builds with current settings"""
+    if "_layouts" in self.__dict__:
+      self._layouts.clear()
+
+  def frame_key(self) -> tuple:
+    """Return a value that only changes when the drawn frame would"""
+    self.display_list()
+    frames = tuple(id(frames[animation.activeFrame]) for kind, animation, frames in self._animations)
+    return self._compileNumber, frames
+
+  def animated(self) -> bool:
+    """Return true if the drawn frame can change without input"""
+    if not self.plays_animations():
+      return False
+    self.display_list()
+    for kind, animation, frames in self._animations:
+      for frame in frames:
+        # frames that look the same as the one before share its list
+        if frame is not frames[0]:
+          return True
+    return False
+
+  def invalidate(self) -> None:
+    """Recompile the display list before the next draw"""
+    self._displayList = None
   
   def resize(self, windowSize : tuple) -> None:
     """Resize environment assets to fit window"""
+    self.invalidate()
+    if self.LAYOUTCACHE == 0:
+      self._build_layout(windowSize)
+      return
+    if "_layouts" not in self.__dict__:
+      self._layouts = LRUCache(self.LAYOUTCACHE)
+    layout = self._layouts.get(windowSize)
+    if layout is None:
+      self._build_layout(windowSize)
+      layout = self._layout_state()
+      self._layouts.put(windowSize, layout)
+    for name, value in layout.items():
+      setattr(self, name, value)
+
+  def _build_layout(self, windowSize : tuple) -> None:
+    """Rebuild all window dependent state"""
     self._assets = []
     self._build_assets(windowSize)
 
+  def _layout_state(self) -> dict:
+    """Return the attributes set by building a layout"""
+    return {name : getattr(self, name) for name in self.LAYOUT}
+
   def activate(self) -> None:
     """Set Environment status to ACTIVE"""
     self.status = Environment.ACTIVE
@@ -54,6 +124,8 @@ class Environment:
 
 
 class Menu(Environment):
+  LAYOUT = Environment.LAYOUT + ("_buttons",)
+
   def __init__(self):
     super().__init__()
     self._buttons = {} # dictionary of buttons to monitor when active
@@ -62,8 +134,8 @@ class Menu(Environment):
     """Return menu buttons"""
     return self._buttons
   
-  def resize(self, windowSize : tuple) -> None:
-    """Resize menu assets and buttons"""
+  def _build_layout(self, windowSize : tuple) -> None:
+    """Rebuild menu assets and buttons"""
     self._assets = []
     self._buttons = {}
     self._build_assets(windowSize)
@@ -0,0 +1,117 @@
+import os
+import sys
+import time
+import logging
+from logging.handlers import RotatingFileHandler
+from threading import Thread, Event, get_ident
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+COMMON = os.path.dirname(os.path.abspath(__file__))
+
+###################################################################################
+#                                Stack Helpers                                    #
+###################################################################################
+
+def sample_stack(frame) -> tuple:
+  """Return (file, line, function) of each call in a frame's stack, outermost first"""
+  stack = []
+  while frame is not None:
+    code = frame.f_code
+    stack.append((code.co_filename, frame.f_lineno, getattr(code, "co_qualname", code.co_name)))
+    frame = frame.f_back
+  stack.reverse()
+  return tuple(stack)
+
+def activity(stack : tuple) -> str:
+  """Name the EventManager handler, environment updates and innermost game call in a stack"""
+  names = []
+  innermost = None
+  for path, line, function in stack:
+    if os.path.dirname(os.path.abspath(path)) != COMMON:
+      continue
+    innermost = function
+    if function.startswith("EventManager.") and len(names) == 0:
+      names.append(function)
+    elif function.endswith((".frame_update", "._build_assets", ".build_environment")):
+      names.append(function)
+  if innermost is not None and innermost not in names:
+    names.append(innermost)
+  if len(names) == 0:
+    return "outside game code"
+  return " > ".join(names)
+
+def format_stack(stack : tuple) -> list:
+  """Return one line per call in a sampled stack"""
+  return ["%s:%d %s" % (os.path.basename(path), line, function) for path, line, function in stack]
+
+###################################################################################
+#                                   Watchdog                                      #
+###################################################################################
+
+class FrameWatchdog:
+  INTERVAL = .005 # seconds between stack samples while a tick runs
+  LOGSIZE = 1000000 # bytes per log file before rotating
+  LOGCOUNT = 3 # rotated log files kept
+
+  def __init__(self, threshold : float, logPath : str):
+    self._threshold = threshold # seconds a tick may take before it is reported
+    self._mainThread = get_ident() # thread running the ticks
+    self._running = Event() # set while a tick runs
+    self._samples = []
+    self._tick = 0
+    self._label = None
+    self._tickStart = 0
+    self._thread = Thread(target=self._run, name="Watchdog", daemon=True)
+    if not logger.handlers:
+      handler = RotatingFileHandler(logPath, maxBytes=FrameWatchdog.LOGSIZE,
+                                    backupCount=FrameWatchdog.LOGCOUNT, delay=True)
+      handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+      logger.addHandler(handler)
+      logger.setLevel(logging.INFO)
+      logger.propagate = False
+
+  def start(self) -> None:
+    """Start sampling in the background"""
+    self._thread.start()
+
+  def begin(self, label : str) -> None:
+    """Mark the start of a tick handling a given event"""
+    self._tick += 1
+    self._label = label
+    self._samples = []
+    self._tickStart = time.perf_counter()
+    self._running.set()
+
+  def end(self) -> None:
+    """Mark the end of the current tick and report it if it was slow"""
+    self._running.clear()
+    duration = time.perf_counter() - self._tickStart
+    if duration > self._threshold:
+      self._report(duration, self._samples)
+
+  def _run(self) -> None:
+    """Sample the stack of the ticking thread while a tick runs"""
+    while True:
+      self._running.wait()
+      time.sleep(FrameWatchdog.INTERVAL)
+      samples = self._samples
+      if not self._running.is_set():
+        continue
+      frame = sys._current_frames().get(self._mainThread)
+      if frame is not None:
+        samples.append(sample_stack(frame))
+
+  def _report(self, duration : float, samples : list) -> None:
+    """Log what the ticking thread was doing during a slow tick"""
+    lines = ["slow %s tick %d took %.1f ms (threshold %.1f ms), %d samples" %
+             (self._label, self._tick, duration*1000, self._threshold*1000, len(samples))]
+    activities = Counter(activity(stack) for stack in samples)
+    for name, count in activities.most_common():
+      lines.append("  %3d%%  %s" % (100 * count // len(samples), name))
+    if len(samples) > 0:
+      stack, count = Counter(samples).most_common(1)[0]
+      lines.append("  most sampled stack (%d of %d):" % (count, len(samples)))
+      lines += ["    " + line for line in format_stack(stack)]
+    logger.warning("\n".join(lines))
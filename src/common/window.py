@@ -1,11 +1,18 @@
 import pygame
 from common.file_handler import FileHandler
 from common.graphics import *
+from common.settings import Settings
+from common.trace import Tracer, traced
 
 class Window:
   def __init__(self, aspectRatio : tuple):
     self.graphics = Graphics([])
+    self.displayLists = [] # compiled draw commands of each environment in drawing order
+    self._presentedKey = None # frame key of the frame on screen
+    self._redraw = True
+    self.surface = None
     self.scale_window(aspectRatio)
+    self.resize_canvas()
     pygame.display.set_caption("Chain Strike")
     path = FileHandler.get_packaged_files_path("icon.jpg")
     icon = pygame.image.load(path)
@@ -27,21 +34,100 @@ class Window:
 
     # Create pygame window
     self.window = pygame.display.set_mode((width, height), pygame.RESIZABLE)
+
+  def resize_canvas(self) -> None:
+    """Match the off screen canvas to the render settings and window"""
+    self._frameArea = None
+    if not Settings.uses_canvas():
+      self.surface = self.window
+      return
+    if Settings.LOGICALSIZE is None:
+      width, height = pygame.display.get_surface().get_size()
+    else:
+      width, height = Settings.LOGICALSIZE
+    canvasSize = (max(1, int(width * Settings.RENDERSCALE)), max(1, int(height * Settings.RENDERSCALE)))
+    if self.surface in (None, self.window) or self.surface.get_size() != canvasSize:
+      self.surface = pygame.Surface(canvasSize)
+
+  @traced("Window.update")
+  def update(self, frameKey=None) -> bool:
+    """Redraw all display lists unless the frame key shows nothing changed"""
+    if frameKey is not None and frameKey == self._presentedKey and not self._redraw:
+      return False
+    self._presentedKey = frameKey
+    self._redraw = False
+    self.surface.fill(Colors.BLACK)
+    for displayList in self.displayLists:
+      self.execute(displayList)
+    if self.surface is not self.window:
+      self._present_canvas()
+    with Tracer.span("pygame.display.flip"):
+      pygame.display.flip()
+    return True
+
+  def request_redraw(self) -> None:
+    """Draw the next update even if the frame key is unchanged"""
+    self._redraw = True
+
+  def _present_canvas(self) -> None:
+    """Scale the canvas into the largest area of the window with its aspect ratio"""
+    display = pygame.display.get_surface()
+    x, y, width, height = self._frame_area()
+    if x > 0 or y > 0:
+      display.fill(Colors.BLACK)
+    frame = display.subsurface((x, y, width, height))
+    if Settings.SMOOTHSCALE:
+      pygame.transform.smoothscale(self.surface, (width, height), frame)
+    else:
+      pygame.transform.scale(self.surface, (width, height), frame)
+
+  def _frame_area(self) -> tuple:
+    """Return the area of the window the canvas is scaled into"""
+    displaySize = pygame.display.get_surface().get_size()
+    if self._frameArea is None or self._frameArea[0] != displaySize:
+      displayWidth, displayHeight = displaySize
+      canvasWidth, canvasHeight = self.surface.get_size()
+      scale = min(displayWidth / canvasWidth, displayHeight / canvasHeight)
+      width = max(1, int(canvasWidth * scale))
+      height = max(1, int(canvasHeight * scale))
+      area = ((displayWidth - width) // 2, (displayHeight - height) // 2, width, height)
+      self._frameArea = (displaySize, area)
+    return self._frameArea[1]
+
+  def to_canvas(self, position : tuple) -> tuple:
+    """Convert a window position to a position on the canvas assets are drawn in"""
+    if self.surface is self.window:
+      return position
+    x, y, width, height = self._frame_area()
+    canvasWidth, canvasHeight = self.surface.get_size()
+    return (position[0] - x) * canvasWidth / width, (position[1] - y) * canvasHeight / height
   
-  def update(self) -> None:
-    """Redraw all active assets"""
-    self.window.fill(Colors.BLACK)
-    for asset in self.graphics.assets:
-      self.draw(asset)
-    pygame.display.flip()
+  def set_display_lists(self, displayLists : list) -> None:
+    """Set the display lists drawn by update"""
+    self.displayLists = displayLists
+
+  def execute(self, displayList : list) -> None:
+    """Run the draw commands of a display list"""
+    surface = self.surface
+    polygon = pygame.draw.polygon
+    for command in displayList:
+      kind = command[0]
+      if kind == FILL:
+        polygon(surface, command[1], command[2])
+      elif kind == OUTLINE:
+        polygon(surface, command[1], command[2], command[3])
+      elif kind == BLIT:
+        surface.blit(command[1], command[2])
+      else:
+        self.execute(command[2][command[1].activeFrame])
   
   def update_graphics(self) -> None:
     """Update the active frame of all animations in graphics"""
     self.graphics.update()
 
   def get_size(self) -> tuple:
-    """Return window width and height as tuple"""
-    return self.window.get_size()
+    """Return width and height assets are laid out in as tuple"""
+    return self.surface.get_size()
   
   def clear_assets(self) -> None:
     """Remove all assets in graphics"""
@@ -58,11 +144,11 @@ class Window:
   def draw(self, asset : Asset) -> None:
     """Draw a given asset in the window"""
     if isinstance(asset, Text):
-      self.window.blit(asset.text, asset.text_box)
+      self.surface.blit(asset.text, asset.text_box)
     elif isinstance(asset, Shape):
-      pygame.draw.polygon(self.window, *asset.to_tuple())
+      pygame.draw.polygon(self.surface, *asset.to_tuple())
     elif isinstance(asset, Collage):
-      self.draw_collage(asset)
+      self.draw_collage(asset.level_of_detail())
     elif isinstance(asset, Animation):
       frame = asset.get_frame()
       self.draw(frame)
@@ -75,4 +161,4 @@ class Window:
   def draw_collage(self, collage : Collage) -> None:
     """Draw a given Collage object in the window"""
     for shape in collage.shapes:
-      pygame.draw.polygon(self.window, shape.color, shape.vertices, shape.width)
\ No newline at end of file
+      pygame.draw.polygon(self.surface, shape.color, shape.vertices, shape.width)
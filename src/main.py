@@ -1,4 +1,77 @@
+import sys
+import logging
+from argparse import ArgumentParser
+from common.startup import StartupTimer
+from common.settings import Settings
 from common.game import ChainStrike
+from common.netplay import LockstepPeer, parse_address
+StartupTimer.mark("import")
+
+def parse_arguments(argv : list):
+  """Parse command line options into Settings"""
+  parser = ArgumentParser(description="Chain Strike")
+  parser.add_argument("--timing", action="store_true", help="print a startup time report")
+  parser.add_argument("--logical-size", metavar="WIDTHxHEIGHT",
+                      help="lay out and draw at a fixed size, scaled to the window once per frame")
+  parser.add_argument("--render-scale", type=float, default=Settings.RENDERSCALE,
+                      help="fraction of the layout size actually rendered, e.g. 0.5")
+  parser.add_argument("--filter", choices=("smooth", "fast"), default="smooth",
+                      help="filter used to scale frames to the window")
+  parser.add_argument("--adaptive-quality", action="store_true",
+                      help="lower quality while frames run over budget")
+  parser.add_argument("--watchdog-threshold", type=float, default=Settings.WATCHDOGTHRESHOLD, metavar="MS",
+                      help="log what the game was doing when handling an event takes longer, e.g. 100, 0 disables")
+  parser.add_argument("--watchdog-log", default=Settings.WATCHDOGLOG, metavar="PATH",
+                      help="rotating log file for slow event reports, slow_frames.log in the user cache by default")
+  parser.add_argument("--trace", metavar="PATH",
+                      help="write a Chrome trace of main loop phases to PATH on quit")
+  network = parser.add_mutually_exclusive_group()
+  network.add_argument("--host", type=int, metavar="PORT",
+                       help="wait for another player to join on a UDP port")
+  network.add_argument("--join", metavar="HOST:PORT",
+                       help="join a game hosted by another player")
+  parser.add_argument("--input-delay", type=int, default=Settings.INPUTDELAY, metavar="TICKS",
+                      help="ticks between pressing a key and it taking effect when hosting")
+  parser.add_argument("--rollback", type=int, default=Settings.ROLLBACK, metavar="TICKS",
+                      help="guess the other player's input up to TICKS ahead instead of waiting, 0 disables")
+  parser.add_argument("--spectate-port", type=int, metavar="PORT",
+                      help="let spectators watch the match on a TCP port")
+  parser.add_argument("--spectate-host", default=Settings.SPECTATEHOST, metavar="HOST",
+                      help="address spectators connect to, 0.0.0.0 to let other machines watch")
+  args = parser.parse_args(argv)
+  if args.logical_size is not None:
+    try:
+      width, height = (int(size) for size in args.logical_size.lower().split("x"))
+    except ValueError:
+      parser.error("--logical-size must be WIDTHxHEIGHT, e.g. 1280x720")
+    if width <= 0 or height <= 0:
+      parser.error("--logical-size must be positive")
+    Settings.LOGICALSIZE = (width, height)
+  if not 0 < args.render_scale <= 1:
+    parser.error("--render-scale must be in (0, 1]")
+  Settings.RENDERSCALE = args.render_scale
+  Settings.SMOOTHSCALE = args.filter == "smooth"
+  Settings.ADAPTIVEQUALITY = args.adaptive_quality
+  Settings.WATCHDOGTHRESHOLD = args.watchdog_threshold
+  Settings.WATCHDOGLOG = args.watchdog_log
+  Settings.TRACEFILE = args.trace
+  if not 1 <= args.input_delay <= LockstepPeer.REDUNDANCY:
+    # Inputs in flight must fit in one packet
+    parser.error("--input-delay must be between 1 and %d" % LockstepPeer.REDUNDANCY)
+  Settings.NETHOST = args.host
+  try:
+    Settings.NETJOIN = parse_address(args.join) if args.join is not None else None
+  except ValueError:
+    parser.error("--join must be HOST:PORT")
+  Settings.INPUTDELAY = args.input_delay
+  if args.rollback < 0:
+    parser.error("--rollback must not be negative")
+  Settings.ROLLBACK = args.rollback
+  Settings.SPECTATEPORT = args.spectate_port
+  Settings.SPECTATEHOST = args.spectate_host
+  return args
 
 if __name__ == "__main__":
-  ChainStrike.go()
\ No newline at end of file
+  args = parse_arguments(sys.argv[1:])
+  logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+  ChainStrike.go(args.timing)
@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+# The game runs from src, where the common package is found
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from common import netplay
+from memory_network import MemoryNetwork
+
+@pytest.fixture
+def network(monkeypatch) -> MemoryNetwork:
+  """A MemoryNetwork standing in for the socket module of common.netplay"""
+  network = MemoryNetwork()
+  monkeypatch.setattr(netplay, "socket", network)
+  return network
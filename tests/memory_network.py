@@ -0,0 +1,129 @@
+import heapq
+import random
+import socket
+from common.netplay import LockstepPeer, LockstepSession, MOVES
+from common.rollback import RollbackSession
+from common.replay import replay_match
+from common.headless import HeadlessChips
+from common.combat import random_folder
+
+# Peers connected through memory instead of UDP. The network stands in for the socket
+# module of common.netplay, delivering each datagram a random number of steps after it
+# was sent, so later packets overtake earlier ones, or dropping it. Delivering to a
+# port only every few steps hands that peer the inputs of several ticks at once.
+
+HOSTPORT = 7000
+JOINPORT = 7001
+
+class MemoryNetwork:
+  """Datagrams between MemorySockets, dropped and reordered at random"""
+  AF_INET = socket.AF_INET
+  SOCK_DGRAM = socket.SOCK_DGRAM
+
+  def __init__(self, loss : float = 0, maxDelay : int = 0, burst : int = 1, burstPort : int = None, seed : int = 0):
+    self.loss = loss # fraction of datagrams dropped
+    self.maxDelay = maxDelay # most steps a datagram is held
+    self.burst = burst # steps between deliveries to burstPort
+    self.burstPort = burstPort # port receiving in bursts, None for every port
+    self.sent = 0
+    self.dropped = 0
+    self._rng = random.Random(seed)
+    self._sockets = {} # bound sockets by address
+    self._inFlight = [] # heap of (step due, send order, address, data, source address)
+    self._step = 0
+
+  def socket(self, family : int, kind : int):
+    return MemorySocket(self)
+
+  def send(self, data : bytes, source : tuple, address : tuple) -> None:
+    self.sent += 1
+    if self._rng.random() < self.loss:
+      self.dropped += 1
+      return
+    heapq.heappush(self._inFlight, (self._step + self._rng.randint(0, self.maxDelay), self.sent, address, data, source))
+
+  def advance(self) -> None:
+    """Deliver the datagrams due at the next step"""
+    self._step += 1
+    held = []
+    while len(self._inFlight) > 0 and self._inFlight[0][0] <= self._step:
+      datagram = heapq.heappop(self._inFlight)
+      due, order, address, data, source = datagram
+      if self._step % self.burst != 0 and self.burstPort in (None, address[1]):
+        held.append(datagram)
+      elif address in self._sockets:
+        self._sockets[address].queue.append((data, source))
+    for datagram in held:
+      heapq.heappush(self._inFlight, datagram)
+
+
+class MemorySocket:
+  """A non-blocking datagram socket on a MemoryNetwork"""
+  def __init__(self, network : MemoryNetwork):
+    self.network = network
+    self.address = None
+    self.queue = [] # datagrams delivered and not yet read, with their source address
+
+  def bind(self, address : tuple) -> None:
+    port = address[1] or 40000 + len(self.network._sockets)
+    self.address = ("127.0.0.1", port)
+    self.network._sockets[self.address] = self
+
+  def setblocking(self, blocking : bool) -> None:
+    pass
+
+  def sendto(self, data : bytes, address : tuple) -> None:
+    self.network.send(data, self.address, address)
+
+  def recvfrom(self, size : int) -> tuple:
+    if len(self.queue) == 0:
+      raise BlockingIOError()
+    return self.queue.pop(0)
+
+  def close(self) -> None:
+    self.network._sockets.pop(self.address, None)
+
+
+def connect(network : MemoryNetwork, delay : int = 3) -> tuple:
+  """Return a host and a joined peer, exchanging hellos until both are connected"""
+  host = LockstepPeer.host(HOSTPORT, delay)
+  join = LockstepPeer.join(("127.0.0.1", HOSTPORT), JOINPORT)
+  while not (host.connected and join.connected):
+    if not join.connected:
+      join._send_hello()
+    network.advance()
+    host.receive()
+    join.receive()
+  return host, join
+
+def play(network : MemoryNetwork, seed : int, rollback : int = 0, maxFrames : int = 20000) -> tuple:
+  """Play a match between connected peers with random inputs until both end it, return their sessions and the most ticks either simulated in a frame"""
+  rng = random.Random(seed)
+  folder = random_folder(rng)
+  sessions = []
+  mostTicks = 0
+  for peer in connect(network):
+    match = replay_match(folder, folder, seed, False)
+    if rollback > 0:
+      sessions.append(RollbackSession(match, peer, HeadlessChips.get_chip, rollback))
+    else:
+      sessions.append(LockstepSession(match, peer, HeadlessChips.get_chip))
+  for frame in range(maxFrames):
+    playing = [session for session in sessions if session._match.winner() is None or session.predicted() > 0]
+    if len(playing) == 0 and all(session._peer.all_acknowledged() for session in sessions):
+      break
+    for session in sessions:
+      if session not in playing:
+        # Keep answering until the remote has every input it needs to finish too
+        session.flush()
+        continue
+      if session.choosing():
+        chipOrder = [HeadlessChips.get_chip(id) for id in rng.sample(folder, rng.randint(1, 5))]
+        for chip in chipOrder:
+          chip.set_speed(rng.choice((5, 10, 30)))
+        session.queue_chips(chipOrder)
+      if rng.random() < .15:
+        session.queue_move(rng.choice(MOVES[1:]))
+      mostTicks = max(mostTicks, session.advance())
+    network.advance()
+  return sessions, mostTicks
@@ -0,0 +1,68 @@
+import json
+import shutil
+import pytest
+from common import balance
+from common.balance import analyze, BalanceCache
+
+TRIALS = 1
+PAIRTRIALS = 1
+CHANGED = "7"
+
+class RecordingPool:
+  """Pool playing tasks in this process and keeping the chips and pairs measured"""
+  chips = []
+  pairs = []
+
+  def __init__(self, workers : int):
+    pass
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exception):
+    return False
+
+  def imap_unordered(self, function, tasks : list):
+    for task in tasks:
+      if function is balance.measure_chip:
+        self.chips.append(task[0])
+      else:
+        self.pairs.extend((task[0], second) for second in task[1])
+      yield function(task)
+
+
+@pytest.fixture(scope="module")
+def measured(tmp_path_factory) -> str:
+  """A cache of every chip and pair measured for the current chips.json"""
+  path = str(tmp_path_factory.mktemp("balance") / balance.CACHE)
+  analyze(path, TRIALS, PAIRTRIALS, 0, 2)
+  return path
+
+def test_measure_only_a_changed_chip(measured, tmp_path, monkeypatch):
+  path = str(tmp_path / balance.CACHE)
+  shutil.copy(measured, path)
+  with open(path) as file:
+    data = json.load(file)
+  data["fileHash"] = "edited"
+  data["hashes"][CHANGED] = "edited"
+  with open(path, "w") as file:
+    json.dump(data, file)
+  monkeypatch.setattr(balance, "Pool", RecordingPool)
+  monkeypatch.setattr(RecordingPool, "chips", [])
+  monkeypatch.setattr(RecordingPool, "pairs", [])
+  cache = analyze(path, TRIALS, PAIRTRIALS, 0, 2)
+  ids = list(data["hashes"])
+  assert RecordingPool.chips == [int(CHANGED)]
+  assert sorted(RecordingPool.pairs) == sorted(set([(int(CHANGED), int(id)) for id in ids] +
+                                                   [(int(id), int(CHANGED)) for id in ids]))
+  assert cache.hashes == BalanceCache(measured, TRIALS, PAIRTRIALS, 0).hashes
+  assert set(cache.pairs) == set(ids)
+  assert all(set(row) == set(ids) for row in cache.pairs.values())
+
+def test_unchanged_chips_read_from_the_cache(measured, monkeypatch):
+  def no_pool(workers : int):
+    raise AssertionError("measured chips already in the cache")
+  monkeypatch.setattr(balance, "Pool", no_pool)
+  cache = analyze(measured, TRIALS, PAIRTRIALS, 0, 2)
+  assert cache.fileHash == balance.file_hash("chips.json")
+  assert len(cache.single) == len(cache.hashes) > 0
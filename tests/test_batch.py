@@ -0,0 +1,63 @@
+import random
+import numpy as np
+import pytest
+from common.batch import BatchMatch, ScalarRandom, scalar_state
+from common.headless import new_match, HeadlessChips
+from common.combat import random_folder
+from common.netplay import chip_instance
+
+MATCHES = 4
+TICKS = 1500
+
+def random_inputs(rng, matches : list, folders : list) -> tuple:
+  """Return random P1 chip orders for the matches off the stage and random movements for all"""
+  orders = {}
+  movements = np.zeros((len(matches), 2), dtype=np.int16)
+  for row, match in enumerate(matches):
+    if not match.on_stage("P1"):
+      ids = rng.sample(folders[row], rng.randint(1, 5))
+      orders[row] = (ids, [rng.choice((5, 10, 30)) for id in ids])
+    if rng.random() < .15:
+      movements[row] = rng.choice(((1, 0), (-1, 0), (0, 1), (0, -1)))
+  return orders, movements
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_batch_follows_matches(seed):
+  inputRng = random.Random(seed)
+  p1Folders = [random_folder(inputRng) for row in range(MATCHES)]
+  p2Folders = [random_folder(inputRng) for row in range(MATCHES)]
+  botRngs = [random.Random(seed * 1000 + row) for row in range(MATCHES)]
+  matches = [new_match(p1Folders[row], p2Folders[row], botRngs[row]) for row in range(MATCHES)]
+  batch = BatchMatch(np.array(p2Folders), ScalarRandom([random.Random(seed * 1000 + row) for row in range(MATCHES)]))
+  games = 0
+  for tick in range(TICKS):
+    orders, movements = random_inputs(inputRng, matches, p1Folders)
+    for row, (ids, frames) in orders.items():
+      matches[row].confirm("P1", [chip_instance(HeadlessChips.get_chip, id, frame) for id, frame in zip(ids, frames)])
+    if len(orders) > 0:
+      rows = sorted(orders)
+      batch.confirm(np.array(rows), np.array([orders[row][0] + [0] * (5 - len(orders[row][0])) for row in rows]),
+                    np.array([orders[row][1] + [0] * (5 - len(orders[row][1])) for row in rows]))
+    for row, match in enumerate(matches):
+      if movements[row].any():
+        match.move("P1", tuple(int(x) for x in movements[row]))
+    batch.move(movements)
+    for match in matches:
+      match.tick()
+    batch.tick()
+    for row, match in enumerate(matches):
+      ended = match.events["GAMEOVER"]
+      assert bool(batch.ended[row]) == ended, (row, tick)
+      if ended:
+        # The batch starts the next match at once with the Bot's random numbers going on,
+        # keeping the events of the tick the last one ended on
+        games += 1
+        events = tuple(match.events.values())[:3] + (False,)
+        matches[row] = new_match(p1Folders[row], p2Folders[row], botRngs[row])
+        expected = scalar_state(matches[row])
+        expected = expected[:21] + (events,) + expected[22:]
+      else:
+        expected = scalar_state(match)
+      assert batch.state(row) == expected, (row, tick)
+  assert games > 0
+  assert batch.games == games
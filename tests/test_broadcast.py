@@ -0,0 +1,45 @@
+import random
+import asyncio
+from common.broadcast import (encode_view, apply_payload, read_views, load_test, DemoMatches, MESSAGEHEADER,
+                              KEYFRAME, DELTA)
+
+def demo_views(ticks : int) -> list:
+  matches = DemoMatches(random.Random(3))
+  return [matches.tick() for tick in range(ticks)]
+
+def decode(message : bytes, view : tuple = None) -> tuple:
+  """Return the kind, tick and view of a message applied to a view"""
+  kind, tick, changed = MESSAGEHEADER.unpack_from(message)
+  return kind, tick, apply_payload(view, changed, message[MESSAGEHEADER.size:])
+
+def test_keyframe_and_delta_round_trip():
+  views = demo_views(300)
+  assert len(set(views)) > 10
+  kind, tick, view = decode(encode_view(0, views[0]))
+  assert (kind, tick, view) == (KEYFRAME, 0, views[0])
+  for tick in range(1, len(views)):
+    message = encode_view(tick, views[tick], views[tick-1])
+    if views[tick] == views[tick-1]:
+      assert len(message) == MESSAGEHEADER.size
+    kind, decodedTick, view = decode(message, view)
+    assert (kind, decodedTick, view) == (DELTA, tick, views[tick])
+
+def test_read_views_skips_deltas_before_a_keyframe():
+  views = demo_views(300)
+  changes = [tick for tick in range(1, len(views)) if views[tick] != views[tick-1]]
+  first, second = changes[0], changes[1]
+
+  async def read() -> list:
+    reader = asyncio.StreamReader()
+    # Joined between two keyframes: a delta arrives first
+    reader.feed_data(encode_view(first, views[first], views[first-1]))
+    reader.feed_data(encode_view(first, views[first]))
+    reader.feed_data(encode_view(second, views[second], views[first]))
+    reader.feed_data(encode_view(second + 1, views[second], views[second]))
+    reader.feed_eof()
+    return [message async for message in read_views(reader)]
+
+  assert asyncio.run(read()) == [(first, views[first]), (second, views[second]), (second + 1, views[second])]
+
+def test_load_test_spectators_end_in_sync():
+  assert asyncio.run(load_test(8, 300, .001, 1))
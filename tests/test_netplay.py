@@ -0,0 +1,45 @@
+import pytest
+from common.netplay import encode_input, decode_inputs, EMPTYINPUT
+from memory_network import play, JOINPORT
+
+INPUTS = [
+  EMPTYINPUT,
+  ((-1, 0), None),
+  ((0, 1), ()),
+  ((0, 0), ((7, 5),)),
+  ((1, 0), ((0, 10), (119, 30), (64, 5), (3, 10), (255, 255))),
+]
+
+def test_inputs_round_trip():
+  data = b"\x00\x01" + b"".join(encode_input(input) for input in INPUTS)
+  assert decode_inputs(data, 2, len(INPUTS)) == INPUTS
+
+def test_inputs_decode_one_at_a_time():
+  offset = 0
+  data = b"".join(encode_input(input) for input in INPUTS)
+  for input in INPUTS:
+    assert decode_inputs(data, offset, 1) == [input]
+    offset += len(encode_input(input))
+
+@pytest.mark.parametrize("loss, maxDelay, burst, seed", [(0, 0, 1, 1), (.2, 0, 1, 1), (0, 4, 1, 1), (.3, 6, 1, 1),
+                                                        (0, 0, 2, 1), (0, 0, 4, 2), (0, 0, 6, 4), (.2, 2, 8, 5)])
+def test_lockstep_peers_agree(network, loss, maxDelay, burst, seed):
+  network.loss = loss
+  network.maxDelay = maxDelay
+  # The joiner gets the host's inputs a few ticks at a time while the host gets the joiner's every frame
+  network.burst = burst
+  network.burstPort = JOINPORT
+  (host, join), mostTicks = play(network, seed)
+  for session in (host, join):
+    assert session._match.winner() is not None
+    assert session.stats().desyncTick is None
+  assert host.tick == join.tick
+  assert host._match.state_hash() == join._match.state_hash()
+  assert host._match.winner() == join._match.winner()
+  if loss > 0:
+    assert network.dropped > 0 and host.stats().lost + join.stats().lost > 0
+  if maxDelay > 0:
+    assert host.stats().late + join.stats().late > 0
+  if burst > 1:
+    # Inputs of several ticks arrived together, so a peer may have caught up past the end
+    assert mostTicks > 1
@@ -0,0 +1,94 @@
+import random
+import pytest
+from common.replay import ReplayWriter, ReplayReader, encode_snapshot, decode_snapshot, record, replay_match, chip_getter
+from common.netplay import play_tick, EMPTYINPUT
+from common.combat import random_folder
+
+SEED = 4
+
+def folders() -> tuple:
+  rng = random.Random(SEED)
+  return random_folder(rng), random_folder(rng)
+
+def played_match(ticks : int) -> tuple:
+  """Return a bot match after random P1 input for some ticks, and the snapshots taken before each tick"""
+  rng = random.Random(SEED)
+  folder, p2Folder = folders()
+  match = replay_match(folder, p2Folder, SEED, True)
+  snapshots = []
+  for tick in range(ticks):
+    chipOrder = None
+    if not match.on_stage("P1"):
+      chipOrder = tuple((id, rng.choice((5, 10, 30))) for id in rng.sample(folder, rng.randint(1, 5)))
+    snapshots.append(match.snapshot())
+    play_tick(match, (((0, 0), chipOrder), EMPTYINPUT), chip_getter())
+  return match, snapshots
+
+def test_snapshot_round_trip():
+  match, snapshots = played_match(600)
+  fresh, unused = played_match(0)
+  for tick in range(0, len(snapshots), 7):
+    encoded = encode_snapshot(snapshots[tick])
+    decoded = decode_snapshot(encoded, chip_getter())
+    assert encode_snapshot(decoded) == encoded, tick
+    fresh.restore(decoded)
+    match.restore(snapshots[tick])
+    assert fresh.state_hash() == match.state_hash(), tick
+    assert encode_snapshot(fresh.snapshot()) == encoded, tick
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_seek_matches_playing_from_the_start(tmp_path, compress):
+  path = str(tmp_path / "match.replay")
+  record(path, SEED, 1000, 50, compress)
+  reader = ReplayReader(path)
+  assert reader.complete and reader.ticks > 100
+  sequential = reader.new_match()
+  played = 0
+  for tick in sorted(set([0, 1, 49, 50, 51, 99, 100, reader.ticks // 2, reader.ticks - 1, reader.ticks])):
+    played = reader.play(sequential, played, tick)
+    assert played == tick
+    sought = reader.seek(tick)
+    assert sought.state_hash() == sequential.state_hash(), tick
+    assert encode_snapshot(sought.snapshot()) == encode_snapshot(sequential.snapshot()), tick
+  reader.close()
+
+def test_seek_while_recording(tmp_path):
+  path = str(tmp_path / "live.replay")
+  match, snapshots = played_match(0)
+  writer = ReplayWriter(path, SEED, *folders(), keyframeInterval=30)
+  inputs = [(((0, 0), None), EMPTYINPUT)] * 75
+  for input in inputs:
+    writer.append(input, match.snapshot())
+    play_tick(match, input, chip_getter())
+  writer.flush()
+  reader = ReplayReader(path)
+  assert not reader.complete and reader.ticks == 75
+  assert reader.seek(75).state_hash() == match.state_hash()
+  writer.close()
+  reader.close()
+
+def test_follow_recording_without_flushing(tmp_path):
+  path = str(tmp_path / "followed.replay")
+  match, snapshots = played_match(0)
+  writer = ReplayWriter(path, SEED, *folders(), keyframeInterval=2 * ReplayWriter.CHUNKTICKS)
+  reader = None
+  for tick in range(1, 351):
+    input = (((0, 0), None), EMPTYINPUT)
+    writer.append(input, match.snapshot())
+    play_tick(match, input, chip_getter())
+    if tick % ReplayWriter.CHUNKTICKS == 0:
+      # Every block written is on disk, without calling flush
+      if reader is None:
+        reader = ReplayReader(path)
+      assert reader.refresh() == tick
+      assert reader.seek(tick).state_hash() == match.state_hash()
+  assert reader.refresh() == 300
+  writer.close()
+  reader.close()
+
+@pytest.mark.parametrize("seed, interval", [(-1, 600), (1 << 64, 600), (0, 0), (0, 70000)])
+def test_header_values_out_of_range(tmp_path, seed, interval):
+  path = tmp_path / "bad.replay"
+  with pytest.raises(ValueError):
+    ReplayWriter(str(path), seed, *folders(), keyframeInterval=interval)
+  assert not path.exists()
@@ -0,0 +1,138 @@
+import random
+import pytest
+from common.netplay import NetStats, EMPTYINPUT, MOVES
+from common.rollback import RollbackSession
+from common.headless import new_match, HeadlessChips
+from common.combat import random_folder
+from memory_network import play
+
+RIGHT = ((1, 0), None) # remote input ending the match below
+DOWN = ((0, 1), None)
+
+class EndingMatch:
+  """Stands in for a Match, counting ticks and ending once P2 moves right"""
+  def __init__(self):
+    self.ticks = 0
+    self.events = {"GAMEOVER" : False}
+
+  def snapshot(self) -> tuple:
+    return (self.ticks, self.events["GAMEOVER"])
+
+  def restore(self, snapshot : tuple) -> None:
+    self.ticks, self.events["GAMEOVER"] = snapshot
+
+  def state_hash(self) -> int:
+    return hash(self.snapshot())
+
+  def confirm(self, key : str, chips : list) -> None:
+    pass
+
+  def move(self, key : str, movement : tuple) -> None:
+    if key == "P2" and movement == (1, 0):
+      self.events["GAMEOVER"] = True
+
+  def tick(self) -> None:
+    self.ticks += 1
+
+
+class HeldPeer:
+  """A connected P1 peer whose remote inputs are handed over by the test"""
+  localKey = "P1"
+
+  def __init__(self, delay : int):
+    self.delay = delay
+    self.stats = NetStats()
+    self.closed = False
+    self.remote = {tick : EMPTYINPUT for tick in range(delay)}
+    self.hashes = {}
+    self._nextLocal = delay
+
+  def receive(self) -> None:
+    pass
+
+  def send(self) -> None:
+    pass
+
+  def next_local(self) -> int:
+    return self._nextLocal
+
+  def add_local(self, input : tuple) -> int:
+    self._nextLocal += 1
+    return self._nextLocal - 1
+
+  def take_remote(self, tick : int) -> tuple:
+    return self.remote.pop(tick, None)
+
+  def add_hash(self, tick : int, stateHash : int) -> None:
+    self.hashes[tick] = stateHash
+
+
+def test_correction_ending_the_match_forgets_later_ticks():
+  match = EndingMatch()
+  peer = HeldPeer(1)
+  session = RollbackSession(match, peer, None, maxRollback=8)
+  for frame in range(6):
+    session.advance()
+  assert session.tick == 6 and session.predicted() == 5
+
+  # Tick 2 was guessed as standing still, but P2 moved right and ended the match
+  peer.remote.update({1 : EMPTYINPUT, 2 : RIGHT, 3 : EMPTYINPUT})
+  session.advance()
+  assert match.events["GAMEOVER"]
+  assert session.tick == 3
+  assert peer.stats.rollbacks == 1 and peer.stats.resimulated == 4
+  for kept in (session._snapshots, session._used, session._hashes):
+    assert all(tick < session.tick for tick in kept)
+
+  # Input for a tick only played before the correction is not compared with its old guess
+  peer.remote[4] = DOWN
+  session.advance()
+  assert match.events["GAMEOVER"]
+  assert session.tick == 3 and match.ticks == 3
+  assert peer.stats.rollbacks == 1 and peer.stats.resimulated == 4
+
+
+@pytest.mark.parametrize("loss, maxDelay", [(0, 2), (.2, 4)])
+def test_rollback_peers_agree(network, loss, maxDelay):
+  network.loss = loss
+  network.maxDelay = maxDelay
+  (host, join), mostTicks = play(network, seed=2, rollback=8)
+  for session in (host, join):
+    assert session._match.winner() is not None and session.predicted() == 0
+    assert session.stats().desyncTick is None
+  assert host.tick == join.tick
+  assert host._match.state_hash() == join._match.state_hash()
+  assert host.stats().rollbacks + join.stats().rollbacks > 0
+
+def test_restored_match_replays_the_same_ticks():
+  rng = random.Random(3)
+  folder = random_folder(rng)
+  inputs = [(rng.choice(MOVES), rng.sample(folder, rng.randint(1, 5))) for tick in range(1500)]
+  def play_tick(match, tick):
+    movement, chips = inputs[tick]
+    if not match.on_stage("P1"):
+      match.confirm("P1", [HeadlessChips.get_chip(id) for id in chips])
+    match.move("P1", movement)
+    match.tick()
+  reference = new_match(folder, rng=random.Random(3))
+  hashes = []
+  for tick in range(len(inputs)):
+    play_tick(reference, tick)
+    hashes.append(reference.state_hash())
+
+  match = new_match(folder, rng=random.Random(3))
+  snapshots = []
+  tick = rollbacks = 0
+  while tick < len(inputs):
+    snapshots.append(match.snapshot())
+    play_tick(match, tick)
+    assert match.state_hash() == hashes[tick], tick
+    tick += 1
+    if tick > 20 and rng.random() < .05:
+      # Go back up to 16 ticks and play them again
+      back = rng.randint(1, 16)
+      match.restore(snapshots[tick - back])
+      del snapshots[tick - back:]
+      tick -= back
+      rollbacks += 1
+  assert rollbacks > 0
@@ -0,0 +1,37 @@
+import pytest
+from common.tournament import run, ResultsFile, load_entrants
+
+ENTRANTS = [{"name" : "greedy"}, {"name" : "lookahead", "planner" : "lookahead"}]
+MATCHES = 4
+MAXTICKS = 3000
+
+def tallied(tally) -> tuple:
+  """Return everything a tally counts except the seconds matches took"""
+  return tally.pairings, tally.matches, tally.rounds, tally.roundTicks, tally.chips
+
+def test_resume_after_a_half_written_result(tmp_path):
+  full = tmp_path / "full.jsonl"
+  expected = run(str(full), ENTRANTS, MATCHES, 0, 2, MAXTICKS)
+  assert expected.matches == 2 * MATCHES
+  lines = full.read_text().splitlines(keepends=True)
+  # Stopped while writing the fourth result
+  kept = "".join(lines[:4])
+  stopped = tmp_path / "stopped.jsonl"
+  stopped.write_text(kept + lines[4][:len(lines[4]) // 2])
+  resumed = run(str(stopped), ENTRANTS, MATCHES, 0, 2, MAXTICKS)
+  assert tallied(resumed) == tallied(expected)
+  text = stopped.read_text()
+  assert text.startswith(kept)
+  results = ResultsFile(str(stopped), load_entrants(ENTRANTS), MAXTICKS)
+  results.close()
+  # The three results already written were not played again
+  assert len(results.results) == 2 * MATCHES
+  assert len(results.done()) == 2 * MATCHES
+
+def test_refuse_results_of_another_tournament(tmp_path):
+  path = str(tmp_path / "results.jsonl")
+  run(path, ENTRANTS, 1, 0, 1, MAXTICKS)
+  with pytest.raises(ValueError):
+    run(path, ENTRANTS, 1, 0, 1, MAXTICKS + 1)
+  with pytest.raises(ValueError):
+    run(path, ENTRANTS[:1], 1, 0, 1, MAXTICKS)